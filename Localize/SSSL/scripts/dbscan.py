@@ -0,0 +1,89 @@
+import numpy as np
+
+# Array version of vaODV.RegionQuery / ExpandCluster.
+#
+# Only the visited (y, x) points are queried. Their eps-neighbourhood sizes
+# come from summed-area tables of the per-pixel visit counts instead of
+# Point objects, so a frame costs O(H*W + visited points) numpy work.
+# counts can be a single (H, W) frame or a (frames, H, W) batch.
+#
+# RegionQuery walks i, j in range(eps) and adds the four (+-i, +-j)
+# neighbours, so points on the row and the column of the query point are
+# counted twice and the point itself once. The weighted count below keeps that.
+
+
+def row_eps(height, scale=6):
+    # latitude dependent eps, same float ops as vaODV.clustering
+    half = int(round(height / 2))
+    xnew = np.arange(height) - half
+    with np.errstate(divide='ignore', over='ignore'):
+        return np.rint(scale * (1 / (np.cos(xnew / half * np.pi / 2))))
+
+
+def register_points(u, v, shape, frame=None, n_frames=None):
+    ''' per-pixel visit counts of (2dmu, 2dmv) samples, (H, W) or (n_frames, H, W)
+        when the frame index of every sample is given '''
+    h, w = shape
+    x = np.round(np.asarray(u, dtype=np.float64) * w)
+    y = np.round(np.asarray(v, dtype=np.float64) * h)
+
+    valid = np.isfinite(x) & np.isfinite(y)
+    valid[valid] = (x[valid] < w) & (y[valid] < h) & (x[valid] >= 0) & (y[valid] >= 0)
+    flat = y[valid].astype(np.int64) * w + x[valid].astype(np.int64)
+
+    if frame is None:
+        return np.bincount(flat, minlength=h * w).astype(np.int32).reshape(h, w)
+
+    flat += np.asarray(frame)[valid].astype(np.int64) * (h * w)
+    return np.bincount(flat, minlength=n_frames * h * w).astype(np.int32).reshape(n_frames, h, w)
+
+
+def core_points(counts, eps_scale=6, min_pts=12):
+    ''' (frames, ys, xs, radius) of the visited points whose neighbourhood
+        has >= min_pts samples, counts is (frames, H, W) '''
+    n, h, w = counts.shape
+    eps = row_eps(h, eps_scale)
+
+    fs, ys, xs = np.nonzero(counts)
+    e = eps[ys]
+    inside = (ys > e) & (ys < h - e) & (xs > e) & (xs < w - e)
+    fs, ys, xs = fs[inside], ys[inside], xs[inside]
+    # range(eps) reaches eps - 1 pixels away
+    r = e[inside].astype(np.int64) - 1
+
+    sat = np.zeros((n, h + 1, w + 1), dtype=np.int32)
+    sat[:, 1:, 1:] = counts.cumsum(1, dtype=np.int32).cumsum(2, dtype=np.int32)
+    row_sum = np.zeros((n, h, w + 1), dtype=np.int32)
+    row_sum[:, :, 1:] = counts.cumsum(2, dtype=np.int32)
+    col_sum = np.zeros((n, h + 1, w), dtype=np.int32)
+    col_sum[:, 1:, :] = counts.cumsum(1, dtype=np.int32)
+
+    y0, y1, x0, x1 = ys - r, ys + r + 1, xs - r, xs + r + 1
+    center = counts[fs, ys, xs]
+    box = sat[fs, y1, x1] - sat[fs, y0, x1] - sat[fs, y1, x0] + sat[fs, y0, x0]
+    row = row_sum[fs, ys, x1] - row_sum[fs, ys, x0] - center
+    col = col_sum[fs, y1, xs] - col_sum[fs, y0, xs] - center
+
+    core = (box + row + col) >= min_pts
+    return fs[core], ys[core], xs[core], r[core]
+
+
+def fixation_mask(counts, eps_scale=6, min_pts=12):
+    ''' Fixations_person: every core point and every visited point in its eps box '''
+    single = counts.ndim == 2
+    if single:
+        counts = counts[None]
+
+    n, h, w = counts.shape
+    fs, ys, xs, r = core_points(counts, eps_scale, min_pts)
+
+    # union of the core boxes through a 2D difference array
+    diff = np.zeros((n, h + 1, w + 1), dtype=np.int32)
+    np.add.at(diff, (fs, ys - r, xs - r), 1)
+    np.add.at(diff, (fs, ys - r, xs + r + 1), -1)
+    np.add.at(diff, (fs, ys + r + 1, xs - r), -1)
+    np.add.at(diff, (fs, ys + r + 1, xs + r + 1), 1)
+    covered = diff.cumsum(1, dtype=np.int32).cumsum(2, dtype=np.int32)[:, :h, :w] > 0
+
+    mask = (covered & (counts > 0)).astype(np.float64)
+    return mask[0] if single else mask
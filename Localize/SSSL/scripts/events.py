@@ -0,0 +1,62 @@
+import os
+import csv
+import numpy as np
+
+# Frame intervals of the HTS event classification (Final_<video>.csv).
+# Rows are "start_sec,end_sec,class"; classes 0 and 3 are not events.
+# An interval covers frames int(start*fps) .. int(end*fps), both inclusive,
+# the same frames clsf.run keeps.
+
+IGNORED_CLASSES = ('0', '3')
+HTS_RESULT = '/wiset/hts/Result'
+
+
+def read_hts_csv(hts_pth, fps=30, ignored=IGNORED_CLASSES):
+    with open(hts_pth, newline='') as csvfile:
+        hts_csv = csv.reader(csvfile, delimiter=' ', quotechar='|')
+        classify_res = [line[0].split(',')[:2] for line in hts_csv if line[0].split(',')[2] not in ignored]
+
+    classify_res = list(map(lambda x: list(map(lambda x: int(float(x)*fps), x)), classify_res))
+    classify_res.sort()
+
+    return classify_res
+
+
+class EventIndex:
+    def __init__(self, intervals):
+        # merge overlapping / touching intervals into sorted disjoint [start, end]
+        starts, ends = [], []
+        for start, end in sorted(intervals):
+            if starts and start <= ends[-1] + 1:
+                ends[-1] = max(ends[-1], end)
+            else:
+                starts.append(start)
+                ends.append(end)
+        self.starts = np.asarray(starts, dtype=np.int64)
+        self.ends = np.asarray(ends, dtype=np.int64)
+
+    @classmethod
+    def from_hts_csv(cls, hts_pth, fps=30):
+        return cls(read_hts_csv(hts_pth, fps))
+
+    def __len__(self):
+        return len(self.starts)
+
+    def __contains__(self, f):
+        i = np.searchsorted(self.starts, f, side='right') - 1
+        return bool(i >= 0 and f <= self.ends[i])
+
+    def mask(self, n_frames):
+        ''' boolean (n_frames,) array, True for frames inside an event '''
+        diff = np.zeros(n_frames + 1, dtype=np.int64)
+        np.add.at(diff, np.clip(self.starts, 0, n_frames), 1)
+        np.add.at(diff, np.clip(self.ends + 1, 0, n_frames), -1)
+        return np.cumsum(diff[:-1]) > 0
+
+
+def load_events(video_name, cfg='balanced_mobile_Audio'):
+    ''' EventIndex of the HTS result of video_name, None when there is none '''
+    hts_pth = os.path.join(HTS_RESULT, cfg, 'Final_' + video_name + '.csv')
+    if not os.path.exists(hts_pth):
+        return None
+    return EventIndex.from_hts_csv(hts_pth)
@@ -5,12 +5,21 @@ import pandas as pd
 import cv2
 from vaODV import vaODV
 from saliency_estimate import generate_saliencymap
+from events import load_events
+from profiling import profile, set_video
 
 # SOUND_TYPE = ['none', 'mono', 'ambix']
 
 def parse_args():
     parser = argparse.ArgumentParser()
     parser.add_argument('--video_name', default='in_test2', type=str, help='video path')
+    parser.add_argument('--per_frame', action='store_true', help='cluster frame by frame instead of in batches')
+    parser.add_argument('--chunk', default=16, type=int, help='frames clustered per batch')
+    parser.add_argument('--blur_scale', default=1, type=int, help='blur fixation maps at 1/blur_scale resolution')
+    parser.add_argument('--frame_store', action='store_true', help='only write the fixations frame store, no salmap_f_<n>.png')
+    parser.add_argument('--cfg', default='balanced_mobile_Audio', type=str, help='hts cfg path')
+    parser.add_argument('--no_event_gate', action='store_true', help='generate fixations for every frame, not only HTS event frames')
+    parser.add_argument('--blur_method', default='auto', choices=['auto', 'cv2', 'fft', 'iir'], help='gaussian blur implementation')
     # parser.add_argument("--input", "-i", type=str, required=True, help="Input dataset_public folder location")            
     # parser.add_argument("--resolution", "-r", type=str, required=True, help="Resolution size of each ODV, Height x Width")
     return parser.parse_args()
@@ -25,7 +34,14 @@ def run(args):
     # for odv_count, odv in enumerate(va_odv.odv_list):
     odv_name = args.video_name
         # va_odv.display_status(odv_count, odv_name)
-    fixation_maps = va_odv.generate_fixations(odv_name)
+    events = None if args.no_event_gate else load_events(args.video_name, args.cfg)
+
+    set_video(args.video_name)
+    with profile('fixmap2salmap'):
+        if args.per_frame:
+            fixation_maps = va_odv.generate_fixations(odv_name, events=events)
+        else:
+            fixation_maps = va_odv.generate_fixations_batch(odv_name, chunk=args.chunk, write_png=not args.frame_store, blur_scale=args.blur_scale, blur_method=args.blur_method, events=events)
             
 
 if __name__ == "__main__":
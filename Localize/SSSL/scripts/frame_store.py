@@ -0,0 +1,103 @@
+import os
+import json
+import numpy as np
+
+# One intermediate map stream of a video (SSSL fixations, ViNet maps, fusion)
+# as a single preallocated (frames, H, W) uint8 memmap instead of one image
+# per frame.
+#   <name>.npy   .npy memmap, frame f is maps[f]
+#   <name>.json  {"fps", "shape", "dtype", "provenance", "complete"}
+# The header is rewritten with complete=True when the writer closes, so a
+# store left behind by an interrupted run is not picked up by consumers.
+
+
+class FrameStore:
+    def __init__(self, maps, header, json_path):
+        self.maps = maps
+        self.header = header
+        self.json_path = json_path
+
+    @staticmethod
+    def paths(path, name):
+        return os.path.join(path, name + '.npy'), os.path.join(path, name + '.json')
+
+    @classmethod
+    def exists(cls, path, name):
+        npy_path, json_path = cls.paths(path, name)
+        if not (os.path.exists(npy_path) and os.path.exists(json_path)):
+            return False
+        with open(json_path) as f:
+            return json.load(f).get('complete', False)
+
+    @classmethod
+    def remove(cls, path, name):
+        ''' drop a store that image outputs are about to replace '''
+        for p in cls.paths(path, name):
+            if os.path.exists(p):
+                os.remove(p)
+
+    @classmethod
+    def create(cls, path, name, n_frames, shape, fps=30, dtype=np.uint8, **provenance):
+        ''' preallocate n_frames zero maps of shape (H, W), provenance goes to the header '''
+        os.makedirs(path, exist_ok=True)
+        npy_path, json_path = cls.paths(path, name)
+        shape = (int(n_frames),) + tuple(int(s) for s in shape)
+        maps = np.lib.format.open_memmap(npy_path, mode='w+', dtype=dtype, shape=shape)
+
+        header = {'fps': fps, 'shape': list(shape), 'dtype': np.dtype(dtype).name,
+                  'provenance': provenance, 'complete': False}
+        store = cls(maps, header, json_path)
+        store.write_header()
+        return store
+
+    @classmethod
+    def open(cls, path, name, mode='r'):
+        ''' mode 'r' is a read-only view, 'r+' updates the maps in place '''
+        npy_path, json_path = cls.paths(path, name)
+        with open(json_path) as f:
+            header = json.load(f)
+        return cls(np.load(npy_path, mmap_mode=mode), header, json_path)
+
+    def write_header(self):
+        with open(self.json_path, 'w') as f:
+            json.dump(self.header, f, indent=1)
+
+    def __len__(self):
+        return self.maps.shape[0]
+
+    @property
+    def shape(self):
+        return self.maps.shape[1:]
+
+    @property
+    def fps(self):
+        return self.header['fps']
+
+    @property
+    def provenance(self):
+        return self.header['provenance']
+
+    def __getitem__(self, f):
+        return self.maps[f]
+
+    def __setitem__(self, f, maps):
+        self.maps[f] = maps
+
+    def view(self):
+        ''' read-only (frames, H, W) array over the memmap '''
+        maps = self.maps.view(np.ndarray)
+        maps.flags.writeable = False
+        return maps
+
+    def close(self):
+        if self.maps.flags.writeable:
+            self.maps.flush()
+            self.header['complete'] = True
+            self.write_header()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, *exc):
+        if exc_type is None:
+            self.close()
@@ -3,27 +3,51 @@ import os
 import sys
 import argparse
 from utils import *
+import mcsr
+from pred_store import PredStore
+from profiling import profile, set_video
 
 def parse_args():
     parser = argparse.ArgumentParser()
     parser.add_argument('--video_name', default='in_test2', type=str, help='video path')
+    parser.add_argument('--mcsr', default='numpy', choices=['numpy', 'octave'], help='numpy: compute saliency in-process, octave: read _saliency.mat from mcsr/Main.m')
+    parser.add_argument('--csv', action='store_true', help='also write the legacy pred.csv')
     return parser.parse_args()
 
-def work(args):
+def predict(video_name, mode='numpy', audio_in_seconds=None):
+    # (samples, 2) uv direction of the audio saliency, nothing is written
+    output_path = os.path.join('/wiset/Output/SSSL', video_name)
 
-    output_path = os.path.join('/wiset/Output/SSSL', args.video_name)
-    fps = 30
+    if audio_in_seconds is None and mode == 'octave':
+        saliency_mat_path = os.path.join(output_path, '{}_saliency.mat'.format(video_name))
+        #print("FPS:", fps, "Path:", saliency_mat_path)
 
-    saliency_mat_path = os.path.join(output_path, '{}_saliency.mat'.format(args.video_name))
-    #print("FPS:", fps, "Path:", saliency_mat_path)
-
-    ch1_seconds, ch2_seconds, ch3_seconds = get_saliency_ratios(saliency_mat_path)    
+        ch1_seconds, ch2_seconds, ch3_seconds = get_saliency_ratios(saliency_mat_path)
+    else:
+        if audio_in_seconds is None:
+            with profile('mcsr'):
+                audio_in_seconds = mcsr.audio_in_seconds(mcsr.get_wav_path(video_name))
+        ch1_seconds, ch2_seconds, ch3_seconds = saliency_ratios(audio_in_seconds)
     directional_saliencies = np.asarray([ch1_seconds, ch2_seconds, ch3_seconds]).T
 
-    saliencies_as_unit_vector = np.apply_along_axis(to_unit_vector, 1, directional_saliencies)
+    with profile('uv'):
+        saliencies_as_unit_vector = np.apply_along_axis(to_unit_vector, 1, directional_saliencies)
+        return np.apply_along_axis(xyz2uv, 1, saliencies_as_unit_vector)
+
+def work(args, audio_in_seconds=None):
+
+    output_path = os.path.join('/wiset/Output/SSSL', args.video_name)
+    fps = 30
 
-    saliencies_as_UV_form = np.apply_along_axis(xyz2uv, 1, saliencies_as_unit_vector)
-    uv_to_csv(saliencies_as_UV_form, os.path.join(output_path), fps)
+    set_video(args.video_name)
+    with profile('main') as step:
+        saliencies_as_UV_form = predict(args.video_name, getattr(args, 'mcsr', 'numpy'), audio_in_seconds)
+        with profile('write'):
+            pred = PredStore.from_uv(saliencies_as_UV_form, fps)
+            pred.save(output_path)
+            if getattr(args, 'csv', False):
+                uv_to_csv(saliencies_as_UV_form, os.path.join(output_path), fps)
+        step.add_frames(pred.n_frames)
 
 if __name__ == '__main__':
     args = parse_args()
@@ -0,0 +1,134 @@
+import os
+import numpy as np
+import scipy.fft
+import scipy.io.wavfile
+
+# NumPy port of mcsr/Main.m + spectrum1DwithMelCepstrumTrial.m.
+# Every second of the B-format wav is processed as one row of a batch, so the
+# per-second Octave loop, the interpreter startup and the _saliency.mat
+# round-trip all go away.
+
+SQRT2 = np.sqrt(2)
+
+
+def to_float(sdata):
+    # same [-1, 1] scaling as Octave's audioread
+    if sdata.dtype == np.uint8:
+        return (sdata.astype(np.float32) - 128) / 128
+    elif np.issubdtype(sdata.dtype, np.integer):
+        return sdata.astype(np.float32) / (np.iinfo(sdata.dtype).max + 1)
+    return sdata.astype(np.float32)
+
+
+def read_bformat(wav_path, mmap=False):
+    ''' (fs, samples), with mmap the raw samples are memory-mapped and not scaled '''
+    if mmap:
+        try:
+            return scipy.io.wavfile.read(wav_path, mmap=True)
+        except ValueError:
+            # formats wavfile cannot map (e.g. 24 bit) are read as a whole
+            pass
+    fs, sdata = scipy.io.wavfile.read(wav_path)
+    return fs, sdata if mmap else to_float(sdata)
+
+
+def octave_round(x):
+    # Octave rounds halves away from zero, numpy rounds them to even
+    return np.sign(x) * np.floor(np.abs(x) + 0.5)
+
+
+class SpectralResidual:
+    ''' Mel-cepstrum spectral residual of 1 second clips (ROW = Fs samples),
+        precomputed once per sample rate and applied to (n, Fs) batches '''
+
+    def __init__(self, fs):
+        self.fs = fs
+        self.nfft = 2 * fs
+
+        max_grid_id = int(np.floor(np.log2(fs / 2))) + 1
+        fg = 2.0 ** np.arange(0, max_grid_id + 1)
+        fg_desc = np.sort(fg)[::-1] / fg.sum()
+        wg = np.sqrt(fg_desc / fg_desc.max())
+
+        rc = (fs + 1) / 2
+        distance_u = octave_round(np.arange(1, self.nfft + 1) - rc)
+
+        # grid regions are contiguous runs of distanceU, so each one is a slice
+        self.grids = []
+        for grid in np.concatenate((-fg[::-1], fg)):
+            if grid == -1:
+                area = (distance_u >= grid) & (distance_u < 0)
+            elif grid == 1:
+                area = (distance_u <= grid) & (distance_u > 0)
+            elif grid < -1:
+                area = (distance_u >= grid) & (distance_u < grid / 2)
+            else:
+                area = (distance_u <= grid) & (distance_u > grid / 2)
+
+            idx = np.flatnonzero(area)
+            if idx.size:
+                weight = wg[int(np.log2(abs(grid)))]
+                self.grids.append((idx[0], idx[-1] + 1, np.float32(weight)))
+
+    def __call__(self, clips):
+        fs = scipy.fft.fftshift(scipy.fft.fft(clips.astype(np.float32), self.nfft, axis=1), axes=1)
+        fl_a = np.abs(fs)
+        fl_p = np.angle(fs)
+        del fs
+
+        fl = fl_a.copy()
+        for start, stop, weight in self.grids:
+            fl[:, start:stop] = weight * fl_a[:, start:stop].mean(axis=1, keepdims=True)
+
+        fl_r = np.log(np.abs(fl_a - fl) + 1)
+        del fl, fl_a
+
+        spec = np.exp(fl_r + 1j * fl_p).astype(np.complex64)
+        return np.abs(scipy.fft.ifft(spec, clips.shape[1], axis=1)) ** 2
+
+
+def moving_average(x, window):
+    # filter(ones(1, window)/window, 1, x) along each row, zero initial state
+    taps = int(window)
+    c = np.cumsum(x, axis=1, dtype=np.float64)
+    out = c.copy()
+    out[:, taps:] -= c[:, :-taps]
+    return out / window
+
+
+def audio_in_seconds(wav_path, chunk=16, seconds=None):
+    ''' returns the (seconds, Fs, 6) [hp2, hn2, hp3, hn3, hp4, hn4] array that
+        Main.m saves as audio_in_seconds, or only its rows [start, stop) for
+        seconds=(start, stop), stop None is the end. Rows are independent, so the
+        rows of consecutive ranges concatenate to the full array. '''
+    fs, raw = read_bformat(wav_path, mmap=True)
+    duration = raw.shape[0] / fs
+    n_seconds = int(np.floor(duration))
+
+    # Main.m preallocates int16(Duration) rows, a trailing partial second stays zero
+    n_rows = int(octave_round(duration))
+    start, stop = seconds if seconds is not None else (0, None)
+    start, stop = max(start, 0), n_rows if stop is None else min(stop, n_rows)
+    out = np.zeros((max(stop - start, 0), fs, 6))
+    last = min(stop, n_seconds)
+    if last <= start:
+        return out
+
+    clips = to_float(raw[start * fs:last * fs, :4]).reshape(last - start, fs, 4)
+    residual = SpectralResidual(fs)
+
+    for c_start in range(0, last - start, chunk):
+        c_stop = min(c_start + chunk, last - start)
+        c = clips[c_start:c_stop]
+        w = SQRT2 * c[:, :, 0]
+        for ch in range(1, 4):
+            p = (w + c[:, :, ch]) / 2
+            n = (w - c[:, :, ch]) / 2
+            out[c_start:c_stop, :, 2 * (ch - 1)] = moving_average(residual(p), fs / 2)
+            out[c_start:c_stop, :, 2 * (ch - 1) + 1] = moving_average(residual(n), fs / 2)
+
+    return out
+
+
+def get_wav_path(video_name):
+    return os.path.join('/wiset/Input', video_name, video_name + '.wav')
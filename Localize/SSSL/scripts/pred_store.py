@@ -0,0 +1,117 @@
+import os
+import numpy as np
+import pandas as pd
+
+# Binary replacement for pred.csv.
+#   <name>.npy         (samples, 3) float32 rows of (time, 2dmu, 2dmv)
+#   <name>_frames.npy  (frames + 1,) int64 offsets, frame f is rows offsets[f]:offsets[f+1]
+# Both files are plain .npy so they can be memory-mapped and a frame is an O(1) slice.
+# Frame membership is taken from the offsets (exact integer arithmetic), time
+# is only kept for compatibility with the csv columns.
+
+COLUMNS = ['time', '2dmu', '2dmv']
+SAMPLE_RATE = 48000
+
+
+class PredStore:
+    def __init__(self, data, offsets):
+        self.data = data
+        self.offsets = offsets
+
+    @staticmethod
+    def frame_offsets(n_samples, fps, sample_rate=SAMPLE_RATE):
+        divisor = sample_rate / fps
+        n_frames = int(np.ceil(n_samples / divisor))
+        return np.minimum(np.ceil(np.arange(n_frames + 1) * divisor), n_samples).astype(np.int64)
+
+    @classmethod
+    def from_uv(cls, saliencies_as_UV_form, fps, sample_rate=SAMPLE_RATE):
+        uv = np.asarray(saliencies_as_UV_form)
+        store = cls(np.empty((uv.shape[0], 3), dtype=np.float32), cls.frame_offsets(uv.shape[0], fps, sample_rate))
+        store.write_uv(0, uv, fps, sample_rate)
+        return store
+
+    @classmethod
+    def create(cls, path, n_samples, fps, name='pred', sample_rate=SAMPLE_RATE):
+        ''' preallocated store of n_samples rows, memory-mapped so that writers can fill it with write_uv '''
+        if not os.path.exists(path):
+            os.makedirs(path)
+        data_path, offsets_path = cls.paths(path, name)
+        data = np.lib.format.open_memmap(data_path, mode='w+', dtype=np.float32, shape=(int(n_samples), 3))
+        offsets = cls.frame_offsets(n_samples, fps, sample_rate)
+        np.save(offsets_path, offsets)
+        return cls(data, offsets)
+
+    def write_uv(self, start, uv, fps, sample_rate=SAMPLE_RATE):
+        ''' rows [start, start + len(uv)) from uv samples, as from_uv of the whole array would '''
+        uv = np.asarray(uv)
+        rows = self.data[start:start + uv.shape[0]]
+        rows[:, 0] = np.arange(start, start + uv.shape[0]) / (sample_rate / fps)
+        rows[:, 1:] = uv
+
+    @classmethod
+    def from_dataframe(cls, df):
+        df = df.sort_values('time', kind='stable')
+        data = df[COLUMNS].to_numpy(dtype=np.float32)
+        time = df['time'].to_numpy()
+
+        n_frames = int(np.floor(time[-1])) + 1 if len(time) else 0
+        offsets = np.searchsorted(time, np.arange(n_frames + 1), side='left').astype(np.int64)
+        return cls(data, offsets)
+
+    @classmethod
+    def from_csv(cls, path):
+        return cls.from_dataframe(pd.read_csv(path))
+
+    @staticmethod
+    def paths(path, name='pred'):
+        return os.path.join(path, name + '.npy'), os.path.join(path, name + '_frames.npy')
+
+    @classmethod
+    def exists(cls, path, name='pred'):
+        return all(os.path.exists(p) for p in cls.paths(path, name))
+
+    @classmethod
+    def load(cls, path, name='pred', mmap_mode='r'):
+        data_path, offsets_path = cls.paths(path, name)
+        return cls(np.load(data_path, mmap_mode=mmap_mode), np.load(offsets_path))
+
+    def save(self, path, name='pred'):
+        if not os.path.exists(path):
+            os.makedirs(path)
+        data_path, offsets_path = self.paths(path, name)
+        np.save(data_path, np.ascontiguousarray(self.data, dtype=np.float32))
+        np.save(offsets_path, self.offsets)
+
+    def __len__(self):
+        return self.data.shape[0]
+
+    @property
+    def n_frames(self):
+        return len(self.offsets) - 1
+
+    def same_timeline(self, other):
+        if len(self) != len(other) or self.n_frames != other.n_frames:
+            return False
+        return np.array_equal(self.column('time'), other.column('time'))
+
+    def frame_bounds(self, f, f_next=1):
+        f = min(max(f, 0), self.n_frames)
+        return self.offsets[f], self.offsets[min(f + f_next, self.n_frames)]
+
+    def frame(self, f, f_next=1):
+        start, stop = self.frame_bounds(f, f_next)
+        return self.data[start:stop]
+
+    def window(self, start, stop):
+        ''' store of frames [start, stop) only, frames before start are empty so frame numbers stay the same '''
+        start, stop = min(max(start, 0), self.n_frames), min(max(stop, 0), self.n_frames)
+        first = self.offsets[start]
+        offsets = np.maximum(self.offsets[:stop + 1] - first, 0)
+        return PredStore(self.data[first:self.offsets[stop]], offsets)
+
+    def column(self, name):
+        return self.data[:, COLUMNS.index(name)]
+
+    def to_dataframe(self, rows=None):
+        return pd.DataFrame(np.asarray(self.data if rows is None else rows), columns=COLUMNS)
@@ -0,0 +1,213 @@
+import os
+import sys
+import csv
+import glob
+import json
+import time
+import atexit
+import resource
+import threading
+import tracemalloc
+
+# Per-stage timing of the localization (Localize) and classification (hts) scripts.
+#
+#   with profile('clustering', frames=len(idx)):
+#       ...
+#
+# Off unless WISET_PROFILE names a report folder: profile() then returns one
+# shared no-op context manager and @profiled leaves the function untouched.
+# When on, every step records calls, wall time, process CPU time, frames,
+# bytes read/written (/proc/self/io rchar/wchar) and the peak RSS so far
+# (WISET_PROFILE_TRACEMALLOC=1 adds the tracemalloc peak of Python
+# allocations). Steps opened inside another step of the same thread are named
+# 'outer/inner'. Time and I/O are per process, so steps running in parallel
+# threads overlap.
+#
+# At exit a process writes <WISET_PROFILE>/<video>/<script>-<pid>.json/.csv,
+# the video is set by the script (set_video) or WISET_PROFILE_VIDEO.
+#   python profiling.py [report folder]
+# merges them into <video>/report.csv per video and summary.csv over all videos.
+
+PROFILE_DIR = os.environ.get('WISET_PROFILE')
+TRACEMALLOC = os.environ.get('WISET_PROFILE_TRACEMALLOC') == '1'
+
+SUMS = ['calls', 'wall', 'cpu', 'frames', 'read_bytes', 'write_bytes']
+PEAKS = ['peak_rss_mb', 'peak_py_mb']
+FIELDS = ['step'] + SUMS + PEAKS
+
+_records = {}
+_lock = threading.Lock()
+_local = threading.local()
+_video = os.environ.get('WISET_PROFILE_VIDEO')
+
+
+def enabled():
+    return PROFILE_DIR is not None
+
+
+def set_video(video_name):
+    global _video
+    _video = video_name
+
+
+def io_counters():
+    try:
+        with open('/proc/self/io') as f:
+            fields = dict(line.split(':', 1) for line in f)
+        return int(fields['rchar']), int(fields['wchar'])
+    except (OSError, KeyError, ValueError):
+        return 0, 0
+
+
+def peak_rss_mb():
+    # ru_maxrss is KiB on Linux, bytes on macOS
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return rss / (1 << 20) if sys.platform == 'darwin' else rss / 1024
+
+
+class _Off:
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def add_frames(self, n):
+        pass
+
+
+OFF = _Off()
+
+
+class Step:
+    def __init__(self, name, frames=0):
+        self.name, self.frames = name, frames
+
+    def add_frames(self, n):
+        self.frames += n
+
+    def __enter__(self):
+        stack = getattr(_local, 'stack', None)
+        if stack is None:
+            stack = _local.stack = []
+        stack.append(self.name)
+        self.key = '/'.join(stack)
+        self.io = io_counters()
+        self.cpu = time.process_time()
+        self.wall = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        wall = time.perf_counter() - self.wall
+        cpu = time.process_time() - self.cpu
+        read, written = io_counters()
+        _local.stack.pop()
+
+        values = {'calls': 1, 'wall': wall, 'cpu': cpu, 'frames': self.frames,
+                  'read_bytes': read - self.io[0], 'write_bytes': written - self.io[1],
+                  'peak_rss_mb': peak_rss_mb(),
+                  'peak_py_mb': tracemalloc.get_traced_memory()[1] / (1 << 20) if tracemalloc.is_tracing() else 0}
+        with _lock:
+            record = _records.setdefault(self.key, dict.fromkeys(SUMS + PEAKS, 0))
+            merge(record, values)
+        return False
+
+
+def merge(record, values):
+    for k in SUMS:
+        record[k] += values[k]
+    for k in PEAKS:
+        record[k] = max(record[k], values[k])
+
+
+def profile(name, frames=0):
+    ''' context manager timing the step name, a no-op unless profiling is on '''
+    if PROFILE_DIR is None:
+        return OFF
+    return Step(name, frames)
+
+
+def profiled(name=None):
+    ''' decorator version of profile, the function is returned as is when profiling is off '''
+    def wrap(fn):
+        if PROFILE_DIR is None:
+            return fn
+        step = name or fn.__name__
+
+        def wrapper(*args, **kwargs):
+            with Step(step):
+                return fn(*args, **kwargs)
+        wrapper.__name__, wrapper.__doc__, wrapper.__wrapped__ = fn.__name__, fn.__doc__, fn
+        return wrapper
+    return wrap
+
+
+def script_name():
+    path = os.path.abspath(sys.argv[0]) if sys.argv and sys.argv[0] else 'python'
+    name = os.path.splitext(os.path.basename(path))[0]
+    # python -m pipeline runs pipeline/__main__.py
+    return os.path.basename(os.path.dirname(path)) if name == '__main__' else name
+
+
+def write_rows(path, rows):
+    with open(path, 'w', newline='') as f:
+        writer = csv.DictWriter(f, FIELDS)
+        writer.writeheader()
+        for step, record in rows:
+            writer.writerow(dict(record, step=step, wall=round(record['wall'], 4), cpu=round(record['cpu'], 4),
+                                 peak_rss_mb=round(record['peak_rss_mb'], 1), peak_py_mb=round(record['peak_py_mb'], 1)))
+
+
+def write_report():
+    if not _records:
+        return
+    out_dir = os.path.join(PROFILE_DIR, _video or 'unknown')
+    os.makedirs(out_dir, exist_ok=True)
+    name = '{}-{}'.format(script_name(), os.getpid())
+    with _lock:
+        records = dict(_records)
+    with open(os.path.join(out_dir, name + '.json'), 'w') as f:
+        json.dump({'script': script_name(), 'argv': sys.argv, 'video': _video, 'steps': records}, f, indent=1)
+    write_rows(os.path.join(out_dir, name + '.csv'), records.items())
+
+
+if PROFILE_DIR is not None:
+    if TRACEMALLOC:
+        tracemalloc.start()
+    atexit.register(write_report)
+
+
+def summarize(report_dir):
+    ''' per video report.csv of every process report and summary.csv of every video, returns the summary rows '''
+    summary = {}
+    for video_dir in sorted(glob.glob(os.path.join(report_dir, '*', ''))):
+        steps = {}
+        for path in sorted(glob.glob(os.path.join(video_dir, '*-*.json'))):
+            with open(path) as f:
+                report = json.load(f)
+            for step, values in report['steps'].items():
+                merge(steps.setdefault(step, dict.fromkeys(SUMS + PEAKS, 0)), values)
+                merge(summary.setdefault(step, dict.fromkeys(SUMS + PEAKS, 0)), values)
+        if steps:
+            write_rows(os.path.join(video_dir, 'report.csv'), sorted(steps.items()))
+
+    rows = sorted(summary.items(), key=lambda kv: -kv[1]['wall'])
+    write_rows(os.path.join(report_dir, 'summary.csv'), rows)
+    return rows
+
+
+def print_table(rows):
+    print('{:<40} {:>7} {:>10} {:>10} {:>8} {:>9} {:>10} {:>10} {:>9}'.format(
+        'step', 'calls', 'wall s', 'cpu s', 'frames', 'frames/s', 'read MB', 'write MB', 'rss MB'))
+    for step, r in rows:
+        fps = r['frames'] / r['wall'] if r['frames'] and r['wall'] else 0
+        print('{:<40} {:>7} {:>10.2f} {:>10.2f} {:>8} {:>9.1f} {:>10.1f} {:>10.1f} {:>9.0f}'.format(
+            step, r['calls'], r['wall'], r['cpu'], r['frames'], fps,
+            r['read_bytes'] / (1 << 20), r['write_bytes'] / (1 << 20), r['peak_rss_mb']))
+
+
+if __name__ == '__main__':
+    report_dir = sys.argv[1] if len(sys.argv) > 1 else PROFILE_DIR
+    if report_dir is None:
+        raise SystemExit('usage: profiling.py REPORT_DIR (or set WISET_PROFILE)')
+    print_table(summarize(report_dir))
@@ -0,0 +1,213 @@
+import os
+import functools
+import numpy as np
+import scipy.ndimage as ndi
+import cv2
+
+# Cached equirect <-> cubemap projection, same geometry as py360convert
+# (faces in F R B L U D order, bilinear sampling, 1 pixel seam padding).
+#
+# py360convert.e2c / c2e rebuild their coordinate grids on every call. Here
+# the sampling maps are built once per (H, W, face_w), kept in an LRU cache,
+# optionally persisted as .npy, and applied with cv2.remap to whole
+# (frames, H, W) / (frames, 6, face_w, face_w) batches.
+# OpenCV 4 cv2.remap weighs the 4 neighbours in fixed point (1/32 pixel
+# steps): on smooth maps it is within 1e-3 of py360convert's map_coordinates
+# sampling, on noise only within 1/32 of the local pixel range (0.025 measured
+# for values in [0, 1]). exact=True samples with scipy.ndimage.map_coordinates
+# (order 1) instead, slower but within float32 rounding of it.
+
+FRONT, RIGHT, BACK, LEFT, UP, DOWN = range(6)
+# cv2.remap is exact for up to 4 interleaved channels
+REMAP_CHANNELS = 4
+
+
+def xyzcube(face_w):
+    out = np.empty((face_w, face_w * 6, 3), np.float32)
+    rng = np.linspace(-0.5, 0.5, num=face_w, dtype=np.float32)
+    x, y = np.meshgrid(rng, -rng)
+    x_flip, y_flip = np.flip(x, 1), np.flip(y, 0)
+
+    faces = [
+        (x, y, 0.5),          # front  z = 0.5
+        (0.5, y, x_flip),     # right  x = 0.5
+        (x_flip, y, -0.5),    # back   z = -0.5
+        (-0.5, y, x),         # left   x = -0.5
+        (x, 0.5, y_flip),     # up     y = 0.5
+        (x, -0.5, y),         # down   y = -0.5
+    ]
+    for i, face in enumerate(faces):
+        for d in range(3):
+            out[:, i * face_w:(i + 1) * face_w, d] = face[d]
+    return out
+
+
+def equirect_facetype(h, w):
+    w4 = w // 4
+    tp = np.roll(np.arange(4).repeat(w4)[None, :].repeat(h, 0), 3 * w // 8, 1).astype(np.int32)
+
+    idx = np.linspace(-np.pi, np.pi, w4) / 4
+    idx = h // 2 - np.round(np.arctan(np.cos(idx)) * h / np.pi).astype(int)
+    up = np.zeros((h, w4), bool)
+    for i, j in enumerate(idx):
+        up[:j, i] = 1
+    up = np.roll(np.concatenate([up] * 4, 1), 3 * w // 8, 1)
+
+    tp[up] = UP
+    tp[np.flip(up, 0)] = DOWN
+    return tp
+
+
+def pad_equirect(imgs):
+    # (n, h, w) -> (n, h + 2, w + 2), wrapping over the poles and the seam
+    n, h, w = imgs.shape
+    padded = np.empty((n, h + 2, w + 2), imgs.dtype)
+    padded[:, 1:-1, 1:-1] = imgs
+    padded[:, 0, 1:-1] = np.roll(imgs[:, 0], w // 2, axis=1)
+    padded[:, -1, 1:-1] = np.roll(imgs[:, -1], w // 2, axis=1)
+    padded[:, :, 0] = padded[:, :, -2]
+    padded[:, :, -1] = padded[:, :, 1]
+    return padded
+
+
+def pad_faces(faces):
+    # (n, 6, s, s) -> (n, 6, s + 2, s + 2) with the neighbouring face borders
+    p = np.pad(faces, ((0, 0), (0, 0), (1, 1), (1, 1)), mode='edge')
+    p[:, FRONT, 0, :] = p[:, UP, -2, :]
+    p[:, FRONT, -1, :] = p[:, DOWN, 1, :]
+    p[:, RIGHT, 0, :] = p[:, UP, ::-1, -2]
+    p[:, RIGHT, -1, :] = p[:, DOWN, :, -2]
+    p[:, BACK, 0, :] = p[:, UP, 1, ::-1]
+    p[:, BACK, -1, :] = p[:, DOWN, -2, ::-1]
+    p[:, LEFT, 0, :] = p[:, UP, :, 1]
+    p[:, LEFT, -1, :] = p[:, DOWN, ::-1, 1]
+    p[:, UP, 0, :] = p[:, BACK, 1, ::-1]
+    p[:, UP, -1, :] = p[:, FRONT, 1, :]
+    p[:, DOWN, 0, :] = p[:, FRONT, -2, :]
+    p[:, DOWN, -1, :] = p[:, BACK, -2, ::-1]
+
+    p[:, FRONT, :, 0] = p[:, LEFT, :, -2]
+    p[:, FRONT, :, -1] = p[:, RIGHT, :, 1]
+    p[:, RIGHT, :, 0] = p[:, FRONT, :, -2]
+    p[:, RIGHT, :, -1] = p[:, BACK, :, 1]
+    p[:, BACK, :, 0] = p[:, RIGHT, :, -2]
+    p[:, BACK, :, -1] = p[:, LEFT, :, 1]
+    p[:, LEFT, :, 0] = p[:, BACK, :, -2]
+    p[:, LEFT, :, -1] = p[:, FRONT, :, 1]
+    p[:, UP, :, 0] = p[:, LEFT, 1, :]
+    p[:, UP, :, -1] = p[:, RIGHT, 1, ::-1]
+    p[:, DOWN, :, 0] = p[:, LEFT, -2, ::-1]
+    p[:, DOWN, :, -1] = p[:, RIGHT, -2, :]
+    return p
+
+
+def remap(imgs, map_x, map_y, exact=False):
+    # (n, H, W) sources sampled at the same map, 4 frames per cv2.remap call
+    n = imgs.shape[0]
+    out = np.empty((n,) + map_x.shape, imgs.dtype)
+    if exact:
+        for i in range(n):
+            out[i] = ndi.map_coordinates(imgs[i], (map_y, map_x), order=1, mode='nearest')
+        return out
+    for i in range(0, n, REMAP_CHANNELS):
+        chunk = np.ascontiguousarray(imgs[i:i + REMAP_CHANNELS].transpose(1, 2, 0))
+        res = cv2.remap(chunk, map_x, map_y, interpolation=cv2.INTER_LINEAR, borderMode=cv2.BORDER_REPLICATE)
+        out[i:i + REMAP_CHANNELS] = res.reshape(map_x.shape + (-1,)).transpose(2, 0, 1)
+    return out
+
+
+def load_or_build(cache_dir, name, build):
+    path = None if cache_dir is None else os.path.join(cache_dir, name + '.npy')
+    if path is not None and os.path.exists(path):
+        return np.load(path)
+
+    maps = build()
+    if path is not None:
+        os.makedirs(cache_dir, exist_ok=True)
+        np.save(path, maps)
+    return maps
+
+
+class E2C:
+    def __init__(self, h, w, face_w=256, cache_dir=None, exact=False):
+        self.h, self.w, self.face_w, self.exact = h, w, face_w, exact
+        self.map_x, self.map_y = load_or_build(cache_dir, 'e2c_{}x{}_{}'.format(h, w, face_w), self.build)
+
+    def build(self):
+        xyz = xyzcube(self.face_w)
+        x, y, z = xyz[..., 0], xyz[..., 1], xyz[..., 2]
+        u = np.arctan2(x, z)
+        v = np.arctan2(y, np.hypot(x, z))
+        # +1 for the padding row / column
+        coor_x = (u / (2 * np.pi) + 0.5) * self.w - 0.5 + 1
+        coor_y = (-v / np.pi + 0.5) * self.h - 0.5 + 1
+        return np.stack([coor_x, coor_y]).astype(np.float32)
+
+    def __call__(self, imgs):
+        ''' (H, W) or (n, H, W) equirect -> (6, s, s) or (n, 6, s, s) faces '''
+        single = imgs.ndim == 2
+        if single:
+            imgs = imgs[None]
+
+        horizon = remap(pad_equirect(imgs), self.map_x, self.map_y, self.exact)
+        s = self.face_w
+        faces = horizon.reshape(-1, s, 6, s).transpose(0, 2, 1, 3)
+
+        return faces[0] if single else faces
+
+
+class C2E:
+    def __init__(self, h, w, face_w=256, cache_dir=None, exact=False):
+        self.h, self.w, self.face_w, self.exact = h, w, face_w, exact
+        self.map_x, self.map_y = load_or_build(cache_dir, 'c2e_{}x{}_{}'.format(h, w, face_w), self.build)
+
+    def build(self):
+        h, w, s2 = self.h, self.w, self.face_w / 2
+        u, v = np.meshgrid(np.linspace(-np.pi, np.pi, num=w, dtype=np.float32),
+                           np.linspace(np.pi / 2, -np.pi / 2, num=h, dtype=np.float32))
+        tp = equirect_facetype(h, w)
+
+        coor_x = np.zeros((h, w), np.float32)
+        coor_y = np.zeros((h, w), np.float32)
+
+        mask = tp < UP
+        angles = u[mask] - np.pi / 2 * tp[mask]
+        coor_x[mask] = s2 * np.tan(angles)
+        coor_y[mask] = -s2 * np.tan(v[mask]) / np.cos(angles)
+
+        mask = tp == UP
+        c = s2 * np.tan(np.pi / 2 - v[mask])
+        coor_x[mask] = c * np.sin(u[mask])
+        coor_y[mask] = c * np.cos(u[mask])
+
+        mask = tp == DOWN
+        c = s2 * np.tan(np.pi / 2 - np.abs(v[mask]))
+        coor_x[mask] = c * np.sin(u[mask])
+        coor_y[mask] = -c * np.cos(u[mask])
+
+        coor_x = np.clip(coor_x + s2, 0, self.face_w) + 1
+        # faces are stacked vertically after padding
+        coor_y = np.clip(coor_y + s2, 0, self.face_w) + 1 + tp * (self.face_w + 2)
+        return np.stack([coor_x, coor_y]).astype(np.float32)
+
+    def __call__(self, faces):
+        ''' (6, s, s) or (n, 6, s, s) faces -> (H, W) or (n, H, W) equirect '''
+        single = faces.ndim == 3
+        if single:
+            faces = faces[None]
+
+        padded = pad_faces(faces)
+        stacked = padded.reshape(padded.shape[0], -1, padded.shape[-1])
+        out = remap(stacked, self.map_x, self.map_y, self.exact)
+
+        return out[0] if single else out
+
+
+@functools.lru_cache(maxsize=8)
+def get_e2c(h, w, face_w=256, cache_dir=None, exact=False):
+    return E2C(h, w, face_w, cache_dir, exact)
+
+
+@functools.lru_cache(maxsize=8)
+def get_c2e(h, w, face_w=256, cache_dir=None, exact=False):
+    return C2E(h, w, face_w, cache_dir, exact)
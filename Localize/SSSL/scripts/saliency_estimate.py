@@ -2,13 +2,14 @@ import numpy as np
 import glob
 import os
 import pdb
-import py360convert
 import imageio
 import math
 import scipy.ndimage as ndi
 import argparse
 from pathlib import Path
 import cv2
+from spherical_blur import get_operator
+from projection import get_e2c, get_c2e
 
 SALIENCY_FOLDER = '/content/output/saliency/'
 
@@ -17,40 +18,49 @@ view_angle_degree = 5
 view_angle_radian = math.radians(view_angle_degree)
 r = 300/np.pi
 gau_filter = int(np.round(view_angle_radian*r))
+FACE_W = 256
+# reach of the truncated (4 sigma) face blur, at most 4 gau_filter face pixels of 90/FACE_W degrees
+radius_deg = 4 * gau_filter * 90.0 / FACE_W
 
 
-def saliency(fixmap_input):
-
+def saliency(fixmap_input, cache_dir=None):
+    # equirect-native version of saliency_cube, its kernel measured once per (H, W)
     (h, w) = fixmap_input.shape
-    equi_output = np.zeros((h,w,3))
-
-    for shf in range(0, 360, 10):
-        fixmap_l = fixmap_input[:, 0:int(shf/360*w)]
-        fixmap_r = fixmap_input[:, int(shf/360*w):w]
-        fixmap = np.concatenate((fixmap_r, fixmap_l), axis=1)
-             
-        fixmap[fixmap>0] = 255
-        fixmap = np.expand_dims(fixmap, axis=2)
-        fixmap = np.concatenate((fixmap,fixmap,fixmap), axis=2)
-        cube_list   = py360convert.e2c(fixmap, cube_format='list')
-
-        cube_list_b = cube_list
-                
-        for c_key in range(6):
-            cimg = cube_list[c_key]
-            blur = ndi.gaussian_filter(cimg , gau_filter) 
-            cube_list_b[c_key] = blur
-
-        equi_b = py360convert.c2e(cube_list, h, w,  cube_format='list')
-        equi_b_l = equi_b[:, 0:w-int(shf/360*w), :]
-        equi_b_r = equi_b[:, w-int(shf/360*w):w, :]
-        equi_b = np.concatenate((equi_b_r, equi_b_l), axis=1)
-        
-        equi_output =  equi_output + equi_b 
-    equi_output = equi_output/36.0
+    fixmap = (fixmap_input > 0) * np.float32(255)
+
+    # cube_blur commutes with shifts by the w/36 columns between two rotations
+    equi_output = get_operator(h, w, cube_blur, radius_deg, max(int(round(w/36.0)), 1), cache_dir)(fixmap)
+    if equi_output.max() > 0:
+        equi_output = equi_output/equi_output.max()
+
+    return np.dstack([equi_output] * 3)
+
+def cube_blur(equi_input, cache_dir=None):
+    # 36 rotations x (e2c, blur, c2e) of one map, averaged, unnormalized.
+    # All rotations go through the cached projection maps as one batch.
+    (h, w) = equi_input.shape
+    e2c = get_e2c(h, w, FACE_W, cache_dir)
+    c2e = get_c2e(h, w, FACE_W, cache_dir)
+
+    shifts = [int(shf/360*w) for shf in range(0, 360, 10)]
+
+    cube_faces = e2c(np.stack([np.roll(equi_input, -s, axis=1) for s in shifts]).astype(np.float32))
+    cube_faces = ndi.gaussian_filter(cube_faces, (0, 0, gau_filter, gau_filter))
+    equi_b = c2e(cube_faces)
+
+    equi_output = np.zeros((h,w))
+    for s, equi in zip(shifts, equi_b):
+        equi_output += np.roll(equi, s, axis=1)
+    return equi_output/36.0
+
+def saliency_cube(fixmap_input, cache_dir=None):
+    # the cube-face reference for saliency
+    fixmap = (fixmap_input > 0) * np.float32(255)
+
+    equi_output = cube_blur(fixmap, cache_dir)
     equi_output = equi_output/equi_output.max()
 
-    return equi_output    
+    return np.dstack([equi_output] * 3)
 
 def generate_saliencymap(fixation_maps, segment_no, output_folder):
     print(":::...Saliency map estimation")
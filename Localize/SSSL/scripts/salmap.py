@@ -0,0 +1,113 @@
+import numpy as np
+import cv2
+import scipy.signal
+
+# Batched, float32 version of vaODV.fix2sal.
+#
+# fix2sal blurs fixmap**2 with a (h//2, h//2) kernel of sigma 16 and min-max
+# normalizes it to [0, 255]. Here the blur can run
+#   - at a reduced resolution (scale > 1) followed by one bilinear upsample,
+#   - as OpenCV's separable filter ('cv2'), a separable FFT convolution ('fft')
+#     or a Young-van Vliet recursive Gaussian ('iir') whose cost does not
+#     depend on sigma,
+# on a whole (frames, H, W) stack at once. Borders are reflected like
+# cv2.BORDER_DEFAULT (reflect 101) in every method.
+
+SIGMA = 16
+CV2_MAX_CHANNELS = 512
+FFT_MIN_SIGMA = 8
+
+
+def gaussian_kernel(sigma, ksize):
+    return cv2.getGaussianKernel(ksize, sigma, cv2.CV_32F).ravel()
+
+
+def blur_cv2(maps, sigma, ksize):
+    # frames as channels, one GaussianBlur call per CV2_MAX_CHANNELS frames
+    out = np.empty_like(maps)
+    for i in range(0, maps.shape[0], CV2_MAX_CHANNELS):
+        chunk = np.ascontiguousarray(maps[i:i + CV2_MAX_CHANNELS].transpose(1, 2, 0))
+        blurred = cv2.GaussianBlur(chunk, (ksize, ksize), sigma)
+        out[i:i + CV2_MAX_CHANNELS] = blurred.reshape(chunk.shape).transpose(2, 0, 1)
+    return out
+
+
+def blur_fft(maps, sigma, ksize):
+    kernel = gaussian_kernel(sigma, ksize)
+    r = ksize // 2
+    padded = np.pad(maps, ((0, 0), (r, r), (r, r)), mode='reflect')
+    out = scipy.signal.fftconvolve(padded, kernel[None, :, None], mode='valid', axes=1)
+    out = scipy.signal.fftconvolve(out, kernel[None, None, :], mode='valid', axes=2)
+    return out.astype(np.float32)
+
+
+def iir_coefficients(sigma):
+    # Young & van Vliet, "Recursive implementation of the Gaussian filter", 1995
+    if sigma >= 2.5:
+        q = 0.98711 * sigma - 0.96330
+    else:
+        q = 3.97156 - 4.14554 * np.sqrt(1 - 0.26891 * sigma)
+    b0 = 1.57825 + 2.44413 * q + 1.4281 * q ** 2 + 0.422205 * q ** 3
+    b1 = 2.44413 * q + 2.85619 * q ** 2 + 1.26661 * q ** 3
+    b2 = -(1.4281 * q ** 2 + 1.26661 * q ** 3)
+    b3 = 0.422205 * q ** 3
+    B = 1 - (b1 + b2 + b3) / b0
+    return np.array([B], dtype=np.float32), np.array([1, -b1 / b0, -b2 / b0, -b3 / b0], dtype=np.float32)
+
+
+def blur_iir(maps, sigma, ksize):
+    b, a = iir_coefficients(sigma)
+    # pad far enough for the recursion to settle, but never past the reflect limit
+    r = min(ksize // 2, maps.shape[1] - 1, maps.shape[2] - 1)
+    out = np.pad(maps, ((0, 0), (r, r), (r, r)), mode='reflect')
+    for axis in (1, 2):
+        out = scipy.signal.lfilter(b, a, out, axis=axis)
+        out = np.flip(scipy.signal.lfilter(b, a, np.flip(out, axis), axis=axis), axis)
+    return np.ascontiguousarray(out[:, r:-r, r:-r], dtype=np.float32)
+
+
+BLUR = {'cv2': blur_cv2, 'fft': blur_fft, 'iir': blur_iir}
+
+
+def blur(maps, sigma=SIGMA, ksize=None, scale=1, method='auto'):
+    ''' gaussian blur of a (frames, H, W) float32 stack, ksize defaults to fix2sal's h // 2 '''
+    n, h, w = maps.shape
+    if ksize is None:
+        ksize = h // 2
+
+    if scale > 1:
+        small = (max(1, int(round(w / scale))), max(1, int(round(h / scale))))
+        maps = np.stack([cv2.resize(m, small, interpolation=cv2.INTER_AREA) for m in maps])
+        sigma = sigma * small[1] / h
+        ksize = max(1, int(round(ksize * small[1] / h)) | 1)
+
+    if method == 'auto':
+        method = 'fft' if sigma >= FFT_MIN_SIGMA else 'cv2'
+    out = BLUR[method](maps, sigma, ksize)
+
+    if scale > 1:
+        out = np.stack([cv2.resize(m, (w, h), interpolation=cv2.INTER_LINEAR) for m in out])
+    return out
+
+
+def normalize_maps(maps):
+    # per frame min-max normalization, constant frames become 0
+    lo = maps.min(axis=(1, 2), keepdims=True)
+    span = maps.max(axis=(1, 2), keepdims=True) - lo
+    span[span == 0] = np.inf
+    return (maps - lo) / span
+
+
+def render(fixmaps, sigma=SIGMA, scale=1, method='auto', out=None):
+    ''' uint8 saliency maps of a (frames, H, W) stack of fixation maps, as fix2sal '''
+    fixmaps = np.asarray(fixmaps, dtype=np.float32)
+    single = fixmaps.ndim == 2
+    if single:
+        fixmaps = fixmaps[None]
+
+    sal = normalize_maps(blur(fixmaps ** 2, sigma=sigma, scale=scale, method=method)) * 255
+    if out is None:
+        out = np.empty(sal.shape, dtype=np.uint8)
+    out[...] = sal
+
+    return out[0] if single else out
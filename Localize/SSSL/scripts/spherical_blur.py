@@ -0,0 +1,114 @@
+import os
+import functools
+import numpy as np
+import scipy.sparse as sp
+
+# Equirectangular-native stand-in for the cube-face blur of saliency_estimate.
+#
+# saliency_estimate.cube_blur blurs cube faces under 36 rotations (72
+# projections per frame). Its footprint on the equirect map depends on the
+# latitude in a way no closed form gets right (the cube pixels shrink in
+# angle towards the face edges), so the kernel is measured instead, once per
+# (H, W, blur): every source row r goes through the blur as
+#   - a point, whose horizontal response is the row's kernel,
+#   - a segment of one rotation period, whose response is the mean over the
+#     columns the point can take. Near the poles the cube faces sample the
+#     equirect columns sparsely and the response of a point depends on its
+#     column; where its gain is off from the segment's, the row's kernel is
+#     the segment response with the segment deconvolved.
+# The segment responses also give the vertical profiles with the gain, as
+# column r of two banded H x H matrices: the rows reached directly and the
+# rows reached across a pole (those half a turn away).
+# A map is then blurred row by row as a circular (wrap-around) convolution in
+# the frequency domain, then through the two sparse matrices. The kernel is
+# kept in an LRU cache and optionally persisted as .npz.
+
+
+class SphericalBlur:
+    def __init__(self, h, w, blur, radius_deg, period=1, cache_dir=None):
+        ''' blur: the linear (H, W) -> (H, W) operator to reproduce, radius_deg: its support,
+        period: the column shift it commutes with '''
+        self.h, self.w = h, w
+
+        cache_path = None
+        if cache_dir is not None:
+            cache_path = os.path.join(cache_dir, 'sphblur_{}_{}x{}.npz'.format(blur.__name__, h, w))
+
+        if cache_path is not None and os.path.exists(cache_path):
+            kernel = np.load(cache_path)
+            response, direct, across = kernel['response'], kernel['direct'], kernel['across']
+        else:
+            response, direct, across = self.calibrate(blur, radius_deg, period)
+            if cache_path is not None:
+                os.makedirs(cache_dir, exist_ok=True)
+                np.savez(cache_path, response=response, direct=direct, across=across)
+
+        self.response = response
+        self.direct = sp.csr_matrix(direct)
+        self.across = sp.csr_matrix(across)
+
+    def calibrate(self, blur, radius_deg, period, tol=0.1, eps=1e-2):
+        # probes in every gap-th row at once, their responses do not overlap
+        h, w = self.h, self.w
+        reach = int(np.ceil(radius_deg / (180.0 / h)))
+        gap = min(2 * reach + 1, h)
+        c0 = w // 2
+        near = np.abs(np.arange(w) - c0) < w // 4     # the columns of the direct response
+        segment = np.zeros(w, np.float32)
+        segment[c0 - period // 2:c0 - period // 2 + period] = 1.0 / period
+
+        point_profiles, segment_profiles = np.zeros((h, w)), np.zeros((h, w))
+        point_gain, segment_gain = np.zeros(h), np.zeros(h)
+        direct = np.zeros((h, h), np.float32)
+        across = np.zeros((h, h), np.float32)
+        for offset in range(gap):
+            rows = np.arange(offset, h, gap)
+            probe = np.zeros((h, w), np.float32)
+            probe[rows, c0] = 1
+            points = blur(probe)
+            probe[rows] = segment
+            segments = blur(probe)
+            for r in rows:
+                lo, hi = max(r - reach, 0), min(r + reach + 1, h)
+                point_profiles[r] = points[lo:hi].sum(0)
+                point_gain[r] = point_profiles[r].sum()
+                window = segments[lo:hi]
+                segment_profiles[r] = window.sum(0)
+                segment_gain[r] = segment_profiles[r].sum()
+                direct[lo:hi, r] = window[:, near].sum(1)
+                across[lo:hi, r] = window[:, ~near].sum(1)
+
+        # kernels centred on column 0, unit gain
+        point_response = np.fft.rfft(np.roll(point_profiles, -c0, axis=1), axis=1) / np.maximum(point_gain, 1e-12)[:, None]
+        box = np.fft.rfft(np.roll(segment, -c0))
+        deconvolved = np.fft.rfft(np.roll(segment_profiles, -c0, axis=1), axis=1) / segment_gain[:, None]
+        deconvolved = np.fft.irfft(deconvolved * np.conj(box) / (np.abs(box) ** 2 + eps), n=w, axis=1)
+        deconvolved = np.fft.rfft(np.clip(deconvolved, 0, None), axis=1)
+        deconvolved /= deconvolved[:, :1].real
+        steady = np.abs(point_gain / segment_gain - 1) < tol
+        response = np.where(steady[:, None], point_response, deconvolved).astype(np.complex64)
+
+        # drop the numerical noise so the band stays sparse
+        floor = 1e-6 * direct.max()
+        direct[np.abs(direct) < floor] = 0
+        across[np.abs(across) < floor] = 0
+        return response, direct, across
+
+    def __call__(self, maps):
+        ''' blur a (H, W) map or a (frames, H, W) stack '''
+        maps = np.asarray(maps, dtype=np.float32)
+        single = maps.ndim == 2
+        if single:
+            maps = maps[None]
+
+        rows = np.fft.irfft(np.fft.rfft(maps, axis=2) * self.response, n=self.w, axis=2).astype(np.float32)
+        out = np.empty_like(rows)
+        for i, m in enumerate(rows):
+            out[i] = self.direct @ m + np.roll(self.across @ m, self.w // 2, axis=1)
+
+        return out[0] if single else out
+
+
+@functools.lru_cache(maxsize=8)
+def get_operator(h, w, blur, radius_deg, period=1, cache_dir=None):
+    return SphericalBlur(h, w, blur, radius_deg, period, cache_dir=cache_dir)
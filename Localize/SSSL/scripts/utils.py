@@ -8,6 +8,10 @@ import pandas as pd
 def get_saliency_ratios(path):
     saliency_mat = os.path.join(path)
     sal = scipy.io.loadmat(saliency_mat, verify_compressed_data_integrity=False)['audio_in_seconds']
+    return saliency_ratios(sal)
+
+
+def saliency_ratios(sal):
     sal = sal.reshape(-1, 6)
 
     p1 = sal[:,0]
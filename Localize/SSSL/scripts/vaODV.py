@@ -6,6 +6,11 @@ import numpy as np
 import cv2
 from pathlib import Path
 from tqdm import tqdm
+from pred_store import PredStore
+from frame_store import FrameStore
+from profiling import profile
+from dbscan import register_points, fixation_mask
+import salmap
 
 FIXATION_FOLDER = '/content/output/fixations/'
 
@@ -18,6 +23,15 @@ def fix2sal(fixmap):
     s = ( h // 2 )
     return normalize_map(cv2.GaussianBlur(fixmap**2, (s,s), 16))*255
 
+def fixation_folder(pred_path):
+    # <pred_path>/fixations without the salmap_f_*.png of an earlier run, which
+    # would be read back as the maps of frames this run skips
+    fix_folder = os.path.join(pred_path, 'fixations')
+    Path(fix_folder).mkdir(parents=True, exist_ok=True)
+    for png in glob.glob(os.path.join(fix_folder, 'salmap_f_*.png')):
+        os.remove(png)
+    return fix_folder
+
 
 class Point:
     def __init__(self, posX, posY, registeredTimes):
@@ -45,6 +59,8 @@ class vaODV:
         self.odv_shape = odv_shape
         # odv metadata        
         self.vid_info = {}
+        # prediction sources, loaded once and kept sorted by time
+        self.pred_cache = {}
 
 
     # def get_ODVs(self):
@@ -77,11 +93,37 @@ class vaODV:
     #     print("Modality: {modality}    ODV: {odv_name}   {f_count}/{list_vid}"
     #     .format(modality=self.modality, odv_name=odv_name, f_count=count+1, list_vid=len(self.odv_list)))
 
+    def load_par(self, par):
+        if isinstance(par, PredStore):
+            return par
+
+        if par not in self.pred_cache:
+            if os.path.isdir(par):
+                store = PredStore.load(par)
+            else:
+                with profile('csv_parse'):
+                    store = PredStore.from_csv(par)
+
+            # sources sampled on the same time axis share one frame index
+            for other in self.pred_cache.values():
+                if store.same_timeline(other):
+                    store.offsets = other.offsets
+                    break
+            self.pred_cache[par] = store
+
+        return self.pred_cache[par]
+
     def filter_par(self, par, f, f_next=1):
-        df      = pd.read_csv(par)
-        _filter = (df['time']<(f+f_next)) & (df['time']>=f)
-        
-        return df[_filter]
+        par = self.load_par(par)
+        return par.to_dataframe(par.frame(f, f_next))
+
+    def filter_par_batch(self, par, f, f_next):
+        # rows of frames [f, f+f_next) and the frame of every row relative to f
+        par = self.load_par(par)
+        start, stop = min(f, par.n_frames), min(f + f_next, par.n_frames)
+        rows = par.data[par.offsets[start]:par.offsets[stop]]
+        frame = np.repeat(np.arange(stop - start), np.diff(par.offsets[start:stop + 1]))
+        return rows, frame
 
     def RegionQuery(self, setOfPoints, point, eps):
         seeds = []
@@ -139,10 +181,16 @@ class vaODV:
             return True
 
     def clustering(self, data_par):
+        # same Fixations_person as clustering_scan, computed on the visited points only
+        counts = register_points(data_par['2dmu'], data_par['2dmv'], (self.odv_shape[0], self.odv_shape[1]))
+        return fixation_mask(counts, eps_scale=6, min_pts=12)
+
+    def clustering_scan(self, data_par):
+        # original full-pixel DBSCAN, kept as the reference for clustering
 
 
         RegisteredPoints_person = np.zeros((self.odv_shape[0], self.odv_shape[1]), dtype=object) # Created to have a heat map per person
-        ProbMatrix_person       = np.zeros((self.odv_shape[0], self.odv_shape[1]), dtype=np.int) # Created to have a heat map per person
+        ProbMatrix_person       = np.zeros((self.odv_shape[0], self.odv_shape[1]), dtype=int) # Created to have a heat map per person
         
         # don't consider the first fixation (1s)
         # dataPoints = dataPoints[40:] #ana=40
@@ -180,35 +228,118 @@ class vaODV:
 
         return Fixations_person
 
+    def clustering_batch(self, f, f_next, active=None):
+        # summed Fixations_person of every source for frames [f, f+f_next),
+        # samples of frames that are not active are dropped before clustering
+        shape = (self.odv_shape[0], self.odv_shape[1])
+        fixation_map = np.zeros((f_next,) + shape)
+
+        for par in self.pred:
+            rows, frame = self.filter_par_batch(par, f, f_next)
+            if active is not None:
+                keep = active[frame]
+                rows, frame = rows[keep], frame[keep]
+            counts = register_points(rows[:, 1], rows[:, 2], shape, frame=frame, n_frames=f_next)
+            fixation_map += fixation_mask(counts, eps_scale=6, min_pts=12)
+
+        return fixation_map
+
     def init_map(self):
         self.fixation_map       = np.zeros((self.odv_shape[0],self.odv_shape[1]))      
 
 
-    def generate_fixations(self, odv_name):
+    def load_preds(self, pred=None):
+        # number of participants
+        if pred is not None:
+            # in-memory sources (PredStore) given by the caller
+            self.pred = list(pred)
+        elif PredStore.exists(self.pred_path):
+            self.pred = [self.pred_path]
+        else:
+            self.pred = [os.path.join(self.pred_path, 'pred.csv')]
+        self.pred = [self.load_par(par) for par in self.pred]
+
+    def generate_fixations(self, odv_name, events=None):
+        # events: optional EventIndex, frames outside every event are skipped
         print("Generate fixations: ", odv_name)
         # get the metadata (vid_info) for a given ODV
         self.get_odvInfo(odv_name)
 
-        # number of participants
-        self.pred = [os.path.join(self.pred_path, 'pred.csv')]
+        self.load_preds()
 
         # create a folder for fixation
-        fix_folder = os.path.join(self.pred_path, 'fixations')
-        Path(fix_folder).mkdir(parents=True, exist_ok=True)
+        fix_folder = fixation_folder(self.pred_path)
+        # every frame also goes to the fixations frame store, skipped frames stay zero rows
+        n_frames = self.vid_info['duration']
+        store = FrameStore.create(self.pred_path, 'fixations', n_frames, self.odv_shape[:2], fps=30,
+                                  stage='fixmap2salmap', video=odv_name, event_gate=events is not None, per_frame=True)
 
         fixation_maps = []
-        for f in tqdm(range(self.vid_info['duration']), desc='generate fixation map:'):
+        for f in tqdm(range(n_frames), desc='generate fixation map:'):
+            if events is not None and f not in events:
+                continue
             self.init_map()
 
-            for par in self.pred:
-                # print("::. ODV #{}".format(os.path.basename(par)))
-                data_par = self.filter_par(par, f)
-                Fixations_person = self.clustering(data_par)
+            with profile('clustering', frames=1):
+                for par in self.pred:
+                    # print("::. ODV #{}".format(os.path.basename(par)))
+                    data_par = self.filter_par(par, f)
+                    Fixations_person = self.clustering(data_par)
 
-                self.fixation_map += Fixations_person
+                    self.fixation_map += Fixations_person
 
-
-            imageio.imwrite(os.path.join(fix_folder,'salmap_f_' + str(f) + '.png'), fix2sal(self.fixation_map).astype(np.uint8))
+            with profile('blur', frames=1):
+                salmap_f = fix2sal(self.fixation_map).astype(np.uint8)
+            with profile('encode', frames=1):
+                imageio.imwrite(os.path.join(fix_folder,'salmap_f_' + str(f) + '.png'), salmap_f)
+            store[f] = salmap_f
             # print(len(self.fixation_map))
             fixation_maps.append(self.fixation_map)
-        return fixation_maps                
\ No newline at end of file
+        store.close()
+        return fixation_maps
+
+    def iter_fixations(self, n_frames, chunk=16, blur_scale=1, blur_method='auto', events=None, start=0):
+        # (f, uint8 maps of frames [f, f+chunk)) of self.pred for frames [start, n_frames),
+        # frames outside every event are neither clustered nor blurred and stay zero
+        active = np.ones(n_frames, dtype=bool) if events is None else events.mask(n_frames)
+        shape = (self.odv_shape[0], self.odv_shape[1])
+
+        for f in range(start, n_frames, chunk):
+            f_next = min(chunk, n_frames - f)
+            maps = np.zeros((f_next,) + shape, dtype=np.uint8)
+            idx = np.flatnonzero(active[f:f + f_next])
+
+            if len(idx):
+                with profile('clustering', frames=len(idx)):
+                    fixation_map = self.clustering_batch(f, f_next, active[f:f + f_next])
+                with profile('blur', frames=len(idx)):
+                    maps[idx] = salmap.render(fixation_map[idx], scale=blur_scale, method=blur_method)
+            yield f, maps, idx
+
+    def generate_fixations_batch(self, odv_name, chunk=16, write_png=True, blur_scale=1, blur_method='auto', events=None):
+        # all frames as one (frames, H, W) uint8 FrameStore <pred_path>/fixations,
+        # clustered chunk by chunk so memory stays bounded by the output.
+        # With an EventIndex, frames outside every event are neither computed nor
+        # written: they stay zero in the memmap and get no png.
+        print("Generate fixations: ", odv_name)
+        self.get_odvInfo(odv_name)
+        self.load_preds()
+
+        fix_folder = fixation_folder(self.pred_path)
+
+        n_frames = self.vid_info['duration']
+        fixation_maps = FrameStore.create(self.pred_path, 'fixations', n_frames, self.odv_shape[:2], fps=30,
+                                          stage='fixmap2salmap', video=odv_name, event_gate=events is not None,
+                                          blur_scale=blur_scale, blur_method=blur_method)
+
+        fixations = self.iter_fixations(n_frames, chunk, blur_scale, blur_method, events)
+        for f, maps, idx in tqdm(fixations, total=-(-n_frames // chunk), desc='generate fixation map:'):
+            fixation_maps[f + idx] = maps[idx]
+
+            if write_png:
+                with profile('encode', frames=len(idx)):
+                    for i in idx:
+                        imageio.imwrite(os.path.join(fix_folder, 'salmap_f_' + str(f + i) + '.png'), maps[i])
+
+        fixation_maps.close()
+        return fixation_maps
@@ -0,0 +1,172 @@
+import os
+import sys
+import queue
+import threading
+import subprocess
+import numpy as np
+import cv2
+from PIL import Image
+
+# Frames of a video for the ViNet, keyframe and overlay stages, from either
+#   - a folder of extracted frames (/wiset/Input/<video>/frame_image/0001.jpg ...), or
+#   - the video file itself: every read() starts one ffmpeg process whose raw
+#     frames a reader thread queues ahead of the consumer. ffmpeg scales them
+#     (to the 224x384 ViNet input, the overlay size, ...) and seeks to the
+#     first frame of a time shard (-ss before -i decodes from the keyframe
+#     before it and drops the frames up to it).
+# Both give read(start, stop, size, pix_fmt) -> (frame index, uint8 array) in
+# order, pix_fmt 'bgr24', 'rgb24' or 'gray'. video_source() takes the
+# extracted frames when they exist, else the mp4.
+
+INPUT = '/wiset/Input'
+CHANNELS = {'bgr24': 3, 'rgb24': 3, 'gray': 1}
+
+
+class ImageFolder:
+    ''' frames from image files, one per frame in sorted order '''
+
+    def __init__(self, paths):
+        self.paths = list(paths)
+        self._size = None
+
+    @classmethod
+    def open(cls, frame_dir):
+        names = sorted(f for f in os.listdir(frame_dir) if os.path.isfile(os.path.join(frame_dir, f)))
+        return cls(os.path.join(frame_dir, f) for f in names)
+
+    def __len__(self):
+        return len(self.paths)
+
+    @property
+    def size(self):
+        ''' (width, height) of the frames '''
+        if self._size is None:
+            self._size = Image.open(self.paths[0]).size
+        return self._size
+
+    def name(self, i):
+        return os.path.basename(self.paths[i])
+
+    def imread(self, i, size=None, pix_fmt='bgr24'):
+        if pix_fmt == 'gray':
+            # small gray frames are for motion estimates, the JPEG decoder scales down first
+            img = Image.open(self.paths[i])
+            if size is not None:
+                img.draft('L', tuple(size))
+            img = img.convert('L')
+            return np.asarray(img.resize(tuple(size)) if size is not None else img)
+        img = cv2.imread(self.paths[i])
+        if pix_fmt == 'rgb24':
+            img = cv2.cvtColor(img, cv2.COLOR_BGR2RGB)
+        if size is not None and (img.shape[1], img.shape[0]) != tuple(size):
+            img = cv2.resize(img, tuple(size))
+        return img
+
+    def read(self, start=0, stop=None, size=None, pix_fmt='bgr24'):
+        stop = len(self) if stop is None else min(stop, len(self))
+        for i in range(start, stop):
+            yield i, self.imread(i, size, pix_fmt)
+
+
+class VideoFrames:
+    ''' frames of a video file decoded by ffmpeg '''
+
+    def __init__(self, path, queue_size=32):
+        cap = cv2.VideoCapture(path)
+        if not cap.isOpened():
+            raise IOError('cannot open video {}'.format(path))
+        self.path, self.queue_size = path, queue_size
+        self.n_frames = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
+        self.fps = cap.get(cv2.CAP_PROP_FPS)
+        self.size = (int(cap.get(cv2.CAP_PROP_FRAME_WIDTH)), int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT)))
+        cap.release()
+
+    def __len__(self):
+        return self.n_frames
+
+    def name(self, i):
+        # the name the extracted frame would have
+        return '{:04d}.jpg'.format(i + 1)
+
+    def command(self, start, stop, size, pix_fmt):
+        cmd = ['ffmpeg', '-loglevel', 'error', '-nostdin']
+        if start:
+            cmd += ['-ss', '{:.6f}'.format(start / self.fps)]
+        cmd += ['-i', self.path, '-map', '0:v:0', '-frames:v', str(stop - start)]
+        if size is not None and tuple(size) != self.size:
+            cmd += ['-vf', 'scale={}:{}'.format(*size)]
+        return cmd + ['-f', 'rawvideo', '-pix_fmt', pix_fmt, '-']
+
+    def read(self, start=0, stop=None, size=None, pix_fmt='bgr24'):
+        stop = len(self) if stop is None else min(stop, len(self))
+        if start >= stop:
+            return
+        w, h = size if size is not None else self.size
+        shape = (h, w) if pix_fmt == 'gray' else (h, w, CHANNELS[pix_fmt])
+        n_bytes = w * h * CHANNELS[pix_fmt]
+
+        proc = subprocess.Popen(self.command(start, stop, size, pix_fmt), stdout=subprocess.PIPE)
+        frames = queue.Queue(self.queue_size)
+
+        def reader():
+            try:
+                for i in range(start, stop):
+                    buf = bytearray(n_bytes)
+                    if proc.stdout.readinto(buf) < n_bytes:
+                        break
+                    frames.put((i, np.frombuffer(buf, np.uint8).reshape(shape)))
+            finally:
+                proc.stdout.close()
+                frames.put(None)
+
+        thread = threading.Thread(target=reader, daemon=True)
+        thread.start()
+        try:
+            while True:
+                item = frames.get()
+                if item is None:
+                    break
+                yield item
+        finally:
+            # also when the consumer stops early: the reader sees EOF and exits
+            proc.kill()
+            while thread.is_alive() and not sys.is_finalizing():
+                try:
+                    frames.get(timeout=0.1)
+                except queue.Empty:
+                    pass
+            proc.wait()
+
+
+class Cursor:
+    ''' frame i of one read(), for i asked in non-decreasing order '''
+
+    def __init__(self, frames):
+        self.frames = iter(frames)
+        self.i, self.frame = -1, None
+
+    def __call__(self, i):
+        while self.i < i:
+            self.i, self.frame = next(self.frames)
+        if self.i != i:
+            raise IndexError('frame {} was asked after frame {}'.format(i, self.i))
+        return self.frame
+
+
+def frame_source(frames):
+    ''' ImageFolder of a list of frame paths or a frame folder, VideoFrames of a video file '''
+    if isinstance(frames, (ImageFolder, VideoFrames)):
+        return frames
+    if isinstance(frames, (list, tuple)):
+        return ImageFolder(frames)
+    if os.path.isdir(frames):
+        return ImageFolder.open(frames)
+    return VideoFrames(frames)
+
+
+def video_source(video_name, input_dir=INPUT):
+    ''' <input_dir>/<video>/frame_image when the frames were extracted, else <video>.mp4 '''
+    frame_dir = os.path.join(input_dir, video_name, 'frame_image')
+    if os.path.isdir(frame_dir) and os.listdir(frame_dir):
+        return ImageFolder.open(frame_dir)
+    return VideoFrames(os.path.join(input_dir, video_name, video_name + '.mp4'))
@@ -0,0 +1,44 @@
+import os
+import sys
+import numpy as np
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'scripts'))
+import projection
+
+py360convert = pytest.importorskip('py360convert')
+
+H, W, FACE_W = 128, 256, 64
+
+
+@pytest.fixture
+def reference(monkeypatch):
+    # py360convert samples with cv2.remap when it can, the reference is its map_coordinates path
+    monkeypatch.setattr(py360convert.utils, 'cv2', None, raising=False)
+    return py360convert
+
+
+def noise(*shape):
+    return np.random.RandomState(0).rand(*shape).astype(np.float32)
+
+
+@pytest.mark.parametrize('exact, tol', [(True, 1e-4), (False, 1 / 32)])
+def test_e2c_noise(reference, exact, tol):
+    equi = noise(H, W)
+    ref = np.stack(reference.e2c(equi, face_w=FACE_W, mode='bilinear', cube_format='list'))
+    faces = projection.E2C(H, W, FACE_W, exact=exact)(equi)
+    assert np.abs(faces - ref).max() < tol
+
+
+@pytest.mark.parametrize('exact, tol', [(True, 1e-4), (False, 1 / 32)])
+def test_c2e_noise(reference, exact, tol):
+    faces = noise(6, FACE_W, FACE_W)
+    ref = reference.c2e(list(faces), H, W, mode='bilinear', cube_format='list')
+    equi = projection.C2E(H, W, FACE_W, exact=exact)(faces)
+    assert np.abs(equi - ref).max() < tol
+
+
+def test_batch_matches_single():
+    equi = noise(3, H, W)
+    e2c = projection.E2C(H, W, FACE_W, exact=True)
+    assert np.array_equal(e2c(equi)[1], e2c(equi[1]))
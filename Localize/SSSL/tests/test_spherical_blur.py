@@ -0,0 +1,64 @@
+import os
+import sys
+import numpy as np
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'scripts'))
+pytest.importorskip('py360convert')
+import saliency_estimate
+
+H, W = 128, 256
+# near the poles the cube kernel is the least separable in rows and columns
+LATITUDES = [(0, 0.99), (45, 0.99), (75, 0.98)]
+
+
+def row_of(lat):
+    return int(round((90 - lat) / 180.0 * H - 0.5))
+
+
+def cc(a, b):
+    a, b = a - a.mean(), b - b.mean()
+    return (a * b).sum() / np.sqrt((a * a).sum() * (b * b).sum())
+
+
+def fwhm(profile):
+    # samples above half the peak
+    return int((profile >= profile.max() / 2).sum())
+
+
+@pytest.fixture(scope='module')
+def fixmaps():
+    rng = np.random.RandomState(1)
+    maps = np.zeros((3, H, W), np.uint8)
+    for m in maps:
+        m[rng.randint(H, size=60), rng.randint(W, size=60)] = 255
+    return maps
+
+
+@pytest.fixture(scope='module')
+def pairs(fixmaps):
+    return [(saliency_estimate.saliency(m)[..., 0], saliency_estimate.saliency_cube(m)[..., 0]) for m in fixmaps]
+
+
+def test_three_channels(fixmaps):
+    out = saliency_estimate.saliency(fixmaps[0])
+    assert out.shape == (H, W, 3)
+    assert out.max() == pytest.approx(1)
+
+
+@pytest.mark.parametrize('lat, min_cc', LATITUDES)
+def test_cc_per_latitude(pairs, lat, min_cc):
+    lats = 90 - (np.arange(H) + 0.5) * 180.0 / H
+    band = np.abs(lats - lat) < 10
+    assert min(cc(fast[band], ref[band]) for fast, ref in pairs) > min_cc
+
+
+@pytest.mark.parametrize('lat', [lat for lat, _ in LATITUDES])
+def test_fwhm_per_latitude(lat):
+    r, c = row_of(lat), W // 3
+    fixmap = np.zeros((H, W), np.uint8)
+    fixmap[r, c] = 255
+    fast = saliency_estimate.saliency(fixmap)[..., 0]
+    ref = saliency_estimate.saliency_cube(fixmap)[..., 0]
+    assert abs(fwhm(fast[:, c]) - fwhm(ref[:, c])) <= 1
+    assert abs(fwhm(fast[r]) - fwhm(ref[r])) <= max(1, 0.1 * fwhm(ref[r]))
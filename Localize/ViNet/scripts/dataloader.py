@@ -4,7 +4,7 @@ import csv
 import cv2, copy
 import numpy as np
 import torch
-from torch.utils.data import Dataset, DataLoader
+from torch.utils.data import Dataset, DataLoader, IterableDataset, get_worker_info
 from torchvision import transforms, utils
 from PIL import Image
 import torchaudio
@@ -232,6 +232,60 @@ class SoundDatasetLoader(Dataset):
 			return clip_img, gt, audio_feature
 		return clip_img, gt
 
+class FrameDataset(IterableDataset):
+	''' (frame indices, (n, 3, 224, 384) frames) chunks of the jpgs list_paths[start:stop] in order, for
+		DataLoader(batch_size=None): worker w of n decodes the chunks w, w+n, ..., which the loader returns
+		round robin. draft lets the JPEG decoder scale down by 1/2, 1/4 or 1/8 before the resize.
+	'''
+	def __init__(self, list_paths, start=0, stop=None, chunk=8, draft=True):
+		self.list_paths = list_paths
+		self.start = start
+		self.stop = len(list_paths) if stop is None else stop
+		self.chunk = chunk
+		self.draft = draft
+		self.img_transform = transforms.Compose([
+			transforms.Resize((224, 384)),
+			transforms.ToTensor(),
+			transforms.Normalize(
+				[0.485, 0.456, 0.406],
+				[0.229, 0.224, 0.225]
+			)
+		])
+
+	def decode(self, path):
+		img = Image.open(path)
+		if self.draft:
+			img.draft('RGB', (384, 224))
+		return self.img_transform(img.convert('RGB'))
+
+	def __iter__(self):
+		info = get_worker_info()
+		worker, n_workers = (0, 1) if info is None else (info.id, info.num_workers)
+		for first in range(self.start + worker*self.chunk, self.stop, n_workers*self.chunk):
+			idx = list(range(first, min(first+self.chunk, self.stop)))
+			yield idx, torch.stack([self.decode(self.list_paths[i]) for i in idx])
+
+
+class FrameReader:
+	''' load(i) over the chunks of a FrameDataset loader, for frames asked in increasing order '''
+	def __init__(self, loader):
+		self.chunks = iter(loader)
+		self.idx, self.frames = [], None
+
+	def __call__(self, i):
+		while not self.idx or self.idx[-1] < i:
+			self.idx, self.frames = next(self.chunks)
+		return self.frames[i-self.idx[0]]
+
+
+def frame_loader(list_paths, start=0, workers=2, prefetch=2, chunk=8, draft=True):
+	''' load(i) of the frames from start on, decoded by workers processes at most workers*prefetch chunks ahead '''
+	dataset = FrameDataset(list_paths, start, chunk=chunk, draft=draft)
+	loader = DataLoader(dataset, batch_size=None, num_workers=workers, prefetch_factor=prefetch if workers else None,
+						pin_memory=torch.cuda.is_available())
+	return FrameReader(loader)
+
+
 class DHF1KDataset(Dataset):
 	def __init__(self, path_data, len_snippet, mode="train", multi_frame=0, alternate=1):
 		''' mode: train, val, save '''
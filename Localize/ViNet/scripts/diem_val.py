@@ -101,20 +101,16 @@ def validate(args):
 
 		if len(list_frames) >= 2*len_temporal-1:
 
-			snippet = []
-			for i in range(len(list_frames)):
-				torch_img, img_size = torch_transform(os.path.join(path_indata, 'video_frames', 'DIEM', dname, list_frames[i]))
+			list_paths = [os.path.join(path_indata, 'video_frames', 'DIEM', dname, f) for f in list_frames]
+			img_size = Image.open(list_paths[0]).size
+			load = lambda i: torch_transform(list_paths[i])[0]
 
-				snippet.append(torch_img)
-				
-				if i >= len_temporal-1:
-					clip = torch.FloatTensor(torch.stack(snippet, dim=0)).unsqueeze(0)
-					clip = clip.permute((0,2,1,3,4))
-
-					sim_loss, cc_loss, nss_loss, aucj_loss = process(model, clip, path_indata, dname, list_frames[i], args, img_size)
+			for frames, clips, flipped in window_batches(load, len(list_frames), len_temporal, args.batch_size, device=device):
+				losses = process(model, clips, path_indata, dname, [list_frames[j] for j in frames], args, img_size)
+				for j, (sim_loss, cc_loss, nss_loss, aucj_loss) in zip(frames, losses):
 					# print(cc_loss)
 					if np.isnan(sim_loss) or np.isnan(cc_loss) or np.isnan(nss_loss):
-						print("1", dname, list_frames[i])
+						print("2" if flipped else "1", dname, list_frames[j])
 						print("No saliency")
 					else:
 						frame_sim_loss += sim_loss
@@ -128,27 +124,7 @@ def validate(args):
 						video_cc_loss += cc_loss
 						video_aucj_loss += aucj_loss
 						num_frames += 1
-					# process first (len_temporal-1) frames
-					if i < 2*len_temporal-2:
-						sim_loss, cc_loss, nss_loss, aucj_loss = process(model, torch.flip(clip, [2]), path_indata, dname, list_frames[i-len_temporal+1], args, img_size)
-						if np.isnan(sim_loss) or np.isnan(cc_loss) or np.isnan(nss_loss):
-							print("2", dname, list_frames[i])
-							print("No saliency")
-						else:
-							frame_sim_loss += sim_loss
-							frame_nss_loss += nss_loss
-							frame_cc_loss += cc_loss
-							frame_aucj_loss += aucj_loss
-							frame_cnt += 1
-
-							video_sim_loss += sim_loss
-							video_nss_loss += nss_loss
-							video_cc_loss += cc_loss
-							video_aucj_loss += aucj_loss
-							num_frames += 1
-
-					del snippet[0]
-					# print(frame_cnt, frame_sim_loss)
+				# print(frame_cnt, frame_sim_loss)
 
 		else:
 			print (' more frames are needed')
@@ -195,30 +171,33 @@ def get_fixation(path_indata, dname, _id):
 	info = sio.loadmat(join(path_indata, 'annotations/DIEM', dname, 'fixMap_{}.mat'.format(_id)))
 	return info['eyeMap']
 
-def process(model, clip, path_indata, dname, frame_no, args, img_size):
-	''' process one clip and save the predicted saliency map '''
+def process(model, clips, path_indata, dname, frame_nos, args, img_size):
+	''' process a batch of clips in one forward, the (sim, cc, nss, aucj) of every predicted map '''
 	with torch.no_grad():
-		smap = model(clip.to(device)).cpu().data[0]
-	
-	smap = smap.numpy()
-	_id = frame_no.split('.')[0].split('_')[-1]
-	gt = cv2.imread(join(path_indata, 'annotations/DIEM', dname, 'maps', 'eyeMap_{}.jpg'.format(_id)), 0)
-	smap = cv2.resize(smap, (gt.shape[1], gt.shape[0]))
-	fix = get_fixation(path_indata, dname, _id)
-	smap = blur(smap)
-	
-	gt = torch.FloatTensor(gt).unsqueeze(0)
-	fix = torch.FloatTensor(fix).unsqueeze(0)
-	smap = smap.unsqueeze(0)
-	# print(smap.size(), gt.size())
-	sim_loss = similarity(smap, gt)
-	cc_loss = cc(smap, gt)
-	nss_loss = nss(smap, fix)
-	aucj_loss = auc_judd(smap, fix)
-
-	if np.isnan(sim_loss) or np.isnan(cc_loss) or np.isnan(nss_loss):
-		assert gt.numpy().max()==0, gt.numpy().max()
-	return sim_loss, cc_loss, nss_loss, aucj_loss
+		smaps = model(clips.to(device)).cpu().data
+
+	losses = []
+	for smap, frame_no in zip(smaps, frame_nos):
+		smap = smap.numpy()
+		_id = frame_no.split('.')[0].split('_')[-1]
+		gt = cv2.imread(join(path_indata, 'annotations/DIEM', dname, 'maps', 'eyeMap_{}.jpg'.format(_id)), 0)
+		smap = cv2.resize(smap, (gt.shape[1], gt.shape[0]))
+		fix = get_fixation(path_indata, dname, _id)
+		smap = blur(smap)
+
+		gt = torch.FloatTensor(gt).unsqueeze(0)
+		fix = torch.FloatTensor(fix).unsqueeze(0)
+		smap = smap.unsqueeze(0)
+		# print(smap.size(), gt.size())
+		sim_loss = similarity(smap, gt)
+		cc_loss = cc(smap, gt)
+		nss_loss = nss(smap, fix)
+		aucj_loss = auc_judd(smap, fix)
+
+		if np.isnan(sim_loss) or np.isnan(cc_loss) or np.isnan(nss_loss):
+			assert gt.numpy().max()==0, gt.numpy().max()
+		losses.append((sim_loss, cc_loss, nss_loss, aucj_loss))
+	return losses
 
 	
 if __name__ == '__main__':
@@ -236,6 +215,7 @@ if __name__ == '__main__':
 	parser.add_argument('--num_decoder_layers',default=-1, type=int)
 	parser.add_argument('--num_hier',default=3, type=int)
 	parser.add_argument('--clip_size',default=32, type=int)
+	parser.add_argument('--batch_size',default=4, type=int, help='sliding-window clips per forward')
 	
 	args = parser.parse_args()
 	print(args)
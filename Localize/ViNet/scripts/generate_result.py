@@ -4,27 +4,29 @@ import numpy as np
 import cv2
 import torch
 from model import VideoSaliencyModel
+from streaming import StreamingSaliency
+import keyframes
 from scipy.ndimage.filters import gaussian_filter
 from loss import kldiv, cc, nss
 import argparse
 
 from torch.utils.data import DataLoader
-from dataloader import DHF1KDataset
+from dataloader import DHF1KDataset, frame_loader
 from utils import *
 import time
 from tqdm import tqdm
 from torchvision import transforms, utils
 from os.path import join
 
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..', 'SSSL', 'scripts'))
+from frame_store import FrameStore
+from video_frames import ImageFolder, Cursor, frame_source, video_source
+from profiling import profile, set_video
+
 # +
 device = torch.device('cuda' if torch.cuda.is_available() else 'cpu')
 
-def validate(args):
-    path_indata = args.path_indata
-    file_weight = args.file_weight
-
-    len_temporal = args.clip_size
-
+def load_model(args):
     model = VideoSaliencyModel(
         transformer_in_channel=args.transformer_in_channel, 
         nhead=args.nhead,
@@ -33,58 +35,133 @@ def validate(args):
      	num_clips=args.clip_size   
     )
 
-    model.load_state_dict(torch.load(file_weight))
+    model.load_state_dict(torch.load(args.file_weight))
 
     model = model.to(device)
     torch.backends.cudnn.benchmark = False
     model.eval()
+    return model
+
+def iter_saliency(model, frames, len_temporal, start=0, stop=None, batch_size=1, stream=False,
+                  keyframe_stride=1, interp='linear', scene_thresh=None, workers=0, draft=True):
+    # (frame index, uint8 map) in frame order for frames [start, stop) of a list of jpg
+    # paths, a frame folder or a video file (video_frames.frame_source), the first
+    # (len_temporal-1) frames come from the flipped clips. A later start warms the
+    # clip up on the len_temporal-1 frames before it. batch_size clips run in one forward,
+    # stream reuses the backbone activations of the previous clips instead.
+    # keyframe_stride > 1 or scene_thresh predicts the keyframes only and rebuilds the
+    # maps in between (see keyframes.py), the model then also runs on the keyframes just
+    # outside [start, stop) so a time shard rebuilds its maps as a full run does.
+    # workers > 0 decodes the frames ahead of the model in that many DataLoader
+    # processes, at a reduced JPEG scale with draft. A video is decoded and scaled to
+    # 224x384 by ffmpeg in a thread of its own.
+    source = frame_source(frames)
+    stop = len(source) if stop is None else min(stop, len(source))
+    keys = None
+    lo, hi = start, stop    # the frames the model runs on
+    if keyframe_stride > 1 or scene_thresh is not None:
+        lo, hi = keyframes.key_range(start, stop, keyframe_stride, len(source))
+        energy = keyframes.frame_energy(source, lo, hi) if scene_thresh is not None else None
+        keys = keyframes.plan(lo, hi, keyframe_stride, energy, scene_thresh, len(source))
+
+    img_size = source.size
+    first = 0 if lo < len_temporal-1 else lo-len_temporal+1
+    if not isinstance(source, ImageFolder):
+        # the flipped clips of the first frames reach frame 2*len_temporal-3
+        reader = Cursor(source.read(first, max(hi, 2*len_temporal-2), (384, 224), 'rgb24'))
+        def load(i):
+            with profile('decode', frames=1):
+                return tensor_transform(reader(i))
+    elif workers:
+        reader = frame_loader(source.paths, first, workers, draft=draft)
+        def load(i):
+            # the time the model waits for decoded frames
+            with profile('decode', frames=1):
+                return reader(i)
+    else:
+        load = lambda i: torch_transform(source.paths[i])[0]
+    streaming = StreamingSaliency(model) if stream else None
+
+    def key_maps():
+        for frames, clips, flipped in window_batches(load, len(source), len_temporal, batch_size, lo, hi, keys, device):
+            if streaming is None or flipped:
+                smaps = forward(model, clips)
+            else:
+                smaps = forward_stream(streaming, clips, [j-len_temporal+1 for j in frames])
+            for i, smap in zip(frames, smaps):
+                yield i, postprocess(smap, img_size)
+
+    if keys is None:
+        yield from key_maps()
+    else:
+        for t, smap in keyframes.interpolated(key_maps(), interp, source):
+            if start <= t < stop:
+                yield t, smap
+
+def validate(args):
+    path_indata = args.path_indata
+
+    len_temporal = args.clip_size
+
+    model = load_model(args)
     
  
     dname = args.video_name
 
     print ('processing ' + dname, flush=True)
-    list_frames = [f for f in os.listdir(os.path.join(path_indata, dname, 'frame_image')) if os.path.isfile(os.path.join(path_indata, dname, 'frame_image', f))]
-    list_frames.sort()
+    # the frame_image jpgs, else the mp4
+    source = frame_source(args.frames) if getattr(args, 'frames', None) else video_source(dname, path_indata)
     os.makedirs(join(args.save_path, dname), exist_ok=True)
 
     # process in a sliding window fashion
-    if len(list_frames) >= 2*len_temporal-1:
-
-        snippet = []
-        for i in tqdm(range(len(list_frames))):
-            torch_img, img_size = torch_transform(os.path.join(path_indata, dname,'frame_image', list_frames[i]))
-
-            snippet.append(torch_img)
-                
-            if i >= len_temporal-1:
-                clip = torch.FloatTensor(torch.stack(snippet, dim=0)).unsqueeze(0)
-                clip = clip.permute((0,2,1,3,4))
-
-                process(model, clip, path_indata, dname, list_frames[i], args, img_size)
-
-                # process first (len_temporal-1) frames
-                if i < 2*len_temporal-2:
-                    process(model, torch.flip(clip, [2]), path_indata, dname, list_frames[i-len_temporal+1], args, img_size)
-
-                del snippet[0]
+    if len(source) >= 2*len_temporal-1:
+
+        store = None
+        if not getattr(args, 'frame_store', False):
+            FrameStore.remove(join(args.save_path, dname), 'saliency')
+        else:
+            img_size = source.size
+            store = FrameStore.create(join(args.save_path, dname), 'saliency', len(source), (img_size[1], img_size[0]),
+                                      stage='generate_result', video=dname, file_weight=args.file_weight, clip_size=len_temporal,
+                                      keyframe_stride=args.keyframe_stride, interp=args.interp, scene_thresh=args.scene_thresh)
+
+        set_video(dname)
+        with profile('generate_result', frames=len(source)):
+            for i, smap in tqdm(iter_saliency(model, source, len_temporal, batch_size=args.batch_size, stream=args.stream,
+                                              keyframe_stride=args.keyframe_stride, interp=args.interp,
+                                              scene_thresh=args.scene_thresh, workers=args.workers, draft=not args.no_draft),
+                                total=len(source)):
+                if store is not None:
+                    store[i] = smap
+                else:
+                    with profile('encode', frames=1):
+                        img_write(smap, join(args.save_path, dname, source.name(i)))
+
+        if store is not None:
+            store.close()
     else:
         print (' more frames are needed')
 
 
 # -
 
+img_transform = transforms.Compose([
+        transforms.Resize((224, 384)),
+        transforms.ToTensor(),
+        transforms.Normalize(
+            [0.485, 0.456, 0.406],
+            [0.229, 0.224, 0.225]
+        )
+])
+
+# frames already at 224x384
+tensor_transform = transforms.Compose(img_transform.transforms[1:])
+
 def torch_transform(path):
-    img_transform = transforms.Compose([
-            transforms.Resize((224, 384)),
-            transforms.ToTensor(),
-            transforms.Normalize(
-                [0.485, 0.456, 0.406],
-                [0.229, 0.224, 0.225]
-            )
-    ])
-    img = Image.open(path).convert('RGB')
-    sz = img.size
-    img = img_transform(img)
+    with profile('decode', frames=1):
+        img = Image.open(path).convert('RGB')
+        sz = img.size
+        img = img_transform(img)
     return img, sz
 
 def blur(img):
@@ -92,15 +169,24 @@ def blur(img):
     bl = cv2.GaussianBlur(img,(k_size,k_size),0)
     return torch.FloatTensor(bl)
 
-def process(model, clip, path_inpdata, dname, frame_no, args, img_size):
-    with torch.no_grad():
-        smap = model(clip.to(device)).cpu().data[0]
-    
-    smap = smap.numpy()
-    smap = cv2.resize(smap, (img_size[0], img_size[1]))
-    smap = blur(smap)
+def forward(model, clips):
+    # (B, H, W) model maps of the (B, C, T, H, W) clips
+    with profile('forward', frames=clips.shape[0]), torch.no_grad():
+        return model(clips.to(device)).cpu().data
+
+def forward_stream(streaming, clips, starts):
+    # (B, H, W) maps of the clips starting at the frames starts
+    with profile('forward', frames=clips.shape[0]), torch.no_grad():
+        return torch.cat([streaming(clips[b:b+1].to(device), s).cpu() for b, s in enumerate(starts)]).data
+
+def postprocess(smap, img_size):
+    # uint8 map at the input image size
+    with profile('postprocess', frames=1):
+        smap = smap.numpy()
+        smap = cv2.resize(smap, (img_size[0], img_size[1]))
+        smap = blur(smap)
 
-    img_save(smap, join(args.save_path, dname, frame_no), normalize=True)
+        return img_array(smap, normalize=True)
 
 if __name__ == '__main__':
     parser = argparse.ArgumentParser()
@@ -118,6 +204,15 @@ if __name__ == '__main__':
     parser.add_argument('--num_hier',default=3, type=int)
     parser.add_argument('--clip_size',default=32, type=int)
     parser.add_argument('--video_name', type=str)
+    parser.add_argument('--batch_size', default=4, type=int, help='sliding-window clips per forward')
+    parser.add_argument('--stream', action='store_true', help='reuse the backbone activations of the previous clips (one clip per forward)')
+    parser.add_argument('--keyframe_stride', default=1, type=int, help='run the model every keyframe_stride frames and rebuild the maps in between')
+    parser.add_argument('--interp', default='linear', choices=['linear', 'flow'], help='how the maps between keyframes are rebuilt')
+    parser.add_argument('--scene_thresh', default=None, type=float, help='also key the frames around a cut, mean absolute frame difference 0-255')
+    parser.add_argument('--workers', default=2, type=int, help='frame decoding processes running ahead of the model, 0 decodes in the model loop')
+    parser.add_argument('--no_draft', action='store_true', help='decode the jpgs at full scale before the resize (workers > 0)')
+    parser.add_argument('--frames', default=None, type=str, help='frame folder or video file, default <path_indata>/<video>/frame_image or else <video>.mp4')
+    parser.add_argument('--frame_store', action='store_true', help='write the maps to <save_path>/<video>/saliency.npy instead of jpgs')
     
     args = parser.parse_args()
     validate(args)
@@ -166,27 +166,18 @@ def validate(args):
 
 		if len(list_frames) >= 2*len_temporal-1:
 
-			snippet = []
-			for i in range(len(list_frames)):
-				torch_img, img_size = torch_transform(os.path.join(path_indata, 'video_frames', dname, list_frames[i]))
-
-				snippet.append(torch_img)
-				
-				if i >= len_temporal-1:
-					clip = torch.FloatTensor(torch.stack(snippet, dim=0)).unsqueeze(0)
-					clip = clip.permute((0,2,1,3,4))
-
-					audio_feature = None
-					if args.use_sound:
-						audio_feature = get_audio_feature(dname, audiodata, args, i-len_temporal+1)
-					process(model, clip, path_indata, dname, list_frames[i], args, img_size, audio_feature=audio_feature)
-
-					if i < 2*len_temporal-2:
-						if args.use_sound:
-							audio_feature = torch.flip(audio_feature, [2])
-						process(model, torch.flip(clip, [2]), path_indata, dname, list_frames[i-len_temporal+1], args, img_size, audio_feature=audio_feature)
-
-					del snippet[0]
+			list_paths = [os.path.join(path_indata, 'video_frames', dname, f) for f in list_frames]
+			img_size = Image.open(list_paths[0]).size
+			load = lambda i: torch_transform(list_paths[i])[0]
+
+			for frames, clips, flipped in window_batches(load, len(list_frames), len_temporal, args.batch_size, device=device):
+				audio_feature = None
+				if args.use_sound:
+					# the clip of frame j starts at j when flipped, at j-len_temporal+1 otherwise
+					audio_feature = torch.cat([get_audio_feature(dname, audiodata, args, j if flipped else j-len_temporal+1) for j in frames])
+					if flipped:
+						audio_feature = torch.flip(audio_feature, [2])
+				process(model, clips, path_indata, dname, [list_frames[j] for j in frames], args, img_size, audio_feature=audio_feature)
 		else:
 			print (' more frames are needed')
 
@@ -209,18 +200,20 @@ def blur(img):
 	bl = cv2.GaussianBlur(img,(k_size,k_size),0)
 	return torch.FloatTensor(bl)
 
-def process(model, clip, path_inpdata, dname, frame_no, args, img_size, audio_feature=None):
+def process(model, clips, path_inpdata, dname, frame_nos, args, img_size, audio_feature=None):
+	# one forward for the batch of clips, frame_nos are their jpg names
 	with torch.no_grad():
 		if audio_feature==None:
-			smap = model(clip.to(device)).cpu().data[0]
+			smaps = model(clips.to(device)).cpu().data
 		else:
-			smap = model(clip.to(device), audio_feature.to(device)).cpu().data[0]
-	
-	smap = smap.numpy()
-	smap = cv2.resize(smap, (img_size[0], img_size[1]))
-	smap = blur(smap)
+			smaps = model(clips.to(device), audio_feature.to(device)).cpu().data
+
+	for smap, frame_no in zip(smaps, frame_nos):
+		smap = smap.numpy()
+		smap = cv2.resize(smap, (img_size[0], img_size[1]))
+		smap = blur(smap)
 
-	img_save(smap, join(args.save_path, dname, frame_no), normalize=True)
+		img_save(smap, join(args.save_path, dname, frame_no), normalize=True)
 
 if __name__ == '__main__':
 	parser = argparse.ArgumentParser()
@@ -240,6 +233,7 @@ if __name__ == '__main__':
 	parser.add_argument('--num_hier',default=3, type=int)
 	parser.add_argument('--clip_size',default=32, type=int)
 	parser.add_argument('--use_sound',default=False, type=bool)
+	parser.add_argument('--batch_size',default=4, type=int, help='sliding-window clips per forward')
 	
 	args = parser.parse_args()
 	print(args)
@@ -0,0 +1,159 @@
+import os
+import sys
+import csv
+import argparse
+import numpy as np
+import cv2
+import torch
+from loss import cc, similarity, nss
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..', 'SSSL', 'scripts'))
+from frame_store import FrameStore
+from video_frames import Cursor, frame_source, video_source
+
+# Keyframe inference: ViNet runs on every multiple of stride only and the maps in
+# between are rebuilt from the two keyframe maps around them,
+#   linear  blend of the two maps by distance
+#   flow    the two maps warped to the frame with Farneback optical flow, then blended
+# With scene_thresh, a frame whose mean absolute difference to the previous one
+# (grayscale, FLOW_WIDTH wide) is above it and that previous frame are keyframes
+# too, so no map is blended across a cut. The first and last frame are always
+# keyframes. A keyframe map is the map of the dense run. The frames are a list
+# of jpg paths, a frame folder or the mp4 (video_frames.frame_source).
+#
+#   python keyframes.py --video_name v --strides 2 3 5 10
+# compares the rebuilt maps to the dense ViNet maps (generate_result.py
+# --frame_store) in CC, SIM and NSS -> <save_path>/<video>/keyframe_report.csv
+
+FLOW_WIDTH = 320
+NSS_TOP = 0.01    # the fixations of a dense map for NSS are its top 1% pixels
+
+
+def small_grays(frames, start=0, stop=None, width=FLOW_WIDTH):
+    ''' (frame, grayscale frame width wide) of the frames [start, stop) '''
+    source = frame_source(frames)
+    w, h = source.size
+    return source.read(start, stop, (width, max(1, round(h * width / w))), 'gray')
+
+
+def frame_energy(frames, start=0, stop=None):
+    ''' mean absolute grayscale difference of every frame of [start, stop) to the previous one, 0 for start '''
+    stop = len(frame_source(frames)) if stop is None else stop
+    energy = np.zeros(stop - start, np.float32)
+    prev = None
+    for i, gray in small_grays(frames, start, stop):
+        if prev is not None:
+            energy[i-start] = np.mean(cv2.absdiff(gray, prev))
+        prev = gray
+    return energy
+
+
+def plan(start, stop, stride, energy=None, scene_thresh=None, n_frames=None):
+    ''' sorted keyframes of [start, stop): every multiple of stride, the last frame of the video (n_frames,
+        default stop) and both frames of every cut, energy the frame_energy of [start, stop) '''
+    keys = set(range(start + (-start) % stride, stop, stride))
+    last = (stop if n_frames is None else n_frames) - 1
+    if start <= last < stop:
+        keys.add(last)
+    if energy is not None and scene_thresh is not None:
+        for j in np.nonzero(energy > scene_thresh)[0] + start:
+            keys.update(k for k in (int(j) - 1, int(j)) if k >= start)
+    return sorted(keys)
+
+
+def key_range(start, stop, stride, n_frames):
+    ''' [lo, hi) from the keyframe at or before start to the one at or after stop-1, the keyframes plan
+        gives for it are those of the whole video there '''
+    lo = start - start % stride
+    hi = min(stop - 1 + (1 - stop) % stride, n_frames - 1) + 1
+    return lo, hi
+
+
+def normalized(smap):
+    # min 0, max 255 as the maps of generate_result.postprocess
+    lo, hi = smap.min(), smap.max()
+    return np.round((smap - lo) * (255 / max(hi - lo, 1e-5))).astype(np.uint8)
+
+
+def warp(smap, flow):
+    # smap sampled at x + flow(x), flow computed at a smaller size
+    h, w = smap.shape
+    scale = w / flow.shape[1]
+    flow = cv2.resize(flow, (w, h)) * scale
+    grid_x, grid_y = np.meshgrid(np.arange(w, dtype=np.float32), np.arange(h, dtype=np.float32))
+    return cv2.remap(smap, grid_x + flow[..., 0], grid_y + flow[..., 1], cv2.INTER_LINEAR, borderMode=cv2.BORDER_REPLICATE)
+
+
+def fill(j1, m1, j2, m2, interp='linear', gray=None):
+    ''' (frame, uint8 map) of the frames between the keyframes j1 and j2, gray(i) the small
+        grayscale frame i for i in non-decreasing order '''
+    if interp == 'flow' and j2 - j1 > 1:
+        grays = [gray(t) for t in range(j1, j2 + 1)]
+        g1, g2 = grays[0], grays[-1]
+    for t in range(j1 + 1, j2):
+        w = (t - j1) / (j2 - j1)
+        a, b = m1.astype(np.float32), m2.astype(np.float32)
+        if interp == 'flow':
+            g = grays[t - j1]
+            a = warp(a, cv2.calcOpticalFlowFarneback(g, g1, None, 0.5, 3, 15, 3, 5, 1.2, 0))
+            b = warp(b, cv2.calcOpticalFlowFarneback(g, g2, None, 0.5, 3, 15, 3, 5, 1.2, 0))
+        yield t, normalized((1 - w) * a + w * b)
+
+
+def interpolated(key_maps, interp='linear', frames=None):
+    ''' (frame, uint8 map) of every frame from the first to the last of the (keyframe, map) pairs '''
+    prev, gray = None, None
+    for j, smap in key_maps:
+        if prev is None and interp == 'flow':
+            # one pass over the frames from the first keyframe on
+            gray = Cursor(small_grays(frames, j))
+        if prev is not None:
+            yield from fill(prev[0], prev[1], j, smap, interp, gray)
+        yield j, smap
+        prev = j, smap
+
+
+def scores(smap, dense):
+    ''' CC, SIM and NSS of smap against the dense map '''
+    s = torch.FloatTensor(smap.astype(np.float32)).unsqueeze(0)
+    d = torch.FloatTensor(dense.astype(np.float32)).unsqueeze(0)
+    fix = (d >= torch.quantile(d.flatten(), 1 - NSS_TOP)).float()
+    return cc(s, d).item(), similarity(s, d).item(), nss(s, fix).item()
+
+
+def report(dense, frames, strides, interps=('linear',), scene_thresh=None):
+    ''' one row per (stride, interp) with the mean scores of the rebuilt frames '''
+    energy = frame_energy(frames, 0, len(dense)) if scene_thresh is not None else None
+    rows = []
+    for stride in strides:
+        keys = plan(0, len(dense), stride, energy, scene_thresh)
+        key_set = set(keys)
+        for interp in interps:
+            rebuilt = [scores(smap, dense[t]) for t, smap in interpolated(((j, dense[j]) for j in keys), interp, frames)
+                       if t not in key_set]
+            mean = np.mean(rebuilt, 0) if rebuilt else (1.0, 1.0, float('nan'))
+            rows.append({'stride': stride, 'interp': interp, 'scene_thresh': scene_thresh,
+                         'keyframes': len(keys), 'frames': len(dense), 'cost': round(len(keys) / len(dense), 3),
+                         'cc': round(float(mean[0]), 4), 'sim': round(float(mean[1]), 4), 'nss': round(float(mean[2]), 4)})
+            print('stride {stride:>3} {interp:<6} keyframes {keyframes}/{frames}  CC {cc:.4f}  SIM {sim:.4f}  NSS {nss:.4f}'.format(**rows[-1]), flush=True)
+    return rows
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--video_name', type=str)
+    parser.add_argument('--path_indata', default='/wiset/Input/', type=str)
+    parser.add_argument('--save_path', default='/wiset/Output/ViNet/', type=str, help='folder of the dense <video>/saliency.npy')
+    parser.add_argument('--strides', default=[2, 3, 5, 10], type=int, nargs='+')
+    parser.add_argument('--interp', default=['linear', 'flow'], nargs='+', choices=['linear', 'flow'])
+    parser.add_argument('--scene_thresh', default=None, type=float, help='also key the frames around a cut, mean absolute difference 0-255')
+    parser.add_argument('--frames', default=None, type=str, help='frame folder or video file, default <path_indata>/<video>/frame_image or else <video>.mp4')
+    args = parser.parse_args()
+
+    frames = frame_source(args.frames) if args.frames else video_source(args.video_name, args.path_indata)
+    dense = FrameStore.open(os.path.join(args.save_path, args.video_name), 'saliency')
+    rows = report(dense, frames, args.strides, args.interp, args.scene_thresh)
+    with open(os.path.join(args.save_path, args.video_name, 'keyframe_report.csv'), 'w', newline='') as f:
+        writer = csv.DictWriter(f, list(rows[0]))
+        writer.writeheader()
+        writer.writerows(rows)
@@ -0,0 +1,154 @@
+import torch
+import torch.nn.functional as F
+from torch import nn
+from model_utils import SepConv3d, BasicConv3d
+
+# VideoSaliencyModel over the consecutive sliding windows of one video,
+# reusing backbone activations from window to window.
+#
+# The window moves one frame per output frame, but BackBoneS3D recomputes all
+# clip_size frames. Here the conv and pool units of base1, maxp2 and base2 keep
+# their outputs per absolute frame position:
+#   - an output whose temporal receptive field lies inside the window is the
+#     same in every window, it is computed once and reused
+#   - outputs that see the temporal zero (-inf for pools) padding at the window
+#     edges, and the new output at the right edge, are recomputed per window
+# The spatial conv_s of the first SepConv3d thus runs once per frame. Its
+# conv_t has temporal stride 2, so windows of even and odd start reuse each
+# other's per-frame features only, and every later unit keeps the entries of
+# both. From maxp3 on the padding reaches every output of a 32 frame window,
+# so base3, base4 and the decoder run in full.
+#
+# Activations are cached for about 2*clip_size positions per unit, which is
+# roughly 1 GB for 224x384 frames.
+
+
+def temporal(op):
+    # (kernel, stride, padding) of a Conv3d / MaxPool3d along time
+    def first(v):
+        return v[0] if isinstance(v, tuple) else v
+    return first(op.kernel_size), first(op.stride), first(op.padding)
+
+
+def spatial_padding(op):
+    p = op.padding if isinstance(op.padding, tuple) else (op.padding,) * 3
+    return (0,) + tuple(p[1:])
+
+
+def ranges(idx):
+    # [(a, b)] runs of consecutive indices
+    runs = []
+    for j in idx:
+        if runs and runs[-1][1] == j:
+            runs[-1][1] = j + 1
+        else:
+            runs.append([j, j + 1])
+    return runs
+
+
+class Unit:
+    ''' a Conv3d or MaxPool3d with the BatchNorm3d / ReLU after it, and its cached outputs '''
+
+    def __init__(self, op):
+        self.op, self.post = op, []
+        self.k, self.s, self.p = temporal(op)
+        self.cache = {}
+
+    def compute(self, x, a, b):
+        # outputs [a, b) of the window x, padded in time as the full op would be
+        lo, hi = a * self.s - self.p, (b - 1) * self.s - self.p + self.k
+        t = x.shape[2]
+        pad = (0, 0, 0, 0, max(-lo, 0), max(hi - t, 0))
+        x = x[:, :, max(lo, 0):min(hi, t)]
+        op = self.op
+        if isinstance(op, nn.Conv3d):
+            y = F.conv3d(F.pad(x, pad), op.weight, op.bias, op.stride, spatial_padding(op), op.dilation, op.groups)
+        else:
+            y = F.max_pool3d(F.pad(x, pad, value=float('-inf')), op.kernel_size, op.stride, spatial_padding(op),
+                             op.dilation, op.ceil_mode)
+        for m in self.post:
+            y = m(y)
+        return y
+
+    def run(self, x, offset, step, clean):
+        ''' output of the window x whose time index i is at frame offset+i*step, clean[i] when
+            x[:, :, i] does not depend on the window '''
+        t = x.shape[2]
+        n = (t + 2 * self.p - self.k) // self.s + 1
+        offset, step = offset + ((self.k - 1) // 2 - self.p) * step, step * self.s
+        pos = [offset + j * step for j in range(n)]
+        rf = [(j * self.s - self.p, j * self.s - self.p + self.k) for j in range(n)]
+        clean = [lo >= 0 and hi <= t and all(clean[lo:hi]) for lo, hi in rf]
+
+        out = {j: self.cache[pos[j]] for j in range(n) if clean[j] and pos[j] in self.cache}
+        for a, b in ranges([j for j in range(n) if j not in out]):
+            y = self.compute(x, a, b)
+            for j in range(a, b):
+                out[j] = y[:, :, j - a]
+                if clean[j]:
+                    self.cache[pos[j]] = out[j]
+
+        # later windows start further on
+        for p in [p for p in self.cache if p < offset]:
+            del self.cache[p]
+        return torch.stack([out[j] for j in range(n)], 2), offset, step, clean
+
+
+class Branches:
+    ''' the branch0..3 of a Mixed block, concatenated along the channels '''
+
+    def __init__(self, branches):
+        self.branches = branches
+
+    def run(self, x, offset, step, clean):
+        outs = [run(units, x, offset, step, clean) for units in self.branches]
+        clean = [all(c) for c in zip(*[o[3] for o in outs])]
+        return torch.cat([o[0] for o in outs], 1), outs[0][1], outs[0][2], clean
+
+
+def units_of(module):
+    ''' the Unit / Branches of a backbone module in forward order '''
+    if isinstance(module, (nn.Conv3d, nn.MaxPool3d)):
+        return [Unit(module)]
+    if isinstance(module, (nn.BatchNorm3d, nn.ReLU)):
+        return [module]
+    if hasattr(module, 'branch0'):
+        return [Branches([units_of(getattr(module, 'branch%d' % i)) for i in range(4)])]
+    if isinstance(module, (nn.Sequential, SepConv3d, BasicConv3d)):
+        # SepConv3d and BasicConv3d apply their children in order
+        units = []
+        for m in module.children():
+            for u in units_of(m):
+                if isinstance(u, (nn.BatchNorm3d, nn.ReLU)):
+                    units[-1].post.append(u)
+                else:
+                    units.append(u)
+        return units
+    raise TypeError('cannot stream {}'.format(type(module).__name__))
+
+
+def run(units, x, offset, step, clean):
+    for u in units:
+        x, offset, step, clean = u.run(x, offset, step, clean)
+    return x, offset, step, clean
+
+
+class StreamingSaliency:
+    ''' a VideoSaliencyModel called on the clips of one video in frame order, same maps as model(clip) '''
+
+    def __init__(self, model):
+        self.model = model
+        backbone = model.backbone
+        self.base1 = units_of(backbone.base1)
+        self.base2 = units_of(nn.Sequential(backbone.maxp2, backbone.base2))
+
+    def __call__(self, clip, start):
+        # clip: (1, C, T, H, W) of the frames start .. start+T-1
+        backbone = self.model.backbone
+        clean = [True] * clip.shape[2]
+        y3, offset, step, clean = run(self.base1, clip, start, 1, clean)
+        y2 = run(self.base2, y3, offset, step, clean)[0]
+
+        y1 = backbone.base3(backbone.maxp3(y2))
+        y0 = backbone.base4(backbone.maxp4(backbone.maxt4(y1)))
+        return self.model.decoder(*[y0, y1, y2, y3][:self.model.num_hier + 1])
@@ -63,13 +63,15 @@ def blur(img):
     bl = cv2.GaussianBlur(img,(k_size,k_size),0)
     return torch.FloatTensor(bl)
 
-def img_save(tensor, fp, nrow=8, padding=2,
-               normalize=False, range=None, scale_each=False, pad_value=0, format=None):
+def img_array(tensor, nrow=8, padding=2,
+               normalize=False, range=None, scale_each=False, pad_value=0):
     grid = utils.make_grid(tensor, nrow=nrow, padding=padding, pad_value=pad_value,
                      normalize=normalize, range=range, scale_each=scale_each)
 
     ndarr = torch.round(grid.mul(255).add_(0.5).clamp_(0, 255).permute(1, 2, 0)).to('cpu', torch.uint8).numpy()
-    ndarr = ndarr[:,:,0]
+    return ndarr[:,:,0]
+
+def img_write(ndarr, fp, format=None):
     im = Image.fromarray(ndarr)
     exten = fp.split('.')[-1]
     if exten=="png":
@@ -77,6 +79,94 @@ def img_save(tensor, fp, nrow=8, padding=2,
     else:
         im.save(fp, format=format, quality=100) #for jpg
 
+def img_save(tensor, fp, nrow=8, padding=2,
+               normalize=False, range=None, scale_each=False, pad_value=0, format=None):
+    ndarr = img_array(tensor, nrow=nrow, padding=padding, normalize=normalize,
+                      range=range, scale_each=scale_each, pad_value=pad_value)
+    img_write(ndarr, fp, format=format)
+
 
 def num_params(model):
-    return sum(dict((p.data_ptr(), p.numel()) for p in model.parameters()).values())
\ No newline at end of file
+    return sum(dict((p.data_ptr(), p.numel()) for p in model.parameters()).values())
+
+
+class ClipRing:
+    ''' the last span frames in one (C, 2*span-1, H, W) buffer. Frame t is written to slot t % span and,
+        below span-1, also to slot span + t % span, so any span consecutive frames are one slice of it.
+    '''
+    def __init__(self, span, frame, device=None):
+        self.span = span
+        self.buf = torch.empty((frame.shape[0], 2*span-1) + tuple(frame.shape[1:]), dtype=frame.dtype,
+                               device=frame.device if device is None else device)
+
+    def put(self, t, frame):
+        k = t % self.span
+        self.buf[:, k].copy_(frame, non_blocking=True)
+        if k < self.span-1:
+            self.buf[:, self.span+k].copy_(self.buf[:, k])
+
+    def frames(self, a, b):
+        # (C, b-a, H, W) view of the frames [a, b), the last span frames put
+        k = a % self.span
+        return self.buf[:, k:k+b-a]
+
+
+def window_batches(load, n_frames, len_temporal, batch_size, start=0, stop=None, keys=None, device=None):
+    ''' (frame numbers, clips, flipped) batches of the sliding-window clips predicting frames [start, stop),
+        or only the sorted frames keys among them, in frame order. load(i) is the (C, H, W) tensor of frame i.
+        Frame j >= len_temporal-1 is predicted by the clip ending at j, an earlier frame by the flipped clip
+        starting at j, so a batch is either all flipped or not.
+        Every frame is loaded once and copied into a ClipRing (on device), the flipped clips read the first
+        2*len_temporal-2 frames from a buffer in reverse order. clips is a (B, C, T, H, W) strided view of
+        them, valid until the next batch (a copy when keys leaves gaps between the clips, or reorders a
+        flipped batch of several clips).
+    '''
+    L = len_temporal
+    stop = n_frames if stop is None else min(stop, n_frames)
+    keys = [j for j in (range(start, stop) if keys is None else keys) if start <= j < stop]
+    batches = []
+    b = 0
+    while b < len(keys):
+        flipped = keys[b] < L-1
+        batch = [j for j in keys[b:b+batch_size] if (j < L-1) == flipped]
+        starts = [j if flipped else j-L+1 for j in batch]
+        # a flipped clip may need frames past the end of a short video
+        while starts and starts[-1]+L > n_frames:
+            batch, starts = batch[:-1], starts[:-1]
+        if not batch:
+            break
+        batches.append((batch, starts, flipped))
+        b += len(batch)
+    span = max([s[-1]+L-s[0] for _, s, flipped in batches if not flipped], default=L)
+
+    ring = rev = None
+    loaded = ring_have = 0    # frames [.., loaded) were loaded, [.., ring_have) put in the ring
+    for batch, starts, flipped in batches:
+        first, last = starts[0], starts[-1]+L
+        if flipped:
+            # frame t at rev[:, 2L-3-t], the flipped clip starting at j is rev[:, L-2-j:2L-2-j]
+            for t in range(loaded, last):
+                frame = load(t)
+                if rev is None:
+                    rev = torch.empty((frame.shape[0], 2*L-2) + tuple(frame.shape[1:]), dtype=frame.dtype,
+                                      device=frame.device if device is None else device)
+                rev[:, 2*L-3-t].copy_(frame, non_blocking=True)
+            loaded = last
+            clips = rev[:, L-2-starts[-1]:2*L-2-first].unfold(1, L, 1)
+            if len(batch) > 1:
+                clips = clips[:, [starts[-1]-s for s in starts]]
+        else:
+            for t in range(max(ring_have, first), last):
+                # the frames of the flipped clips are in rev already
+                frame = rev[:, 2*L-3-t] if t < loaded else load(t)
+                if ring is None:
+                    ring = ClipRing(span, frame, device)
+                ring.put(t, frame)
+            if last >= loaded:
+                loaded, rev = last, None
+            ring_have = last
+            clips = ring.frames(first, last).unfold(1, L, 1)
+            if last-first != len(batch)+L-1:
+                clips = clips[:, [s-first for s in starts]]
+        # (C, B, H, W, T) -> (B, C, T, H, W)
+        yield batch, clips.permute(1, 0, 4, 2, 3), flipped
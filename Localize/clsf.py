@@ -11,6 +11,9 @@ import cv2
 from tqdm import tqdm
 import natsort
 
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), 'SSSL', 'scripts'))
+from events import read_hts_csv, EventIndex
+from frame_store import FrameStore
 
 
 def parse_args():
@@ -24,15 +27,7 @@ def get_odvInfo(vid_pth, odv_name):
         return vid.get_meta_data()
 
 def hts_csv(hts_pth):
-
-    with open(hts_pth, newline='') as csvfile:
-        hts_csv = csv.reader(csvfile, delimiter=' ', quotechar='|')
-        classify_res = [line[0].split(',')[:2] for line in hts_csv if line[0].split(',')[2] != '0' and line[0].split(',')[2] != '3' ]
-    
-    classify_res = list(map(lambda x: list(map(lambda x: int(float(x)*30), x)), classify_res))
-    classify_res.sort()
-
-    return classify_res
+    return read_hts_csv(hts_pth)
 
 
 def run(args):
@@ -40,33 +35,35 @@ def run(args):
     vid_pth = os.path.join("/wiset/Input", args.video_name)
     fix_pth = os.path.join('/wiset/Output/SSSL', args.video_name, 'fixations')
 
-    _img = imageio.imread(os.path.join('/wiset/Output/SSSL', args.video_name, 'fixations','salmap_f_' + str(0) + '.png'))
     vid_info = get_odvInfo(vid_pth, args.video_name)
 
     # hts_csv = pd.read_csv(hts_pth, header=None)
     classify_res = hts_csv(hts_pth)
 
+    sssl_pth = os.path.join('/wiset/Output/SSSL', args.video_name)
+    events = EventIndex(classify_res)
+    if FrameStore.exists(sssl_pth, 'fixations'):
+        # zero every non event frame of the frame store in place
+        fixations = FrameStore.open(sssl_pth, 'fixations', mode='r+')
+        fixations[~events.mask(len(fixations))] = 0
+        fixations.close()
+
+    if not os.path.isdir(fix_pth):
+        return
     # frame = sorted(list(map(lambda x: int(x.rstrip('.jpg')), os.listdir(os.path.join(vid_pth, 'frame_image')))))
-    fixmap_list = natsort.natsorted(os.listdir(os.path.join(fix_pth)))
+    # an event gated run only writes the event frames, so the frame comes from the name
+    fixmap_list = natsort.natsorted(f for f in os.listdir(os.path.join(fix_pth)) if f.startswith('salmap_f_') and f.endswith('.png'))
+    if not fixmap_list:
+        return
+    _img = imageio.imread(os.path.join(fix_pth, fixmap_list[0]))
     
     print('HTS configuration', args.cfg)
 
     print('*******Class exist frames*******')
     print(classify_res)
 
-    try:
-        for t in classify_res:
-            print('class exist:', t[0], 'to', t[1])
-            for f in range(t[0], t[1]+1):
-                fixmap_list[f] = 0
-    except IndexError:
-        print('*******SSSL fixation map end*******')
-
-    # print('*******remove fixation map list*******')
-    # print(fixmap_list)
-
     for fixmap in tqdm(fixmap_list):
-        if fixmap == 0:
+        if int(fixmap[len('salmap_f_'):-4]) in events:
             pass
         else:
             img_pth = (os.path.join(fix_pth, fixmap))
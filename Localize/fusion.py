@@ -4,10 +4,23 @@ import os
 import argparse
 from tqdm import tqdm
 import cv2
+from concurrent.futures import ThreadPoolExecutor
+from itti import normalize
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), 'SSSL', 'scripts'))
+from frame_store import FrameStore
+from events import load_events
+from profiling import profile, set_video
 
 def parse_args():
     parser = argparse.ArgumentParser()
     parser.add_argument('--video_name', default='in_test2', type=str, help='video path')
+    parser.add_argument('--weights', default=[0.6, 0.4], type=float, nargs=2, metavar=('AUDIO', 'VISUAL'), help='fusion weights of the SSSL and ViNet maps')
+    parser.add_argument('--chunk', default=16, type=int, help='frames normalized per batch')
+    parser.add_argument('--workers', default=None, type=int, help='fusion threads, default cpu count')
+    parser.add_argument('--frame_store', action='store_true', help='write the itti frame store instead of pngs')
+    parser.add_argument('--per_frame', action='store_true', help='fuse frame by frame with N()')
+    parser.add_argument('--cfg', default='balanced_mobile_Audio', type=str, help='hts cfg path of the event gated fixations')
     return parser.parse_args()
 
 def N(image):
@@ -30,25 +43,130 @@ def normalize_map(s_map):
 	norm_s_map = (s_map - np.min(s_map)) / (s_map.max() - s_map.min())
 	return norm_s_map    
 
-def fuse(video_name):
-
-    audio_path = os.path.join('/wiset/Output/SSSL', args.video_name ,'fixations')
-    visual_path = os.path.join('/wiset/Output/ViNet', args.video_name)
+WEIGHTS = (0.6, 0.4)
+FUSION_SHAPE = (606, 1080)
 
-    for frame in tqdm(range(min(len(os.listdir(audio_path)), len(os.listdir(visual_path)))), desc='fusion:'):
 
-        pred_audio_saliency = cv2.imread('/wiset/Output/SSSL/{}/fixations/salmap_f_{}.png'.format(video_name, frame), 0)
-        pred_vinet = cv2.imread('/wiset/Output/ViNet/{}/{:04d}.jpg'.format(video_name, frame+1), 0)
-        pred_vinet = cv2.resize(pred_vinet, (1080, 606))
+SSSL_OUTPUT = '/wiset/Output/SSSL'
+VINET_OUTPUT = '/wiset/Output/ViNet'
+FUSION_OUTPUT = '/wiset/Output/Fusion'
 
-        # print('/wiset/Output/SSSL/{}/fixations/salmap_f_{}.png'.format(video_name, frame), '/wiset/Output/ViNet/{}/{:04d}.jpg'.format(video_name, frame+1))
 
-        output_path = os.path.join('/wiset/Output/Fusion', args.video_name, 'itti')
+def read_visual(video_name, frame, saliency=None):
+    if saliency is not None:
+        pred_vinet = saliency[frame]
+    else:
+        pred_vinet = cv2.imread('/wiset/Output/ViNet/{}/{:04d}.jpg'.format(video_name, frame+1), 0)
+    return cv2.resize(pred_vinet, (FUSION_SHAPE[1], FUSION_SHAPE[0]))
+
+def read_audio(video_name, frame, fixations=None, events=None):
+    if fixations is not None:
+        return np.asarray(fixations[frame])
+    png = '/wiset/Output/SSSL/{}/fixations/salmap_f_{}.png'.format(video_name, frame)
+    pred_audio_saliency = cv2.imread(png, 0)
+    if pred_audio_saliency is None:
+        if events is None or frame in events:
+            raise FileNotFoundError('{} is missing, rerun fixmap2salmap'.format(png))
+        # the event gate skipped this frame
+        pred_audio_saliency = np.zeros(FUSION_SHAPE, np.uint8)
+    return pred_audio_saliency
+
+def fuse_maps(pred_audio_saliency, pred_vinet, weights=WEIGHTS):
+    # (frames, H, W) uint8 SSSL and ViNet maps at FUSION_SHAPE -> float64 itti maps
+    return weights[0]*normalize(pred_audio_saliency) + weights[1]*normalize(pred_vinet)
+
+def to_uint8(pred_itti):
+    # what cv2.imwrite stores for the float64 itti maps
+    return np.clip(np.rint(pred_itti), 0, 255).astype(np.uint8)
+
+def fuse_chunk(video_name, frames, weights, output, fixations=None, saliency=None, events=None):
+    # decode -> normalize -> fuse -> encode for one chunk of frames,
+    # output is the itti png folder or a FrameStore
+    # pool threads start with an empty step stack, so the names carry the stage
+    with profile('fusion/decode', frames=len(frames)):
+        pred_audio_saliency = np.stack([read_audio(video_name, frame, fixations, events) for frame in frames])
+        pred_vinet = np.stack([read_visual(video_name, frame, saliency) for frame in frames])
+
+    with profile('fusion/fuse', frames=len(frames)):
+        pred_itti = fuse_maps(pred_audio_saliency, pred_vinet, weights)
+
+    with profile('fusion/encode', frames=len(frames)):
+        if isinstance(output, FrameStore):
+            output[frames[0]:frames[-1]+1] = to_uint8(pred_itti)
+            return
+        for frame, itti in zip(frames, pred_itti):
+            cv2.imwrite(output + '/{:04d}.png'.format(frame), itti)
+
+def load_stores(video_name):
+    # SSSL (at the fusion size) and ViNet frame stores, None where there is none
+    fixations = saliency = None
+    if os.path.exists(FrameStore.paths(os.path.join(SSSL_OUTPUT, video_name), 'fixations')[1]) and \
+            not FrameStore.exists(os.path.join(SSSL_OUTPUT, video_name), 'fixations'):
+        raise RuntimeError('the fixations of {} are incomplete, rerun fixmap2salmap'.format(video_name))
+    if FrameStore.exists(os.path.join(SSSL_OUTPUT, video_name), 'fixations'):
+        fixations = FrameStore.open(os.path.join(SSSL_OUTPUT, video_name), 'fixations')
+        if fixations.shape != FUSION_SHAPE:
+            fixations = None
+    if FrameStore.exists(os.path.join(VINET_OUTPUT, video_name), 'saliency'):
+        saliency = FrameStore.open(os.path.join(VINET_OUTPUT, video_name), 'saliency')
+    return fixations, saliency
+
+def n_frames(video_name, fixations=None, saliency=None):
+    visual_path = os.path.join(VINET_OUTPUT, video_name)
+
+    if saliency is not None:
+        n_visual = len(saliency)
+    else:
+        n_visual = len([f for f in os.listdir(visual_path) if f.endswith('.jpg')])
+
+    # event gated runs only write pngs for event frames (read_audio gives the others as zero),
+    # the frame store holds every frame
+    if fixations is None:
+        return n_visual
+    return min(len(fixations), n_visual)
+
+def fuse(video_name, weights=WEIGHTS, chunk=16, workers=None, frame_store=False, cfg='balanced_mobile_Audio'):
+    output_path = os.path.join(FUSION_OUTPUT, video_name, 'itti')
+
+    fixations, saliency = load_stores(video_name)
+    # the pngs of an event gated run leave out the frames outside the events
+    events = load_events(video_name, cfg) if fixations is None else None
+    frames = list(range(n_frames(video_name, fixations, saliency)))
+    chunks = [frames[i:i+chunk] for i in range(0, len(frames), chunk)]
+
+    if frame_store:
+        output = FrameStore.create(os.path.join(FUSION_OUTPUT, video_name), 'itti', len(frames), FUSION_SHAPE,
+                                   stage='fusion', video=video_name, weights=list(weights))
+    else:
+        os.makedirs(output_path, exist_ok=True)
+        FrameStore.remove(os.path.join(FUSION_OUTPUT, video_name), 'itti')
+        output = output_path
+
+    # cv2 and scipy release the GIL, so chunks run in parallel threads
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        jobs = [pool.submit(fuse_chunk, video_name, c, weights, output, fixations, saliency, events) for c in chunks]
+        for job in tqdm(jobs, desc='fusion:'):
+            job.result()
+
+    if frame_store:
+        output.close()
+
+def fuse_per_frame(video_name, weights=WEIGHTS, cfg='balanced_mobile_Audio'):
+
+    output_path = os.path.join(FUSION_OUTPUT, video_name, 'itti')
+    FrameStore.remove(os.path.join(FUSION_OUTPUT, video_name), 'itti')
+    fixations, saliency = load_stores(video_name)
+    events = load_events(video_name, cfg) if fixations is None else None
+
+    for frame in tqdm(range(n_frames(video_name, fixations, saliency)), desc='fusion:'):
+
+        pred_audio_saliency = read_audio(video_name, frame, fixations, events)
+        pred_vinet = read_visual(video_name, frame, saliency)
 
         if not os.path.exists(output_path):
             os.makedirs(output_path)
 
-        pred_itti = 0.6*N(pred_audio_saliency) + 0.4*N(pred_vinet)
+        pred_itti = weights[0]*N(pred_audio_saliency) + weights[1]*N(pred_vinet)
 
         p = output_path + '/{:04d}.png'.format(frame)
 
@@ -56,8 +174,13 @@ def fuse(video_name):
 
 
 def run(args):
-    fuse(args.video_name)
+    set_video(args.video_name)
+    with profile('fusion'):
+        if args.per_frame:
+            fuse_per_frame(args.video_name, args.weights, args.cfg)
+        else:
+            fuse(args.video_name, args.weights, args.chunk, args.workers, args.frame_store, args.cfg)
 
 if __name__ == "__main__":              
     args = parse_args()
-    run(args)
\ No newline at end of file
+    run(args)
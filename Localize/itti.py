@@ -0,0 +1,109 @@
+import numpy as np
+import cv2
+
+# Itti-Koch map normalization N() of fusion.py, for a (H, W) map or a
+# (frames, H, W) stack.
+#
+# N() finds local maxima with scipy's maximum_filter over a (H/10, W)
+# window. maximum_filter's reflect border never reaches outside a window
+# that is clipped at the border, so the filter is computed here as two 1D
+# running maxima over clipped windows:
+#   - van Herk / Gil-Werman along the rows: a forward and a backward
+#     running max inside blocks of `size`, 3 comparisons per pixel
+#     whatever the window size,
+#   - a prefix / suffix max along the columns, since a full width window
+#     always starts at the first column or ends at the last one.
+
+M = 8.
+
+
+def _sub(ndim, axis, index):
+    idx = [slice(None)] * ndim
+    idx[axis] = index
+    return tuple(idx)
+
+
+def _prefix_suffix_max(x, size, axis):
+    # size >= n: window x covers [0, x + hi] when x <= lo, else [x - lo, n - 1]
+    x = np.moveaxis(x, axis, -1)
+    n = x.shape[-1]
+    lo = size // 2
+    hi = size - 1 - lo
+    out = np.empty_like(x)
+
+    last = min(lo, n - 1) + 1
+    k = max(0, n - hi)
+    prefix = np.maximum.accumulate(x, axis=-1)
+    out[..., :k] = prefix[..., hi:]
+    out[..., k:last] = prefix[..., -1:]
+
+    if last < n:
+        # suffix max from a reversed contiguous copy, strided accumulate is slow
+        suffix = np.maximum.accumulate(np.ascontiguousarray(x[..., ::-1]), axis=-1)
+        out[..., last:] = suffix[..., lo:n - 1][..., ::-1]
+
+    return np.moveaxis(out, -1, axis)
+
+
+def _van_herk_max(x, size, axis):
+    n = x.shape[axis]
+    lo = size // 2
+    fill = np.iinfo(x.dtype).min if np.issubdtype(x.dtype, np.integer) else -np.inf
+    blocks = -(-(n + size - 1) // size)
+
+    # window i covers padded [i, i + size - 1], the fill never wins the max
+    shape = x.shape[:axis] + (blocks * size,) + x.shape[axis + 1:]
+    g = np.full(shape, fill, dtype=x.dtype)
+    g[_sub(x.ndim, axis, slice(lo, lo + n))] = x
+
+    g = g.reshape(x.shape[:axis] + (blocks, size) + x.shape[axis + 1:])
+    h = g.copy()
+    at = lambda a, j: a[_sub(a.ndim, axis + 1, j)]
+    for j in range(1, size):
+        np.maximum(at(g, j), at(g, j - 1), out=at(g, j))
+        np.maximum(at(h, size - 1 - j), at(h, size - j), out=at(h, size - 1 - j))
+
+    g, h = g.reshape(shape), h.reshape(shape)
+    return np.maximum(h[_sub(x.ndim, axis, slice(0, n))], g[_sub(x.ndim, axis, slice(size - 1, size - 1 + n))])
+
+
+def running_max(x, size, axis=-1):
+    ''' maximum_filter1d(x, size, axis) with the default reflect mode '''
+    x = np.asarray(x)
+    axis = axis % x.ndim
+    if size <= 1:
+        return x.copy()
+    if size >= x.shape[axis]:
+        return _prefix_suffix_max(x, size, axis)
+    return _van_herk_max(x, size, axis)
+
+
+def local_max(maps, rows, cols):
+    ''' maximum_filter(maps, size=(1, rows, cols)) of a (frames, H, W) stack '''
+    return running_max(running_max(maps, rows, axis=1), cols, axis=2)
+
+
+def scale_abs(maps):
+    # cv2.convertScaleAbs(map, alpha=M/map.max()) per frame, empty frames stay 0
+    with np.errstate(divide='ignore'):
+        alpha = M / maps.max(axis=(1, 2))
+    return np.stack([cv2.convertScaleAbs(m, alpha=a, beta=0.) for m, a in zip(maps, alpha)])
+
+
+def normalize(maps):
+    ''' N() of a (H, W) map or of every frame of a (frames, H, W) stack '''
+    maps = np.asarray(maps)
+    single = maps.ndim == 2
+    if single:
+        maps = maps[None]
+
+    image = scale_abs(maps)
+    _, w, h = image.shape
+    maxima = image == local_max(image, int(w/10), h)
+
+    # maxima count and the sum of their values from the same mask
+    mnum = np.count_nonzero(maxima, axis=(1, 2))
+    mbar = np.multiply(maxima, image).sum(axis=(1, 2), dtype=np.int64) / mnum
+    out = image * ((M-mbar)**2)[:, None, None]
+
+    return out[0] if single else out
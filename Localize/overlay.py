@@ -2,47 +2,112 @@
 # 알파 블렌딩 (blending_alpha.py)
 
 import os
+import subprocess
 import cv2
 import numpy as np
 import natsort
 import argparse
 from tqdm import tqdm
 import glob
+import sys
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), 'SSSL', 'scripts'))
+from frame_store import FrameStore
+from video_frames import Cursor, frame_source, video_source
+from profiling import profile, set_video
 
 alpha = 0.5 # 합성에 사용할 알파 값
+OVERLAY_SIZE = (1080, 606)
 
 
 def parse_args():
     parser = argparse.ArgumentParser()
     parser.add_argument('--video_name', type=str, help='name of data')
+    parser.add_argument('--fps', default=30, type=int, help='output frame rate')
+    parser.add_argument('--alpha', default=alpha, type=float, help='weight of the video frame in the blend')
+    parser.add_argument('--frames', default=None, type=str, help='frame folder or video file, default the frame_image jpgs or else the input mp4')
+    parser.add_argument('--write_jpg', action='store_true', help='also write the overlay jpgs (debug)')
     return parser.parse_args()
 
 
+def blend(frame_img, fusion_img, alpha=alpha):
+    # uint8 alpha blending of a BGR frame and a fusion map (gray or BGR)
+    frame_img = cv2.resize(frame_img, OVERLAY_SIZE)
+    if fusion_img.ndim == 2:
+        fusion_img = cv2.cvtColor(fusion_img, cv2.COLOR_GRAY2BGR)
+    return cv2.addWeighted(frame_img, alpha, fusion_img, 1-alpha, 0)
+
+
+class VideoWriter:
+    ''' raw BGR frames piped into one ffmpeg process, muxed with the audio track of audio_path '''
+    def __init__(self, out_path, audio_path=None, size=OVERLAY_SIZE, fps=30, vcodec='mpeg4'):
+        self.size = size
+        cmd = ['ffmpeg', '-y', '-loglevel', 'error',
+               '-f', 'rawvideo', '-pix_fmt', 'bgr24', '-s', '{}x{}'.format(*size), '-r', str(fps), '-i', '-']
+        if audio_path is not None:
+            cmd += ['-i', audio_path, '-map', '0:v:0', '-map', '1:a:0?', '-c:a', 'copy']
+        cmd += ['-vcodec', vcodec, out_path]
+        self.proc = subprocess.Popen(cmd, stdin=subprocess.PIPE)
+
+    def write(self, frame):
+        if (frame.shape[1], frame.shape[0]) != self.size or frame.dtype != np.uint8:
+            raise ValueError('expected uint8 frames of size {}, got {} {}'.format(self.size, frame.shape, frame.dtype))
+        self.proc.stdin.write(np.ascontiguousarray(frame).tobytes())
+
+    def close(self):
+        self.proc.stdin.close()
+        if self.proc.wait() != 0:
+            raise RuntimeError('ffmpeg exited with code {}'.format(self.proc.returncode))
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
 if __name__ == '__main__':
     args = parse_args()
-    frame_dir = os.path.join('/wiset/Input', args.video_name, 'frame_image')
-    map_dir = os.path.join('/wiset/Output/Fusion', args.video_name, 'itti') 
+    source = frame_source(args.frames) if args.frames else video_source(args.video_name)
+    map_dir = os.path.join('/wiset/Output/Fusion', args.video_name, 'itti')
     out_dir = os.path.join('/wiset/Output/Final_Result', args.video_name, 'Overlay')
-    
-    map_list = natsort.natsorted(os.listdir(os.path.join(map_dir)))
-
-    if '.ipynb_checkpoints' in map_list:
-        map_list.remove('.ipynb_checkpoints')
-    
-    for idx in tqdm(range(len(map_list)), desc="Mapping"):
-
-        frame_img = cv2.imread(frame_dir + '/{0:04d}.jpg'.format(idx+1))
-        fusion_img = cv2.imread(map_dir + '/{:04d}.png'.format(idx))
-        
-        frame_img = cv2.resize(frame_img, (1080, 606))
-        
-        blended = frame_img * alpha + fusion_img * (1-alpha)
-        blended = blended.astype(np.uint8)
-
-        respath = out_dir
-        if not os.path.exists(respath):
-            os.mkdir(respath)
-
-        cv2.imwrite(respath + '/{}.jpg'.format(idx), blended)
-        cv2.waitKey(0)
-        cv2.destroyAllWindows()
+
+    # fusion maps from the itti frame store when there is one, else from the pngs
+    itti = None
+    if FrameStore.exists(os.path.dirname(map_dir), 'itti'):
+        itti = FrameStore.open(os.path.dirname(map_dir), 'itti')
+        map_list = range(len(itti))
+    else:
+        map_list = natsort.natsorted(os.listdir(os.path.join(map_dir)))
+
+        if '.ipynb_checkpoints' in map_list:
+            map_list.remove('.ipynb_checkpoints')
+
+    if args.write_jpg and not os.path.exists(out_dir):
+        os.makedirs(out_dir)
+
+    # overlay frames go straight to the encoder, audio is taken from the source mp4
+    video_path = os.path.join('/wiset/Output/Final_Result', args.video_name, args.video_name + '.mp4')
+    audio_path = os.path.join('/wiset/Input', args.video_name, args.video_name + '.mp4')
+
+    # video frames in order, already at the overlay size
+    frame_at = Cursor(source.read(0, len(map_list), OVERLAY_SIZE))
+
+    set_video(args.video_name)
+    with profile('overlay', frames=len(map_list)), VideoWriter(video_path, audio_path, fps=args.fps) as writer:
+        for idx in tqdm(range(len(map_list)), desc="Mapping"):
+
+            with profile('decode', frames=1):
+                frame_img = frame_at(idx)
+                if itti is not None:
+                    fusion_img = itti[idx]
+                else:
+                    fusion_img = cv2.imread(map_dir + '/{:04d}.png'.format(idx))
+
+            with profile('blend', frames=1):
+                blended = blend(frame_img, fusion_img, args.alpha)
+            with profile('encode', frames=1):
+                writer.write(blended)
+
+                if args.write_jpg:
+                    cv2.imwrite(out_dir + '/{}.jpg'.format(idx), blended)
@@ -0,0 +1,43 @@
+import os
+
+from .runner import Pipeline, Stage
+from .stages import SaliencyStage, SmoothStage, FixationStage, ViNetStage, FusionStage, OverlayStage
+
+# In-process version of sssl.sh: one python process, models and modules
+# imported once, frames handed between stages as numpy arrays.
+#
+#   saliency -> [smooth] -> fixation --\
+#                                       fusion -> overlay -> <video>.mp4
+#                           vinet -----/
+#
+# debug=True also writes every intermediate to the /wiset/Output folders the
+# scripts use.
+
+OUTPUT = '/wiset/Output'
+
+
+def build(video_name, debug=False, maxsize=4, chunk=16, mcsr='numpy', smoothed=False, window=5, linear_u=False,
+          blur_scale=1, blur_method='auto', cfg='balanced_mobile_Audio', event_gate=True, weights=(0.6, 0.4),
+          vinet_args=None, fps=30, alpha=0.5):
+    out = lambda *p: os.path.join(OUTPUT, *p) if debug else None
+    sssl_dir = out('SSSL', video_name)
+
+    pipeline = Pipeline(maxsize)
+    pred = pipeline.add(SaliencyStage(video_name, mcsr, debug_dir=sssl_dir))
+    # the scripts cluster the raw predictions, sssl_fixation's _pred is a side output
+    if smoothed or debug:
+        smooth = pipeline.add(SmoothStage(window, linear_u, debug_dir=sssl_dir), pred)
+        if smoothed:
+            pred = smooth
+
+    audio = pipeline.add(FixationStage(video_name, chunk, blur_scale, blur_method, cfg, event_gate, debug_dir=sssl_dir), pred)
+    visual = pipeline.add(ViNetStage(video_name, chunk, vinet_args, debug_dir=out('ViNet', video_name)))
+    fused = pipeline.add(FusionStage(weights, chunk, debug_dir=out('Fusion', video_name, 'itti')), audio, visual)
+
+    out_path = os.path.join(OUTPUT, 'Final_Result', video_name, video_name + '.mp4')
+    pipeline.add(OverlayStage(video_name, out_path, fps, alpha, debug_dir=out('Final_Result', video_name, 'Overlay')), fused)
+    return pipeline
+
+
+def run_video(video_name, **kwargs):
+    build(video_name, **kwargs).run()
@@ -0,0 +1,44 @@
+import argparse
+
+from . import run_video
+from .modules import sssl
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(prog='python -m pipeline')
+    parser.add_argument('--video_name', default='in_test2', type=str, help='video path')
+    parser.add_argument('--debug', action='store_true', help='also write every intermediate to /wiset/Output')
+    parser.add_argument('--maxsize', default=4, type=int, help='chunks buffered between two stages')
+    parser.add_argument('--chunk', default=16, type=int, help='frames per chunk')
+    parser.add_argument('--mcsr', default='numpy', choices=['numpy', 'octave'], help='numpy: compute saliency in-process, octave: read _saliency.mat from mcsr/Main.m')
+    parser.add_argument('--smoothed', action='store_true', help='cluster the sssl_fixation smoothed predictions')
+    parser.add_argument('--window', default=5, type=int, help='frames in the moving-average window')
+    parser.add_argument('--linear_u', action='store_true', help='average 2dmu linearly instead of on the circle')
+    parser.add_argument('--blur_scale', default=1, type=int, help='blur fixation maps at 1/blur_scale resolution')
+    parser.add_argument('--blur_method', default='auto', choices=['auto', 'cv2', 'fft', 'iir'], help='gaussian blur implementation')
+    parser.add_argument('--cfg', default='balanced_mobile_Audio', type=str, help='hts cfg path')
+    parser.add_argument('--no_event_gate', action='store_true', help='generate fixations for every frame, not only HTS event frames')
+    parser.add_argument('--weights', default=[0.6, 0.4], type=float, nargs=2, metavar=('AUDIO', 'VISUAL'), help='fusion weights of the SSSL and ViNet maps')
+    parser.add_argument('--file_weight', default="/wiset/Localize/ViNet/saved_models/ViNet_DHF1K.pt", type=str)
+    parser.add_argument('--clip_size', default=32, type=int)
+    parser.add_argument('--batch_size', default=4, type=int, help='ViNet sliding-window clips per forward')
+    parser.add_argument('--stream', action='store_true', help='ViNet reuses the backbone activations of the previous clips')
+    parser.add_argument('--keyframe_stride', default=1, type=int, help='ViNet runs every keyframe_stride frames, the maps in between are rebuilt')
+    parser.add_argument('--interp', default='linear', choices=['linear', 'flow'], help='how the ViNet maps between keyframes are rebuilt')
+    parser.add_argument('--scene_thresh', default=None, type=float, help='also key the frames around a cut, mean absolute frame difference 0-255')
+    parser.add_argument('--decode_workers', default=2, type=int, help='ViNet frame decoding processes, 0 decodes in the model loop')
+    parser.add_argument('--no_draft', action='store_true', help='decode the ViNet jpgs at full scale before the resize')
+    parser.add_argument('--fps', default=30, type=int, help='output frame rate')
+    parser.add_argument('--alpha', default=0.5, type=float, help='weight of the video frame in the overlay blend')
+    return parser.parse_args()
+
+
+if __name__ == '__main__':
+    args = parse_args()
+    sssl('profiling').set_video(args.video_name)
+    run_video(args.video_name, debug=args.debug, maxsize=args.maxsize, chunk=args.chunk, mcsr=args.mcsr,
+              smoothed=args.smoothed, window=args.window, linear_u=args.linear_u, blur_scale=args.blur_scale,
+              blur_method=args.blur_method, cfg=args.cfg, event_gate=not args.no_event_gate, weights=args.weights,
+              vinet_args=dict(file_weight=args.file_weight, clip_size=args.clip_size, batch_size=args.batch_size,
+                              stream=args.stream, keyframe_stride=args.keyframe_stride, interp=args.interp,
+                              scene_thresh=args.scene_thresh, workers=args.decode_workers, no_draft=args.no_draft), fps=args.fps, alpha=args.alpha)
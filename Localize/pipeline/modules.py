@@ -0,0 +1,39 @@
+import os
+import sys
+import importlib
+import threading
+
+LOCALIZE = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+SSSL_SCRIPTS = os.path.join(LOCALIZE, 'SSSL', 'scripts')
+VINET_SCRIPTS = os.path.join(LOCALIZE, 'ViNet', 'scripts')
+
+# SSSL/scripts and ViNet/scripts both have a top level `utils` module. Each
+# scripts dir is put first on sys.path only while its modules are imported,
+# and the clashing names are dropped from sys.modules again afterwards.
+# Stage threads import at the same time, one swap at a time.
+CLASHING = ('utils',)
+_lock = threading.RLock()
+
+if LOCALIZE not in sys.path:
+    sys.path.append(LOCALIZE)
+
+
+def import_from(path, name):
+    with _lock:
+        saved = {k: sys.modules.pop(k) for k in CLASHING if k in sys.modules}
+        sys.path.insert(0, path)
+        try:
+            return importlib.import_module(name)
+        finally:
+            sys.path.remove(path)
+            for k in CLASHING:
+                sys.modules.pop(k, None)
+            sys.modules.update(saved)
+
+
+def sssl(name):
+    return import_from(SSSL_SCRIPTS, name)
+
+
+def vinet(name):
+    return import_from(VINET_SCRIPTS, name)
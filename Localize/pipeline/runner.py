@@ -0,0 +1,97 @@
+import queue
+import threading
+
+from .modules import sssl
+
+# Every stage runs in its own thread and hands items to the stages it feeds
+# through bounded queues, so a slow consumer blocks its producer instead of
+# letting frames pile up in memory. The first failing stage stops the whole
+# pipeline and its exception is raised again from Pipeline.run. With
+# WISET_PROFILE set, each stage thread is a profiling step (its wall time
+# includes the time spent waiting on its inputs and outputs).
+
+END = object()
+POLL = 0.1
+
+
+class Stage:
+    ''' one step of the pipeline, __call__(*inputs) is a generator over the input streams '''
+    name = 'stage'
+
+    def __call__(self, *inputs):
+        raise NotImplementedError
+
+
+class Pipeline:
+    def __init__(self, maxsize=4):
+        self.maxsize = maxsize
+        self.nodes = []
+        self.stop = threading.Event()
+        self.errors = []
+
+    def add(self, stage, *inputs):
+        ''' add stage, fed by the outputs of already added nodes, and return its node '''
+        for node in inputs:
+            if not 0 <= node < len(self.nodes):
+                raise ValueError('{} is fed by unknown node {}'.format(stage.name, node))
+        self.nodes.append((stage, inputs))
+        return len(self.nodes) - 1
+
+    def put(self, q, item):
+        while not self.stop.is_set():
+            try:
+                q.put(item, timeout=POLL)
+                return True
+            except queue.Full:
+                pass
+        return False
+
+    def stream(self, q):
+        while True:
+            try:
+                item = q.get(timeout=POLL)
+            except queue.Empty:
+                if self.stop.is_set():
+                    return
+                continue
+            if item is END:
+                return
+            yield item
+
+    def work(self, stage, inputs, outputs):
+        streams = [self.stream(q) for q in inputs]
+        try:
+            with sssl('profiling').profile(stage.name):
+                for item in stage(*streams):
+                    if not all(self.put(q, item) for q in outputs):
+                        return
+        except BaseException as e:
+            self.errors.append((stage.name, e))
+            self.stop.set()
+        finally:
+            for q in outputs:
+                self.put(q, END)
+            # a stage may stop before its inputs end, keep them flowing
+            for s in streams:
+                for _ in s:
+                    pass
+
+    def run(self):
+        inputs = [[] for _ in self.nodes]
+        outputs = [[] for _ in self.nodes]
+        for node, (stage, feeds) in enumerate(self.nodes):
+            for feed in feeds:
+                q = queue.Queue(self.maxsize)
+                outputs[feed].append(q)
+                inputs[node].append(q)
+
+        threads = [threading.Thread(target=self.work, args=(stage, inputs[node], outputs[node]), name=stage.name, daemon=True)
+                   for node, (stage, _) in enumerate(self.nodes)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+
+        if self.errors:
+            name, e = self.errors[0]
+            raise RuntimeError('pipeline stage {} failed'.format(name)) from e
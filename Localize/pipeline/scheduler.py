@@ -0,0 +1,198 @@
+import os
+import sys
+import shutil
+import argparse
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+
+from .modules import LOCALIZE
+import stage_cache
+
+# sssl.sh + infer.sh for a batch of videos, as a DAG of per-video jobs:
+#
+#   wav -> hts ------------------------\
+#      \-> main -> sssl_fixation        fixmap2salmap --\
+#           \--------------------------/                 fusion -> overlay
+#   vinet ----------------------------------------------/
+#
+# Every stage has its own pool of job slots. A job runs its step scripts as
+# subprocesses through stage_cache, so a CPU stage with n slots keeps n
+# processes busy, while hts and vinet have one slot: a single model worker
+# on the GPU, and the HTS scripts share /wiset/hts/Data. Ready jobs of earlier
+# videos are started first and at most max_videos videos are in flight, which
+# bounds the intermediates on disk and in memory.
+
+INPUT = '/wiset/Input'
+OUTPUT = '/wiset/Output'
+HTS = '/wiset/hts'
+CPUS = os.cpu_count() or 1
+
+POOLS = {'wav': 2, 'hts': 1, 'main': CPUS, 'sssl_fixation': CPUS, 'fixmap2salmap': CPUS,
+         'vinet': 1, 'fusion': max(1, CPUS // 4), 'overlay': 2}
+
+Step = namedtuple('Step', ['stage', 'cmd', 'inputs', 'code', 'outputs'])
+Job = namedtuple('Job', ['video', 'stage', 'deps', 'steps', 'cleanup'])
+
+
+def video_jobs(video, cfg='balanced_mobile_Audio'):
+    ''' jobs of one video in dependency order, the steps are those of sssl.sh (PIPELINE=0) and infer.sh '''
+    py = sys.executable
+    L = LOCALIZE
+    scripts = os.path.join(L, 'SSSL', 'scripts')
+    infer = os.path.join(HTS, 'Infer_scripts')
+    hts_model = os.path.join(HTS, 'HTS-Audio-Transformer')
+    vid_in = os.path.join(INPUT, video)
+    sssl = os.path.join(OUTPUT, 'SSSL', video)
+    vinet = os.path.join(OUTPUT, 'ViNet', video)
+    fusion = os.path.join(OUTPUT, 'Fusion', video)
+    wav = os.path.join(vid_in, video + '.wav')
+    mp4 = os.path.join(vid_in, video + '.mp4')
+    frames = os.path.join(vid_in, 'frame_image')
+    data = os.path.join(HTS, 'Data')
+    hts_result = os.path.join(HTS, 'Result')
+    events = os.path.join(hts_result, cfg, 'Final_' + video + '.csv')
+    pred = [os.path.join(sssl, 'pred.npy'), os.path.join(sssl, 'pred_frames.npy')]
+    fixations = [os.path.join(sssl, 'fixations.npy'), os.path.join(sssl, 'fixations.json')]
+    saliency = [os.path.join(vinet, 'saliency.npy'), os.path.join(vinet, 'saliency.json')]
+    itti = [os.path.join(fusion, 'itti.npy'), os.path.join(fusion, 'itti.json')]
+    frame_store = os.path.join(scripts, 'frame_store.py')
+    video_frames = os.path.join(scripts, 'video_frames.py')
+
+    def job(stage, deps, *steps, cleanup=()):
+        return Job(video, stage, deps, steps, cleanup)
+
+    return [
+        job('wav', (),
+            Step('wav', ['ffmpeg', '-i', os.path.join(vid_in, video + '.360'), '-map', '0:6', wav],
+                 [os.path.join(vid_in, video + '.360')], [], [wav])),
+        job('hts', ('wav',),
+            Step('segments', ['bash', '-c', 'mkdir -p {0} && ffmpeg -i {1} -f segment -segment_time 1 -c copy {0}/{2}_%04d.wav'.format(data, wav, video)],
+                 [wav], [], [data]),
+            Step('esc50', [py, os.path.join(infer, 'esc50.py'), '--video_name', video],
+                 [data], [os.path.join(infer, 'esc50.py')], [os.path.join(data, 'esc-50-data.npy')]),
+            Step('hts', [py, os.path.join(hts_model, 'main.py'), 'test'],
+                 [os.path.join(data, 'esc-50-data.npy')],
+                 [os.path.join(hts_model, p) for p in ('main.py', 'config.py', 'sed_model.py', 'data_generator.py', 'utils.py', 'model')],
+                 [os.path.join(hts_result, video + '.csv')]),
+            Step('detect_nonsilent', [py, os.path.join(infer, 'detect_nonsilent.py'), '--video_name', video],
+                 [os.path.join(hts_result, video + '.csv'), data], [os.path.join(infer, 'detect_nonsilent.py')],
+                 [os.path.join(hts_result, 'Final_' + video + '.csv')]),
+            cleanup=(data,)),
+        job('main', ('wav',),
+            Step('main', [py, os.path.join(scripts, 'main.py'), '--video_name', video],
+                 [wav], [os.path.join(scripts, p) for p in ('main.py', 'mcsr.py', 'utils.py', 'pred_store.py')], pred)),
+        job('sssl_fixation', ('main',),
+            Step('sssl_fixation', [py, os.path.join(L, 'sssl_fixation.py'), '--video_name', video],
+                 pred, [os.path.join(L, 'sssl_fixation.py'), os.path.join(scripts, 'pred_store.py')],
+                 [os.path.join(sssl, '_pred.npy'), os.path.join(sssl, '_pred_frames.npy')])),
+        job('fixmap2salmap', ('main', 'hts'),
+            Step('fixmap2salmap', [py, os.path.join(scripts, 'fixmap2salmap.py'), '--video_name', video, '--cfg', cfg, '--frame_store'],
+                 pred + [mp4, events], [scripts], fixations)),
+        job('vinet', (),
+            Step('generate_result', [py, os.path.join(L, 'ViNet', 'scripts', 'generate_result.py'), '--video_name', video, '--frame_store'],
+                 [frames, mp4], [os.path.join(L, 'ViNet', 'scripts'), frame_store, video_frames, os.path.join(L, 'ViNet', 'saved_models', 'ViNet_DHF1K.pt')],
+                 saliency)),
+        job('fusion', ('fixmap2salmap', 'vinet'),
+            Step('fusion', [py, os.path.join(L, 'fusion.py'), '--video_name', video, '--frame_store'],
+                 fixations + saliency, [os.path.join(L, 'fusion.py'), os.path.join(L, 'itti.py'), frame_store], itti)),
+        job('overlay', ('fusion',),
+            Step('overlay', [py, os.path.join(L, 'overlay.py'), '--video_name', video],
+                 itti + [frames, mp4], [os.path.join(L, 'overlay.py'), frame_store, video_frames],
+                 [os.path.join(OUTPUT, 'Final_Result', video, video + '.mp4')])),
+    ]
+
+
+def run_job(job, cache=stage_cache.CACHE, force=False):
+    for d in ('SSSL', 'ViNet', 'Fusion', 'Final_Result'):
+        os.makedirs(os.path.join(OUTPUT, d, job.video), exist_ok=True)
+    # labels the profiling report (WISET_PROFILE) of scripts that do not know their video
+    env = dict(os.environ, WISET_PROFILE_VIDEO=job.video)
+    try:
+        for s in job.steps:
+            stage_cache.run(s.stage, s.cmd, s.inputs, s.code, (), s.outputs, cache, force, env)
+    finally:
+        for path in job.cleanup:
+            shutil.rmtree(path, ignore_errors=True)
+
+
+class Scheduler:
+    def __init__(self, videos, pools=None, max_videos=4, cfg='balanced_mobile_Audio', cache=stage_cache.CACHE, force=False):
+        self.videos = list(videos)
+        self.pools = dict(POOLS, **(pools or {}))
+        if self.pools['hts'] != 1:
+            raise ValueError('the hts scripts share /wiset/hts/Data, its pool must have one slot')
+        self.max_videos = max_videos
+        self.cache, self.force = cache, force
+        self.jobs = {v: video_jobs(v, cfg) for v in self.videos}
+
+    def run(self):
+        ''' run every job, {video: error} of the videos that failed '''
+        executors = {stage: ThreadPoolExecutor(n, thread_name_prefix=stage) for stage, n in self.pools.items()}
+        done = {v: set() for v in self.videos}
+        started = {v: set() for v in self.videos}
+        running = {}
+        busy = {stage: 0 for stage in self.pools}
+        errors = {}
+
+        def finished(v):
+            return v in errors or len(done[v]) == len(self.jobs[v])
+
+        try:
+            while True:
+                # the first max_videos unfinished videos may start jobs, earlier videos first
+                in_flight = [v for v in self.videos if not finished(v)][:self.max_videos]
+                for v in in_flight:
+                    for job in self.jobs[v]:
+                        if (job.stage in started[v] or busy[job.stage] >= self.pools[job.stage]
+                                or not all(d in done[v] for d in job.deps)):
+                            continue
+                        started[v].add(job.stage)
+                        busy[job.stage] += 1
+                        running[executors[job.stage].submit(run_job, job, self.cache, self.force)] = job
+
+                if not running:
+                    break
+                finished_jobs, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in finished_jobs:
+                    job = running.pop(future)
+                    busy[job.stage] -= 1
+                    if future.exception() is not None:
+                        # the other videos go on, this one starts no further jobs
+                        errors.setdefault(job.video, '{}: {!r}'.format(job.stage, future.exception()))
+                        print('[scheduler] {} {} failed: {!r}'.format(job.video, job.stage, future.exception()), flush=True)
+                    else:
+                        done[job.video].add(job.stage)
+                        print('[scheduler] {} {} done'.format(job.video, job.stage), flush=True)
+        finally:
+            for ex in executors.values():
+                ex.shutdown(wait=True)
+        return errors
+
+
+def parse_pools(items):
+    pools = {}
+    for item in items:
+        stage, _, n = item.partition('=')
+        if stage not in POOLS or not n.isdigit() or int(n) < 1:
+            raise argparse.ArgumentTypeError('expected STAGE=N with STAGE in {}, got {}'.format(sorted(POOLS), item))
+        pools[stage] = int(n)
+    return pools
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(prog='python -m pipeline.scheduler')
+    parser.add_argument('--videos', required=True, nargs='+', help='video names in /wiset/Input')
+    parser.add_argument('--pool', default=[], action='append', metavar='STAGE=N', help='job slots of a stage, default {}'.format(POOLS))
+    parser.add_argument('--max_videos', default=4, type=int, help='videos in flight at once')
+    parser.add_argument('--cfg', default='balanced_mobile_Audio', type=str, help='hts cfg path')
+    parser.add_argument('--no_cache', action='store_true', help='run every step even on a stage cache hit')
+    return parser.parse_args()
+
+
+if __name__ == '__main__':
+    args = parse_args()
+    scheduler = Scheduler(args.videos, parse_pools(args.pool), args.max_videos, args.cfg, force=args.no_cache)
+    errors = scheduler.run()
+    for video, error in errors.items():
+        print('{} failed at {}'.format(video, error))
+    sys.exit(1 if errors else 0)
@@ -0,0 +1,188 @@
+import os
+import argparse
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+
+from .runner import Pipeline, Stage
+from .stages import FPS, INPUT, ODV_SHAPE, FixationStage, ViNetStage, FusionStage, OverlayStage, frame_source
+from .modules import sssl
+
+# One long video split into time shards that worker processes run in
+# parallel, stitched into the same itti frame store and mp4 as a sequential
+# run of the pipeline.
+#   - shards start and stop on whole seconds, so an mcsr second or a 1 s HTS
+#     segment never straddles a seam (HTS itself runs once per video)
+#   - saliency: mcsr seconds are independent, every shard fills its rows of
+#     the shared pred.npy
+#   - smoothing (--smoothed): a shard smooths its frames plus window//2 frames
+#     of margin on each side
+#   - ViNet: a shard warms the sliding window up on the clip_size-1 frames
+#     before it
+#   - fixations and fusion are per frame and need no margin
+# The overlay is encoded in one pass over the stitched itti store.
+
+OUTPUT = '/wiset/Output'
+
+
+def plan(n_frames, n_shards, fps=FPS):
+    ''' [(start, stop)] frame ranges on whole seconds, at most n_shards of them '''
+    seconds = -(-n_frames // fps)
+    per = -(-seconds // max(n_shards, 1))
+    return [(s * fps, min((s + per) * fps, n_frames)) for s in range(0, seconds, per)]
+
+
+class PredSource(Stage):
+    name = 'pred'
+
+    def __init__(self, pred):
+        self.pred = pred
+
+    def __call__(self):
+        yield self.pred
+
+
+class StoreSource(Stage):
+    ''' (first frame, maps) chunks of a FrameStore '''
+    name = 'read_store'
+
+    def __init__(self, path, store_name, chunk=16):
+        self.path, self.store_name, self.chunk = path, store_name, chunk
+
+    def __call__(self):
+        store = sssl('frame_store').FrameStore.open(self.path, self.store_name)
+        for f in range(0, len(store), self.chunk):
+            yield f, store[f:f + self.chunk]
+
+
+class StoreSink(Stage):
+    ''' writes the (first frame, maps) chunks into an existing FrameStore '''
+    name = 'write_store'
+
+    def __init__(self, path, store_name):
+        self.path, self.store_name = path, store_name
+
+    def __call__(self, chunks):
+        store = sssl('frame_store').FrameStore.open(self.path, self.store_name, 'r+')
+        for f, maps in chunks:
+            store[f:f + len(maps)] = maps
+            yield f
+        store.maps.flush()
+
+
+def saliency_shard(video_name, seconds):
+    ''' mcsr saliency of the seconds [start, stop) into the rows of pred.npy '''
+    sssl('profiling').set_video(video_name)
+    mcsr = sssl('mcsr')
+    audio = mcsr.audio_in_seconds(mcsr.get_wav_path(video_name), seconds=seconds)
+    if not len(audio):
+        return
+    uv = sssl('main').predict(video_name, 'numpy', audio)
+    pred = sssl('pred_store').PredStore.load(os.path.join(OUTPUT, 'SSSL', video_name), mmap_mode='r+')
+    pred.write_uv(seconds[0] * audio.shape[1], uv, FPS)
+    pred.data.flush()
+
+
+def fusion_shard(video_name, start, stop, options):
+    ''' fixation, ViNet and fusion maps of frames [start, stop) into the itti store '''
+    sssl('profiling').set_video(video_name)
+    pred = sssl('pred_store').PredStore.load(os.path.join(OUTPUT, 'SSSL', video_name))
+    if options['smoothed']:
+        import sssl_fixation
+        margin = options['window'] // 2
+        pred = sssl_fixation.smooth_store(pred.window(start - margin, stop + margin), options['window'], options['linear_u'])
+
+    chunk = options['chunk']
+    pipeline = Pipeline(options['maxsize'])
+    audio = pipeline.add(PredSource(pred))
+    audio = pipeline.add(FixationStage(video_name, chunk, options['blur_scale'], options['blur_method'], options['cfg'],
+                                       options['event_gate'], start=start, stop=stop), audio)
+    visual = pipeline.add(ViNetStage(video_name, chunk, options['vinet_args'], start=start, stop=stop))
+    fused = pipeline.add(FusionStage(options['weights'], chunk), audio, visual)
+    pipeline.add(StoreSink(os.path.join(OUTPUT, 'Fusion', video_name), 'itti'), fused)
+    pipeline.run()
+
+
+def n_frames_of(video_name):
+    # the pipeline fuses as many frames as both the fixation (mp4 duration) and the ViNet (jpg or mp4) streams have
+    va_odv = sssl('vaODV').vaODV(vid_path=os.path.join(INPUT, video_name), pred_path=None, odv_shape=ODV_SHAPE)
+    va_odv.get_odvInfo(video_name)
+    return min(va_odv.vid_info['duration'], len(frame_source(video_name)))
+
+
+def run_video(video_name, shards=None, workers=None, maxsize=4, chunk=16, smoothed=False, window=5, linear_u=False,
+              blur_scale=1, blur_method='auto', cfg='balanced_mobile_Audio', event_gate=True, weights=(0.6, 0.4),
+              vinet_args=None, fps=30, alpha=0.5):
+    import fusion
+    mcsr = sssl('mcsr')
+    FrameStore = sssl('frame_store').FrameStore
+    PredStore = sssl('pred_store').PredStore
+
+    workers = workers or os.cpu_count() or 1
+    parts = plan(n_frames_of(video_name), shards or workers)
+    options = dict(maxsize=maxsize, chunk=chunk, smoothed=smoothed, window=window, linear_u=linear_u,
+                   blur_scale=blur_scale, blur_method=blur_method, cfg=cfg, event_gate=event_gate,
+                   weights=tuple(weights), vinet_args=vinet_args)
+
+    fs, raw = mcsr.read_bformat(mcsr.get_wav_path(video_name), mmap=True)
+    n_seconds = int(mcsr.octave_round(raw.shape[0] / fs))
+    del raw
+    PredStore.create(os.path.join(OUTPUT, 'SSSL', video_name), n_seconds * fs, FPS)
+    # the last shard also takes the audio past the last video frame
+    seconds = [(start // FPS, stop // FPS) for start, stop in parts]
+    seconds[-1] = (seconds[-1][0], None)
+
+    fusion_dir = os.path.join(OUTPUT, 'Fusion', video_name)
+    itti = FrameStore.create(fusion_dir, 'itti', parts[-1][1], fusion.FUSION_SHAPE, fps=fps, stage='shards',
+                             video=video_name, weights=list(weights), shards=parts)
+
+    # spawn: the workers load torch models of their own
+    with ProcessPoolExecutor(workers, mp_context=multiprocessing.get_context('spawn')) as pool:
+        list(pool.map(saliency_shard, [video_name] * len(seconds), seconds))
+        list(pool.map(fusion_shard, [video_name] * len(parts), *zip(*parts), [options] * len(parts)))
+    itti.close()
+
+    pipeline = Pipeline(maxsize)
+    fused = pipeline.add(StoreSource(fusion_dir, 'itti', chunk))
+    out_path = os.path.join(OUTPUT, 'Final_Result', video_name, video_name + '.mp4')
+    pipeline.add(OverlayStage(video_name, out_path, fps, alpha), fused)
+    pipeline.run()
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(prog='python -m pipeline.shards')
+    parser.add_argument('--video_name', default='in_test2', type=str, help='video path')
+    parser.add_argument('--shards', default=None, type=int, help='time shards, default one per worker')
+    parser.add_argument('--workers', default=None, type=int, help='worker processes, default one per core')
+    parser.add_argument('--maxsize', default=4, type=int, help='chunks buffered between two stages')
+    parser.add_argument('--chunk', default=16, type=int, help='frames per chunk')
+    parser.add_argument('--smoothed', action='store_true', help='cluster the sssl_fixation smoothed predictions')
+    parser.add_argument('--window', default=5, type=int, help='frames in the moving-average window')
+    parser.add_argument('--linear_u', action='store_true', help='average 2dmu linearly instead of on the circle')
+    parser.add_argument('--blur_scale', default=1, type=int, help='blur fixation maps at 1/blur_scale resolution')
+    parser.add_argument('--blur_method', default='auto', choices=['auto', 'cv2', 'fft', 'iir'], help='gaussian blur implementation')
+    parser.add_argument('--cfg', default='balanced_mobile_Audio', type=str, help='hts cfg path')
+    parser.add_argument('--no_event_gate', action='store_true', help='generate fixations for every frame, not only HTS event frames')
+    parser.add_argument('--weights', default=[0.6, 0.4], type=float, nargs=2, metavar=('AUDIO', 'VISUAL'), help='fusion weights of the SSSL and ViNet maps')
+    parser.add_argument('--file_weight', default="/wiset/Localize/ViNet/saved_models/ViNet_DHF1K.pt", type=str)
+    parser.add_argument('--clip_size', default=32, type=int)
+    parser.add_argument('--batch_size', default=4, type=int, help='ViNet sliding-window clips per forward')
+    parser.add_argument('--stream', action='store_true', help='ViNet reuses the backbone activations of the previous clips')
+    parser.add_argument('--keyframe_stride', default=1, type=int, help='ViNet runs every keyframe_stride frames, the maps in between are rebuilt')
+    parser.add_argument('--interp', default='linear', choices=['linear', 'flow'], help='how the ViNet maps between keyframes are rebuilt')
+    parser.add_argument('--scene_thresh', default=None, type=float, help='also key the frames around a cut, mean absolute frame difference 0-255')
+    parser.add_argument('--decode_workers', default=2, type=int, help='ViNet frame decoding processes, 0 decodes in the model loop')
+    parser.add_argument('--no_draft', action='store_true', help='decode the ViNet jpgs at full scale before the resize')
+    parser.add_argument('--fps', default=30, type=int, help='output frame rate')
+    parser.add_argument('--alpha', default=0.5, type=float, help='weight of the video frame in the overlay blend')
+    return parser.parse_args()
+
+
+if __name__ == '__main__':
+    args = parse_args()
+    sssl('profiling').set_video(args.video_name)
+    run_video(args.video_name, shards=args.shards, workers=args.workers, maxsize=args.maxsize, chunk=args.chunk,
+              smoothed=args.smoothed, window=args.window, linear_u=args.linear_u, blur_scale=args.blur_scale,
+              blur_method=args.blur_method, cfg=args.cfg, event_gate=not args.no_event_gate, weights=args.weights,
+              vinet_args=dict(file_weight=args.file_weight, clip_size=args.clip_size, batch_size=args.batch_size,
+                              stream=args.stream, keyframe_stride=args.keyframe_stride, interp=args.interp,
+                              scene_thresh=args.scene_thresh, workers=args.decode_workers, no_draft=args.no_draft), fps=args.fps, alpha=args.alpha)
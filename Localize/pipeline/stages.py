@@ -0,0 +1,211 @@
+import os
+import argparse
+import numpy as np
+import cv2
+from tqdm import tqdm
+
+from .runner import Stage
+from .modules import sssl, vinet
+
+# Stages of sssl.sh, run in one process. Items are
+#   SaliencyStage / SmoothStage -> PredStore
+#   FixationStage / ViNetStage / FusionStage -> (first frame, (frames, H, W) uint8 maps)
+#   OverlayStage -> frame index of every frame sent to the encoder
+# With debug_dir set, a stage also writes its intermediates the way the
+# standalone script does. start/stop limit the fixation and ViNet stages to a
+# range of frames (see shards.py).
+
+FPS = 30
+INPUT = '/wiset/Input'
+ODV_SHAPE = [606, 1080, 3]
+
+VINET_ARGS = dict(file_weight='/wiset/Localize/ViNet/saved_models/ViNet_DHF1K.pt', nhead=4, num_encoder_layers=3,
+                  transformer_in_channel=32, decoder_upsample=1, num_decoder_layers=-1, num_hier=3, clip_size=32, batch_size=4,
+                  stream=False, keyframe_stride=1, interp='linear', scene_thresh=None, workers=2, no_draft=False)
+
+
+def frame_source(video_name):
+    # the frame_image jpgs when they were extracted, else the mp4 decoded by ffmpeg
+    return sssl('video_frames').video_source(video_name, INPUT)
+
+
+def frames_of(chunks):
+    # (f, maps) chunks -> (frame index, map) per frame
+    for f, maps in chunks:
+        for i, m in enumerate(maps):
+            yield f + i, m
+
+
+def aligned(audio, visual):
+    # (frame index, audio map, visual map) of two chunk streams over the same frames.
+    # The fixations stop at int(duration)*FPS frames, ViNet runs on every frame of
+    # the video: audio may end first, as fusion.n_frames takes the shorter of both.
+    audio, visual = frames_of(audio), frames_of(visual)
+    for fa, a in audio:
+        item = next(visual, None)
+        if item is None:
+            raise ValueError('fusion: the visual maps end before audio frame {}'.format(fa))
+        fv, v = item
+        if fa != fv:
+            raise ValueError('fusion: audio frame {} is paired with visual frame {}'.format(fa, fv))
+        yield fa, a, v
+    rest = next(visual, None)
+    if rest is not None:
+        print('[fusion] the audio maps end before frame {}, the visual maps from it on are dropped'.format(rest[0]), flush=True)
+
+
+def chunks_of(frames, chunk):
+    # (frame index, map...) per frame -> (first frame, stacked maps...) chunks
+    batch = []
+    for item in frames:
+        batch.append(item)
+        if len(batch) == chunk:
+            yield batch[0][0], [np.stack(x) for x in list(zip(*batch))[1:]]
+            batch = []
+    if batch:
+        yield batch[0][0], [np.stack(x) for x in list(zip(*batch))[1:]]
+
+
+class SaliencyStage(Stage):
+    ''' SSSL/scripts/main.py: mcsr saliency of the b-format audio as a PredStore '''
+    name = 'saliency'
+
+    def __init__(self, video_name, mcsr='numpy', debug_dir=None):
+        self.video_name, self.mcsr, self.debug_dir = video_name, mcsr, debug_dir
+
+    def __call__(self):
+        pred_store = sssl('pred_store')
+        uv = sssl('main').predict(self.video_name, self.mcsr)
+        pred = pred_store.PredStore.from_uv(uv, FPS)
+        if self.debug_dir is not None:
+            pred.save(self.debug_dir)
+        yield pred
+
+
+class SmoothStage(Stage):
+    ''' sssl_fixation.py: temporal moving average of the PredStore '''
+    name = 'smooth'
+
+    def __init__(self, window=5, linear_u=False, debug_dir=None):
+        self.window, self.linear_u, self.debug_dir = window, linear_u, debug_dir
+
+    def __call__(self, preds):
+        import sssl_fixation
+        for pred in preds:
+            smoothed = sssl_fixation.smooth_store(pred, self.window, self.linear_u)
+            if self.debug_dir is not None:
+                smoothed.save(self.debug_dir, name='_pred')
+            yield smoothed
+
+
+class FixationStage(Stage):
+    ''' fixmap2salmap.py (and the clsf.py event gate): uint8 SSSL saliency maps '''
+    name = 'fixation'
+
+    def __init__(self, video_name, chunk=16, blur_scale=1, blur_method='auto', cfg='balanced_mobile_Audio',
+                 event_gate=True, debug_dir=None, start=0, stop=None):
+        self.video_name, self.chunk = video_name, chunk
+        self.start, self.stop = start, stop
+        self.blur_scale, self.blur_method = blur_scale, blur_method
+        self.cfg, self.event_gate, self.debug_dir = cfg, event_gate, debug_dir
+
+    def __call__(self, preds):
+        vaODV = sssl('vaODV').vaODV
+        if self.debug_dir is not None:
+            # only the event frames get a png
+            fix_folder = sssl('vaODV').fixation_folder(self.debug_dir)
+        events = sssl('events').load_events(self.video_name, self.cfg) if self.event_gate else None
+
+        for pred in preds:
+            va_odv = vaODV(vid_path=os.path.join(INPUT, self.video_name), pred_path=self.debug_dir, odv_shape=ODV_SHAPE)
+            va_odv.get_odvInfo(self.video_name)
+            va_odv.load_preds([pred])
+
+            n_frames = va_odv.vid_info['duration'] if self.stop is None else self.stop
+            fixations = va_odv.iter_fixations(n_frames, self.chunk, self.blur_scale, self.blur_method, events, self.start)
+            for f, maps, idx in fixations:
+                if self.debug_dir is not None:
+                    for i in idx:
+                        cv2.imwrite(os.path.join(fix_folder, 'salmap_f_' + str(f + i) + '.png'), maps[i])
+                yield f, maps
+
+
+class ViNetStage(Stage):
+    ''' ViNet/scripts/generate_result.py: visual saliency maps resized to the fusion size '''
+    name = 'vinet'
+
+    def __init__(self, video_name, chunk=16, vinet_args=None, debug_dir=None, start=0, stop=None):
+        self.video_name, self.chunk, self.debug_dir = video_name, chunk, debug_dir
+        self.start, self.stop = start, stop
+        self.args = argparse.Namespace(**dict(VINET_ARGS, **(vinet_args or {})))
+
+    def __call__(self):
+        generate_result = vinet('generate_result')
+        import fusion
+
+        source = frame_source(self.video_name)
+        if len(source) < 2*self.args.clip_size-1:
+            raise ValueError('{}: more frames are needed'.format(self.video_name))
+
+        model = generate_result.load_model(self.args)
+        if self.debug_dir is not None:
+            os.makedirs(self.debug_dir, exist_ok=True)
+
+        def resized():
+            a = self.args
+            for i, smap in generate_result.iter_saliency(model, source, a.clip_size, self.start, self.stop, a.batch_size,
+                                                            a.stream, a.keyframe_stride, a.interp, a.scene_thresh,
+                                                            a.workers, not a.no_draft):
+                if self.debug_dir is not None:
+                    generate_result.img_write(smap, os.path.join(self.debug_dir, source.name(i)))
+                yield i, cv2.resize(smap, (fusion.FUSION_SHAPE[1], fusion.FUSION_SHAPE[0]))
+
+        for f, (maps,) in chunks_of(resized(), self.chunk):
+            yield f, maps
+
+
+class FusionStage(Stage):
+    ''' fusion.py: weighted Itti fusion of the SSSL and ViNet maps '''
+    name = 'fusion'
+
+    def __init__(self, weights=(0.6, 0.4), chunk=16, debug_dir=None):
+        self.weights, self.chunk, self.debug_dir = weights, chunk, debug_dir
+
+    def __call__(self, audio, visual):
+        import fusion
+        if self.debug_dir is not None:
+            os.makedirs(self.debug_dir, exist_ok=True)
+
+        for f, (pred_audio_saliency, pred_vinet) in chunks_of(aligned(audio, visual), self.chunk):
+            maps = fusion.to_uint8(fusion.fuse_maps(pred_audio_saliency, pred_vinet, self.weights))
+            if self.debug_dir is not None:
+                for i, m in enumerate(maps):
+                    cv2.imwrite(self.debug_dir + '/{:04d}.png'.format(f + i), m)
+            yield f, maps
+
+
+class OverlayStage(Stage):
+    ''' overlay.py: blended frames piped to ffmpeg with the source audio '''
+    name = 'overlay'
+
+    def __init__(self, video_name, out_path, fps=FPS, alpha=0.5, debug_dir=None):
+        self.video_name, self.out_path, self.fps, self.debug_dir = video_name, out_path, fps, debug_dir
+        self.alpha = alpha
+
+    def __call__(self, fused):
+        import overlay
+        video_frames = sssl('video_frames')
+        source = frame_source(self.video_name)
+        audio_path = os.path.join(INPUT, self.video_name, self.video_name + '.mp4')
+        os.makedirs(os.path.dirname(self.out_path), exist_ok=True)
+        if self.debug_dir is not None:
+            os.makedirs(self.debug_dir, exist_ok=True)
+
+        frame_at = video_frames.Cursor(source.read(0, None, overlay.OVERLAY_SIZE))
+        with overlay.VideoWriter(self.out_path, audio_path, fps=self.fps) as writer:
+            for idx, fusion_img in tqdm(frames_of(fused), total=len(source), desc='pipeline:'):
+                blended = overlay.blend(frame_at(idx), fusion_img, self.alpha)
+                writer.write(blended)
+                if self.debug_dir is not None:
+                    cv2.imwrite(self.debug_dir + '/{}.jpg'.format(idx), blended)
+                yield idx
@@ -1,39 +1,69 @@
 # -*- coding: utf-8 -*-
+# every step runs through stage_cache.py: a step whose inputs, code and arguments did not change
+# since a cached run is skipped and its outputs are restored from /wiset/Cache (NO_CACHE=1 runs everything)
+# a batch of videos with concurrent stages: cd /wiset/Localize && python -m pipeline.scheduler --videos v1 v2 ... (also runs infer.sh)
+# one long video in parallel time shards: cd /wiset/Localize && python -m pipeline.shards --video_name v --workers N
+# timing report: WISET_PROFILE=/wiset/Profile bash sssl.sh, then python /wiset/Localize/SSSL/scripts/profiling.py /wiset/Profile
+L=/wiset/Localize
+if [ "${NO_CACHE:-0}" = "1" ]; then FORCE=--force; fi
+CACHE="python ${L}/stage_cache.py ${FORCE}"
+
 for video in "in_test2"
 do
+    export WISET_PROFILE_VIDEO=${video}
     mkdir /wiset/Output/SSSL/${video}
-    mkdir /wiset/Output/SSSL/${video}/fixations 
-        
-    ffmpeg -i /wiset/Input/${video}/${video}.360  -map 0:6 /wiset/Input/${video}/${video}.wav
-        
-    octave -W /wiset/Localize/SSSL/mcsr/Main.m ${video}   # saliency.mat in /wiset/Output/SSSL/video_name
-    python /wiset/Localize/SSSL/scripts/main.py --video_name ${video}   # pred.csv in /wiset/Output/SSSL/video_name
+    mkdir /wiset/Output/SSSL/${video}/fixations
+    IN=/wiset/Input/${video}
+    SSSL=/wiset/Output/SSSL/${video}
+
+    ${CACHE} --stage wav --inputs ${IN}/${video}.360 --outputs ${IN}/${video}.wav -- \
+        ffmpeg -i ${IN}/${video}.360  -map 0:6 ${IN}/${video}.wav
+
+    if [ "${PIPELINE:-1}" = "1" ]; then
+        # every stage below in one process, --debug also writes the intermediate images
+        # the pipeline is cached as a whole, PIPELINE=0 caches every script on its own
+        ${CACHE} --stage pipeline --inputs ${IN}/${video}.wav ${IN}/${video}.mp4 ${IN}/frame_image /wiset/hts/Result/balanced_mobile_Audio/Final_${video}.csv \
+            --code ${L}/pipeline ${L}/SSSL/scripts ${L}/ViNet/scripts ${L}/sssl_fixation.py ${L}/fusion.py ${L}/itti.py ${L}/overlay.py ${L}/ViNet/saved_models/ViNet_DHF1K.pt \
+            --outputs /wiset/Output/Final_Result/${video}/${video}.mp4 -- \
+            bash -c "cd ${L} && python -m pipeline --video_name ${video}"   # result video in /wiset/Output/Final_Result/video_name
+        continue
+    fi
 
-    python /wiset/Localize/sssl_fixation.py --video_name ${video}   # noise smoothing
+    # octave -W /wiset/Localize/SSSL/mcsr/Main.m ${video}   # saliency.mat, only needed with --mcsr octave
+    ${CACHE} --stage main --inputs ${IN}/${video}.wav --code ${L}/SSSL/scripts/main.py ${L}/SSSL/scripts/mcsr.py ${L}/SSSL/scripts/utils.py ${L}/SSSL/scripts/pred_store.py \
+        --outputs ${SSSL}/pred.npy ${SSSL}/pred_frames.npy -- \
+        python ${L}/SSSL/scripts/main.py --video_name ${video}   # mcsr saliency + pred.csv in /wiset/Output/SSSL/video_name
 
-    python /wiset/Localize/clsf.py --video_name ${video}    # event sound classification
+    ${CACHE} --stage sssl_fixation --inputs ${SSSL}/pred.npy ${SSSL}/pred_frames.npy --code ${L}/sssl_fixation.py ${L}/SSSL/scripts/pred_store.py \
+        --outputs ${SSSL}/_pred.npy ${SSSL}/_pred_frames.npy -- \
+        python ${L}/sssl_fixation.py --video_name ${video}   # noise smoothing
 
-    python /wiset/Localize/SSSL/scripts/fixmap2salmap.py --video_name ${video}   # fixation map in /wiset/Output/SSSL/video_name/fixations
+    # python /wiset/Localize/clsf.py --video_name ${video}    # event sound classification, now gated inside fixmap2salmap
+
+    ${CACHE} --stage fixmap2salmap --inputs ${SSSL}/pred.npy ${SSSL}/pred_frames.npy ${IN}/${video}.mp4 /wiset/hts/Result/balanced_mobile_Audio/Final_${video}.csv \
+        --code ${L}/SSSL/scripts --outputs ${SSSL}/fixations.npy ${SSSL}/fixations.json -- \
+        python ${L}/SSSL/scripts/fixmap2salmap.py --video_name ${video} --frame_store   # event gated fixation maps in /wiset/Output/SSSL/video_name/fixations.npy
 
     # ******************************************
 
-    mkdir /wiset/Output/ViNet/${video}    
-    
-    python /wiset/Localize/ViNet/scripts/generate_result.py --video_name ${video}   # ViNet map in /wiset/Output/ViNet/video_name
+    mkdir /wiset/Output/ViNet/${video}
+
+    # frames from ${IN}/frame_image when extracted, else decoded from ${IN}/${video}.mp4
+    ${CACHE} --stage generate_result --inputs ${IN}/frame_image ${IN}/${video}.mp4 --code ${L}/ViNet/scripts ${L}/SSSL/scripts/frame_store.py ${L}/SSSL/scripts/video_frames.py ${L}/ViNet/saved_models/ViNet_DHF1K.pt \
+        --outputs /wiset/Output/ViNet/${video}/saliency.npy /wiset/Output/ViNet/${video}/saliency.json -- \
+        python ${L}/ViNet/scripts/generate_result.py --video_name ${video} --frame_store   # ViNet maps in /wiset/Output/ViNet/video_name/saliency.npy
 
     mkdir /wiset/Output/Fusion/${video}
 
-    python /wiset/Localize/fusion.py --video_name ${video}   # fusion img in /wiset/Output/Fusion/video_name
+    ${CACHE} --stage fusion --inputs ${SSSL}/fixations.npy ${SSSL}/fixations.json /wiset/Output/ViNet/${video}/saliency.npy /wiset/Output/ViNet/${video}/saliency.json \
+        --code ${L}/fusion.py ${L}/itti.py ${L}/SSSL/scripts/frame_store.py \
+        --outputs /wiset/Output/Fusion/${video}/itti.npy /wiset/Output/Fusion/${video}/itti.json -- \
+        python ${L}/fusion.py --video_name ${video} --frame_store   # fusion maps in /wiset/Output/Fusion/video_name/itti.npy
 
     mkdir /wiset/Output/Final_Result/${video}
-    mkdir /wiset/Output/Final_Result/${video}/Overlay
-    
-    python /wiset/Localize/overlay.py --video_name ${video}   # overlay img in /wiset/Output/Final_Result/video_name/Overlay
-    
-    ffmpeg -f image2 -r 30 -i /wiset/Output/Final_Result/${video}/Overlay/%d.jpg -vcodec mpeg4 ./tmp.mp4    # overlay img to video
-    ffmpeg -i /wiset/Input/${video}/${video}.mp4 -vn ./tmp.m4a    # add audio
-    ffmpeg -i ./tmp.mp4 -i ./tmp.m4a -c copy /wiset/Output/Final_Result/${video}/${video}.mp4 #-> result video in /wiset/Output/Final_Result/video_name  
-        
-    rm ./tmp.mp4 ./tmp.m4a
+
+    ${CACHE} --stage overlay --inputs /wiset/Output/Fusion/${video}/itti.npy /wiset/Output/Fusion/${video}/itti.json ${IN}/frame_image ${IN}/${video}.mp4 \
+        --code ${L}/overlay.py ${L}/SSSL/scripts/frame_store.py ${L}/SSSL/scripts/video_frames.py --outputs /wiset/Output/Final_Result/${video}/${video}.mp4 -- \
+        python ${L}/overlay.py --video_name ${video}   # overlay frames piped to ffmpeg with the source audio -> result video in /wiset/Output/Final_Result/video_name
 
 done
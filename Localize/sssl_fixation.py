@@ -11,50 +11,88 @@ import imageio
 import cv2
 from tqdm import tqdm
 import natsort
+from scipy.ndimage import correlate1d
 
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), 'SSSL', 'scripts'))
+from pred_store import PredStore
+from profiling import profile, set_video
 
 def parse_args():
     parser = argparse.ArgumentParser()
     parser.add_argument('--video_name', default='out_test1', type=str, help='video path')
+    parser.add_argument('--window', default=5, type=int, help='frames in the moving-average window')
+    parser.add_argument('--linear_u', action='store_true', help='average 2dmu linearly instead of on the circle')
     return parser.parse_args()
 
 
-def run(args):
-    predcsv = pd.read_csv(os.path.join('/wiset/Output/SSSL', args.video_name, 'pred.csv'))
-    
-    for f in tqdm(range(predcsv.shape[0]//1600)):
-        mean1 = predcsv['2dmu'][(f*1600) : (f*1600)+1600].mean()
-        mean2 = predcsv['2dmv'][(f*1600) : (f*1600)+1600].mean()
-        
-        # Frame normalization
-        # First frame
-        if f == 0:
-            mean1 = (mean1 + predcsv['2dmu'][(f*1600)+1600 : (f*1600)+3200].mean() + predcsv['2dmu'][(f*1600)+3200 : (f*1600)+4800].mean())/3
-            mean2 = (mean2 + predcsv['2dmv'][(f*1600)+1600 : (f*1600)+3200].mean() + predcsv['2dmv'][(f*1600)+3200 : (f*1600)+4800].mean())/3
-        # Second frame
-        elif f == 1:
-            mean1 = (predcsv['2dmu'][(f*1600)-1600 : (f*1600)].mean() + mean1 + predcsv['2dmu'][(f*1600)+1600 : (f*1600)+3200].mean() + predcsv['2dmu'][(f*1600)+3200 : (f*1600)+4800].mean())/4
-            mean2 = (predcsv['2dmv'][(f*1600)-1600 : (f*1600)].mean() + mean2 + predcsv['2dmv'][(f*1600)+1600 : (f*1600)+3200].mean() + predcsv['2dmv'][(f*1600)+3200 : (f*1600)+4800].mean())/4
-        # Last frame
-        elif f == predcsv.shape[0]//1600 - 1:
-            mean1 = (predcsv['2dmu'][(f*1600)-3200 : (f*1600)-1600].mean() + predcsv['2dmu'][(f*1600)-1600 : (f*1600)].mean() + mean1)/3
-            mean2 = (predcsv['2dmv'][(f*1600)-3200  :(f*1600)-1600].mean() + predcsv['2dmv'][(f*1600)-1600  :(f*1600)].mean() + mean2)/3
-        # Last-1 frame
-        elif f == predcsv.shape[0]//1600 - 2:
-            mean1 = (predcsv['2dmu'][(f*1600)-3200 : (f*1600)-1600].mean() + predcsv['2dmu'][(f*1600)-1600 : (f*1600)].mean() + mean1 + predcsv['2dmu'][(f*1600)+1600 : (f*1600)+3200].mean())/4
-            mean2 = (predcsv['2dmv'][(f*1600)-3200  :(f*1600)-1600].mean() + predcsv['2dmv'][(f*1600)-1600  :(f*1600)].mean() + mean2 + predcsv['2dmv'][(f*1600)+1600 : (f*1600)+3200].mean())/4
-        # else
+SAMPLES_PER_FRAME = 48000 // 30
+
+
+def window_mean(frame_means, kernel):
+    # centred weighted mean over the frames inside the window, frames past the
+    # ends (and NaN frames) are left out of both the sum and the weights
+    valid = np.isfinite(frame_means)
+    k = np.asarray(kernel, dtype=np.float64)
+    num = correlate1d(np.where(valid, frame_means, 0), k, mode='constant')
+    den = correlate1d(valid.astype(np.float64), k, mode='constant')
+    with np.errstate(invalid='ignore', divide='ignore'):
+        return num / den
+
+
+def smooth(values, kernel, samples_per_frame=SAMPLES_PER_FRAME, circular=False):
+    # per-frame means of (frames, samples_per_frame) blocks, smoothed over
+    # time and broadcast back to every sample of the frame
+    values = np.asarray(values, dtype=np.float64)
+    n_frames = values.shape[0] // samples_per_frame
+    frames = values[:n_frames * samples_per_frame].reshape(n_frames, samples_per_frame)
+
+    with np.errstate(invalid='ignore'):
+        if circular:
+            # 2dmu is an azimuth in [0, 1), average it as a unit vector so the seam needs no special case
+            angle = 2 * np.pi * frames
+            c = window_mean(np.nanmean(np.cos(angle), axis=1), kernel)
+            s = window_mean(np.nanmean(np.sin(angle), axis=1), kernel)
+            smoothed = np.mod(np.arctan2(s, c) / (2 * np.pi), 1)
+            smoothed[smoothed >= 1] = 0
         else:
-            mean1 = (predcsv['2dmu'][(f*1600)-3200 : (f*1600)-1600].mean() + predcsv['2dmu'][(f*1600)-1600 : (f*1600)].mean() + mean1 + predcsv['2dmu'][(f*1600)+1600 : (f*1600)+3200].mean() + predcsv['2dmu'][(f*1600)+3200 : (f*1600)+4800].mean())/5
-            mean2 = (predcsv['2dmv'][(f*1600)-3200 : (f*1600)-1600].mean() + predcsv['2dmv'][(f*1600)-1600 : (f*1600)].mean() + mean1 + predcsv['2dmv'][(f*1600)+1600 : (f*1600)+3200].mean() + predcsv['2dmv'][(f*1600)+3200 : (f*1600)+4800].mean())/5
+            smoothed = window_mean(np.nanmean(frames, axis=1), kernel)
+
+    out = values.copy()
+    out[:n_frames * samples_per_frame] = np.repeat(smoothed, samples_per_frame)
+    return out
 
-        # print(f, mean1, mean2)
-        # put value in each sound frame
-        for sf in range((f*1600), (f*1600)+1600):
-            predcsv['2dmu'][sf] = mean1
-            predcsv['2dmv'][sf] = mean2
 
-    predcsv.to_csv(os.path.join('/wiset/Output/SSSL', args.video_name, '_pred.csv'), sep=',', na_rep='NaN', index=False)
+def smooth_pred(predcsv, window=5, linear_u=False):
+    # Frame normalization: moving average over the neighbouring frames
+    kernel = np.ones(window)
+    predcsv['2dmu'] = smooth(predcsv['2dmu'].to_numpy(), kernel, circular=not linear_u)
+    predcsv['2dmv'] = smooth(predcsv['2dmv'].to_numpy(), kernel)
+    return predcsv
+
+
+def smooth_store(pred, window=5, linear_u=False):
+    predcsv = smooth_pred(pred.to_dataframe(), window, linear_u)
+    return PredStore(predcsv.to_numpy(dtype=np.float32), pred.offsets)
+
+
+def run(args):
+    pred_path = os.path.join('/wiset/Output/SSSL', args.video_name)
+    set_video(args.video_name)
+    with profile('sssl_fixation'):
+        if PredStore.exists(pred_path):
+            with profile('load'):
+                pred = PredStore.load(pred_path)
+            with profile('smooth', frames=pred.n_frames):
+                smoothed = smooth_store(pred, args.window, args.linear_u)
+            with profile('write'):
+                smoothed.save(pred_path, name='_pred')
+        else:
+            with profile('csv_parse'):
+                predcsv = pd.read_csv(os.path.join(pred_path, 'pred.csv'))
+            with profile('smooth'):
+                predcsv = smooth_pred(predcsv, args.window, args.linear_u)
+            with profile('write'):
+                predcsv.to_csv(os.path.join(pred_path, '_pred.csv'), sep=',', na_rep='NaN', index=False)
 
 
 
@@ -0,0 +1,161 @@
+import os
+import sys
+import json
+import shutil
+import hashlib
+import argparse
+import subprocess
+
+# Content-keyed cache for the stages of sssl.sh and hts/Infer_scripts/infer.sh.
+#
+#   python stage_cache.py --stage fusion --inputs <files/folders> --code <scripts> \
+#       --param KEY=VALUE --outputs <files/folders> -- <command>
+#
+# The fingerprint of a stage is the hash of its command line, the content of
+# its code files, its --param values and its inputs (content hash for files up
+# to HASH_LIMIT bytes, size + mtime above, e.g. the .360). After a run the
+# outputs are copied to CACHE/<stage>/<fingerprint>; when a later run has the
+# same fingerprint the command is skipped and the outputs are copied back (only
+# those that differ from the cached ones). Outputs of upstream stages are
+# inputs of downstream ones, so changing the fusion weights re-runs fusion and
+# overlay only.
+
+CACHE = '/wiset/Cache'
+HASH_LIMIT = 64 << 20
+BLOCK = 1 << 20
+
+
+def parse_args(argv):
+    if '--' not in argv:
+        raise SystemExit('usage: stage_cache.py --stage NAME [options] -- command ...')
+    split = argv.index('--')
+    parser = argparse.ArgumentParser(prog='stage_cache.py')
+    parser.add_argument('--stage', required=True, type=str, help='stage name, one cache folder per stage')
+    parser.add_argument('--inputs', default=[], nargs='*', help='files or folders the stage reads')
+    parser.add_argument('--code', default=[], nargs='*', help='scripts/modules whose content versions the stage')
+    parser.add_argument('--param', default=[], action='append', help='KEY=VALUE not on the command line, e.g. a config value')
+    parser.add_argument('--outputs', default=[], nargs='*', help='files or folders the stage writes')
+    parser.add_argument('--cache', default=CACHE, type=str, help='cache root')
+    parser.add_argument('--force', action='store_true', help='run the stage even on a cache hit')
+    args = parser.parse_args(argv[:split])
+    args.cmd = argv[split + 1:]
+    if not args.cmd:
+        parser.error('no command after --')
+    return args
+
+
+def file_signature(path):
+    st = os.stat(path)
+    if st.st_size > HASH_LIMIT:
+        return 'size:{}:mtime:{}'.format(st.st_size, st.st_mtime_ns)
+    h = hashlib.sha1()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(BLOCK), b''):
+            h.update(block)
+    return 'sha1:' + h.hexdigest()
+
+
+def signature(path):
+    ''' signature of a file, or of every file below a folder by relative path (hidden files and bytecode skipped) '''
+    if os.path.isfile(path):
+        return file_signature(path)
+    if not os.path.isdir(path):
+        return 'missing'
+    files = {}
+    for root, dirs, names in os.walk(path):
+        dirs[:] = sorted(d for d in dirs if not d.startswith('.') and d != '__pycache__')
+        for name in sorted(names):
+            if name.startswith('.') or name.endswith('.pyc'):
+                continue
+            p = os.path.join(root, name)
+            files[os.path.relpath(p, path)] = file_signature(p)
+    return 'dir:' + hashlib.sha1(json.dumps(files, sort_keys=True).encode()).hexdigest()
+
+
+def fingerprint(stage, cmd, inputs=(), code=(), params=()):
+    ''' (fingerprint, description) of one stage run '''
+    desc = {'stage': stage, 'cmd': list(cmd),
+            'inputs': {os.path.abspath(p): signature(p) for p in inputs},
+            'code': {os.path.abspath(p): signature(p) for p in code},
+            'params': sorted(params)}
+    key = hashlib.sha1(json.dumps(desc, sort_keys=True).encode()).hexdigest()
+    return key, desc
+
+
+def remove(path):
+    if os.path.isdir(path) and not os.path.islink(path):
+        shutil.rmtree(path)
+    elif os.path.lexists(path):
+        os.remove(path)
+
+
+def copy(src, dst):
+    # copy2 keeps mtimes, so restored outputs sign the same as the cached ones
+    remove(dst)
+    os.makedirs(os.path.dirname(os.path.abspath(dst)), exist_ok=True)
+    if os.path.isdir(src):
+        shutil.copytree(src, dst)
+    else:
+        shutil.copy2(src, dst)
+
+
+def store(entry, desc, outputs):
+    ''' copy outputs into the cache entry, written to a temporary folder first so a partial entry is never hit '''
+    tmp = entry + '.tmp{}'.format(os.getpid())
+    remove(tmp)
+    os.makedirs(tmp)
+    stored = []
+    for i, path in enumerate(outputs):
+        if not os.path.exists(path):
+            raise FileNotFoundError('stage {} did not write {}'.format(desc['stage'], path))
+        name = os.path.join(str(i), os.path.basename(os.path.normpath(path)))
+        copy(path, os.path.join(tmp, name))
+        stored.append({'path': os.path.abspath(path), 'name': name, 'signature': signature(path)})
+
+    with open(os.path.join(tmp, 'manifest.json'), 'w') as f:
+        json.dump(dict(desc, outputs=stored), f, indent=1)
+    remove(entry)
+    os.rename(tmp, entry)
+
+
+def restore(entry, outputs):
+    ''' copy the cached outputs back, False when the entry does not hold all of them '''
+    manifest_path = os.path.join(entry, 'manifest.json')
+    if not os.path.exists(manifest_path):
+        return False
+    with open(manifest_path) as f:
+        stored = {o['path']: o for o in json.load(f)['outputs']}
+
+    outputs = [os.path.abspath(p) for p in outputs]
+    if any(p not in stored for p in outputs):
+        return False
+    for path in outputs:
+        if signature(path) != stored[path]['signature']:
+            copy(os.path.join(entry, stored[path]['name']), path)
+    return True
+
+
+def run(stage, cmd, inputs=(), code=(), params=(), outputs=(), cache=CACHE, force=False, env=None):
+    ''' run cmd (with env, None inherits this process's) unless a cached run has the same fingerprint, True on a cache hit '''
+    key, desc = fingerprint(stage, cmd, inputs, code, params)
+    entry = os.path.join(cache, stage, key)
+
+    if not force and restore(entry, outputs):
+        print('[stage_cache] {}: hit {}, skipped'.format(stage, key[:12]))
+        return True
+
+    print('[stage_cache] {}: miss {}, running'.format(stage, key[:12]), flush=True)
+    # stale outputs would be appended to or mixed with the new ones
+    for path in outputs:
+        remove(path)
+    subprocess.run(cmd, check=True, env=env)
+    store(entry, desc, outputs)
+    return False
+
+
+if __name__ == '__main__':
+    args = parse_args(sys.argv[1:])
+    try:
+        run(args.stage, args.cmd, args.inputs, args.code, args.param, args.outputs, args.cache, args.force)
+    except subprocess.CalledProcessError as e:
+        sys.exit(e.returncode)
@@ -25,6 +25,14 @@ from torch.utils.data.distributed import DistributedSampler
 from utils import create_folder, dump_config, process_idc, prepprocess_audio, init_hier_head
 
 import config
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..', 'Localize', 'SSSL', 'scripts'))
+try:
+    from profiling import profile
+except ImportError:
+    # profiling (opt-in with WISET_PROFILE) comes from the Localize tree, run without it
+    from contextlib import nullcontext
+    def profile(name, frames=0):
+        return nullcontext()
 from sed_model import SEDWrapper, Ensemble_SEDWrapper
 # from models import Cnn14_DecisionLevelMax
 from data_generator import SEDDataset, DESED_Dataset, ESC_Dataset, SCV2_Dataset
@@ -248,7 +256,8 @@ def test():
         ckpt["state_dict"].pop("sed_model.head.weight")
         ckpt["state_dict"].pop("sed_model.head.bias")
         model.load_state_dict(ckpt["state_dict"], strict=False)
-    trainer.test(model, datamodule=audioset_data)
+    with profile('hts/test', frames=len(eval_dataset)):
+        trainer.test(model, datamodule=audioset_data)
 
     
 
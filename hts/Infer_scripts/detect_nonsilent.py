@@ -5,17 +5,37 @@ import soundfile as sf
 import csv
 import argparse
 import os 
+import sys
 from pydub import AudioSegment, silence
 
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..', 'Localize', 'SSSL', 'scripts'))
+try:
+    from profiling import profile, set_video
+except ImportError:
+    # profiling (opt-in with WISET_PROFILE) comes from the Localize tree, run without it
+    from contextlib import nullcontext
+    def profile(name, frames=0):
+        return nullcontext()
+    def set_video(video_name):
+        pass
+
 def parse_args():
     parser = argparse.ArgumentParser()
     parser.add_argument('--video_name', type=str, help='video_name')
+    parser.add_argument('--silence_thresh', default=None, type=int, help='dBFS, default -40 for in_* videos and -32 otherwise')
+    parser.add_argument('--min_silence_len', default=450, type=int, help='ms')
     return parser.parse_args()
 
 
-def pydub_seg(file_name, video_name):
+def default_thresh(video_name):
+    if video_name[0] == "i":
+        return -40
+    return -32 #out_test2, -27 for out_tests1
+
 
-    with open("/wiset/hts/Result/"+video_name+".csv") as f:
+def pydub_seg(file_name, video_name, silence_thresh, min_silence_len=450):
+
+    with profile('csv_parse'), open("/wiset/hts/Result/"+video_name+".csv") as f:
         reader = csv.reader(f)
         data = list(reader)
    
@@ -23,13 +43,11 @@ def pydub_seg(file_name, video_name):
     wr = csv.writer(wf)
     
     
-    myaudio = AudioSegment.from_wav("/wiset/hts/Data/"+file_name)
+    with profile('decode', frames=1):
+        myaudio = AudioSegment.from_wav("/wiset/hts/Data/"+file_name)
 
-    if video_name[0] == "i":
-        nonsilence = silence.detect_nonsilent(myaudio, min_silence_len=450, silence_thresh=-40)
-    else : 
-        nonsilence = silence.detect_nonsilent(myaudio, min_silence_len=450, silence_thresh=-32) #out_test2
-        #nonsilence = silence.detect_nonsilent(myaudio, min_silence_len=450, silence_thresh=-27) #out_tests1
+    with profile('silence', frames=1):
+        nonsilence = silence.detect_nonsilent(myaudio, min_silence_len=min_silence_len, silence_thresh=silence_thresh)
         
     for start, stop in nonsilence:
         file_start_time = int(file_name[-8:-4])
@@ -45,8 +63,11 @@ def pydub_seg(file_name, video_name):
 
 if __name__ == "__main__":     
     args = parse_args()
+    silence_thresh = default_thresh(args.video_name) if args.silence_thresh is None else args.silence_thresh
     
-    for file in sorted(os.listdir("/wiset/hts/Data/")):
-        if file[0] == "e": continue
-        pydub_seg(file, args.video_name)
+    set_video(args.video_name)
+    with profile('detect_nonsilent'):
+        for file in sorted(os.listdir("/wiset/hts/Data/")):
+            if file[0] == "e": continue
+            pydub_seg(file, args.video_name, silence_thresh, args.min_silence_len)
 
@@ -6,6 +6,18 @@ import librosa
 from natsort import natsorted
 from tqdm import tqdm
 import argparse
+import sys
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..', 'Localize', 'SSSL', 'scripts'))
+try:
+    from profiling import profile, set_video
+except ImportError:
+    # profiling (opt-in with WISET_PROFILE) comes from the Localize tree, run without it
+    from contextlib import nullcontext
+    def profile(name, frames=0):
+        return nullcontext()
+    def set_video(video_name):
+        pass
 
 
 def make_esc50(audio_dir):
@@ -19,7 +31,8 @@ def make_esc50(audio_dir):
     for file in tqdm(audio_files):
         if file[0]=='.': continue
 
-        y, sr = librosa.load(os.path.join(audio_dir, file), sr = None)
+        with profile('decode', frames=1):
+            y, sr = librosa.load(os.path.join(audio_dir, file), sr = None)
         
         output_dict[int(fold)-1].append(
             {
@@ -29,7 +42,8 @@ def make_esc50(audio_dir):
             }
         )
 
-    np.save(os.path.join(dataset_path,"esc-50-data.npy"), output_dict)
+    with profile('write'):
+        np.save(os.path.join(dataset_path,"esc-50-data.npy"), output_dict)
 
 if __name__ == '__main__':
     dataset_path = "/wiset/hts/Data/"
@@ -39,5 +53,7 @@ if __name__ == '__main__':
     
     args = parser.parse_args()   
     
-    make_esc50(dataset_path)
+    set_video(args.video_name)
+    with profile('esc50'):
+        make_esc50(dataset_path)
     
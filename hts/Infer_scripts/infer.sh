@@ -1,23 +1,38 @@
+# every step runs through stage_cache.py, see /wiset/Localize/sssl.sh (NO_CACHE=1 runs everything)
+# a batch of videos with concurrent stages: cd /wiset/Localize && python -m pipeline.scheduler --videos v1 v2 ...
+# timing report: WISET_PROFILE=/wiset/Profile bash infer.sh, then python /wiset/Localize/SSSL/scripts/profiling.py /wiset/Profile
+HTS=/wiset/hts/HTS-Audio-Transformer
+if [ "${NO_CACHE:-0}" = "1" ]; then FORCE=--force; fi
+CACHE="python /wiset/Localize/stage_cache.py ${FORCE}"
+
 for video in 'in_test1'
 do
+    export WISET_PROFILE_VIDEO=${video}
     mkdir /wiset/hts/Data/
     mkdir /wiset/hts/Result/
-    
+
     #1 sec Segments
-    ffmpeg -i /wiset/Input/${video}/${video}.360  -map 0:6 /wiset/Input/${video}/${video}.wav
-    ffmpeg -i /wiset/Input/${video}/${video}.wav -f segment -segment_time 1 -c copy /wiset/hts/Data/${video}_%04d.wav
-    
+    ${CACHE} --stage wav --inputs /wiset/Input/${video}/${video}.360 --outputs /wiset/Input/${video}/${video}.wav -- \
+        ffmpeg -i /wiset/Input/${video}/${video}.360  -map 0:6 /wiset/Input/${video}/${video}.wav
+    ${CACHE} --stage segments --inputs /wiset/Input/${video}/${video}.wav --outputs /wiset/hts/Data -- \
+        bash -c "mkdir -p /wiset/hts/Data && ffmpeg -i /wiset/Input/${video}/${video}.wav -f segment -segment_time 1 -c copy /wiset/hts/Data/${video}_%04d.wav"
+
     #ESC-50 format
-    python ./esc50.py --video_name ${video}
-    
+    ${CACHE} --stage esc50 --inputs /wiset/hts/Data --code ./esc50.py --outputs /wiset/hts/Data/esc-50-data.npy -- \
+        python ./esc50.py --video_name ${video}
+
     #config.py에 eval_dataset_path 확인 !
-    python ../HTS-Audio-Transformer/main.py test
-    
+    ${CACHE} --stage hts --inputs /wiset/hts/Data/esc-50-data.npy \
+        --code ${HTS}/main.py ${HTS}/config.py ${HTS}/sed_model.py ${HTS}/data_generator.py ${HTS}/utils.py ${HTS}/model \
+        --outputs /wiset/hts/Result/${video}.csv -- \
+        python ../HTS-Audio-Transformer/main.py test
+
     #nonsilent detection
-    python ./detect_nonsilent.py --video_name ${video}
-    
-    
+    ${CACHE} --stage detect_nonsilent --inputs /wiset/hts/Result/${video}.csv /wiset/hts/Data --code ./detect_nonsilent.py \
+        --outputs /wiset/hts/Result/Final_${video}.csv -- \
+        python ./detect_nonsilent.py --video_name ${video}   # --silence_thresh -40 --min_silence_len 450
+
+
     rm -rf /wiset/hts/Data/
 
 done
-    
\ No newline at end of file